@@ -0,0 +1,25 @@
+"""
+بناء نوى Numba مسبقاً (AOT) كامتداد مترجم models/trader_kernels
+حتى لا يدفع الخادم كلفة الترجمة عند التشغيل
+
+الاستخدام: python src/build_aot.py
+"""
+
+import os
+import sys
+# نفس مسار الاستيراد المستخدم في main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from numba.pycc import CC
+from src.models.trading_engine import _donchian_loop
+
+cc = CC('trader_kernels')
+cc.output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+# (الأسعار، السعر الحالي، نسبة العائد للمخاطرة) -> (رمز الإشارة، الدخول، الوقف، الهدف، الثقة)
+cc.export('donchian', 'Tuple((i8, f8, f8, f8, f8))(f8[:], f8, f8)')(_donchian_loop)
+
+
+if __name__ == '__main__':
+    cc.compile()
+    print(f"تم بناء {cc.name} في {cc.output_dir}")
@@ -3,9 +3,12 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask, send_from_directory, jsonify
+from werkzeug.exceptions import HTTPException
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from src.models.user import db
+from src.models.auth import AuthManager
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.vault import vault_bp
@@ -13,9 +16,66 @@ from src.routes.trading import trading_bp
 from src.routes.ai_assistant import ai_bp
 from src.routes.voice import voice_bp
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """مزود JSON يستخدم orjson لترميز الردود مع الإبقاء على صيغ Flask الافتراضية"""
+    
+    # التواريخ وفئات البيانات تمر إلى default حتى تبقى بنفس صيغة Flask،
+    # وقيم ومصفوفات numpy من محرك التداول والتقارير تُرمّز مباشرة
+    _OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS) if ORJSON_AVAILABLE else 0
+    
+    @staticmethod
+    def _orjson_default(o):
+        # orjson لا يرمّز الفئات الفرعية من float (مثل numpy.float64)
+        if isinstance(o, float):
+            return float(o)
+        return DefaultJSONProvider.default(o)
+    
+    def dumps(self, obj, **kwargs):
+        options = self._OPTIONS
+        if kwargs.get('indent') == 2:
+            kwargs.pop('indent')
+            options |= orjson.OPT_INDENT_2
+        
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        
+        return orjson.dumps(obj, default=self._orjson_default, option=options).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'neon_trader_v7_secret_key_2025'
 
+# حد أعلى لحجم الطلب: يرفض Werkzeug الرفع الأكبر بـ 413 قبل تحليله أو نسخه إلى القرص،
+# والملفات الصغيرة تبقى في الذاكرة فتُمرر تدفقاتها مباشرة إلى المساعد الصوتي
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+
+# مجلد خزائن المستخدمين: يُنشأ مرة واحدة عند بدء التشغيل
+app.config['VAULTS_DIR'] = os.path.join(os.path.dirname(app.instance_path), 'vaults')
+os.makedirs(app.config['VAULTS_DIR'], exist_ok=True)
+
+# مدير مصادقة واحد مشترك بين جميع الطلبات
+app.extensions['auth_manager'] = AuthManager(app.config['SECRET_KEY'])
+
+# ترميز JSON بدون تهريب الأحرف العربية (\uXXXX)، وعبر orjson إن كان متاحاً
+if ORJSON_AVAILABLE:
+    app.json = OrjsonProvider(app)
+app.json.ensure_ascii = False
+# ردود مضغوطة دائماً؛ بدون هذا يُنسّق Flask الردود بمسافات عند التشغيل بوضع debug
+app.json.compact = True
+
 # تفعيل CORS للسماح بالطلبات من الواجهة الأمامية
 CORS(app)
 
@@ -26,6 +86,16 @@ app.register_blueprint(trading_bp, url_prefix='/api/trading')
 app.register_blueprint(ai_bp, url_prefix='/api/ai')
 app.register_blueprint(voice_bp, url_prefix='/api/voice')
 
+@app.errorhandler(Exception)
+def handle_unexpected_error(e):
+    """خطأ غير متوقع في أي مسار: تراجع عن جلسة قاعدة البيانات ورد JSON موحد"""
+    # أخطاء HTTP (404، 405...) تبقى بردودها الافتراضية
+    if isinstance(e, HTTPException):
+        return e
+    
+    db.session.rollback()
+    return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -7,6 +7,9 @@ import os
 import jwt
 import time
 import secrets
+import hashlib
+import threading
+from collections import OrderedDict
 import pyotp
 import qrcode
 from datetime import datetime, timedelta
@@ -15,6 +18,10 @@ from flask_sqlalchemy import SQLAlchemy
 from src.models.user import db
 from src.models.vault import EncryptedVault
 
+# ذاكرة مؤقتة لنتائج التحقق من الجلسات: تُفهرس بتجزئة الرمز وليس بالرمز نفسه
+_VALIDATION_CACHE_SIZE = 10000
+_VALIDATION_CACHE_TTL = 30  # ثوانٍ
+
 
 class User(db.Model):
     """
@@ -70,6 +77,56 @@ class AuthManager:
         self.session_timeout = timedelta(minutes=session_timeout_minutes)
         self.max_failed_attempts = 5
         self.lockout_duration = timedelta(minutes=15)
+        
+        # تجزئة وهمية تُتحقق منها عند غياب المستخدم ليتساوى زمن الاستجابة
+        self._dummy_password_hash = self.vault.hash_password("timing-attack-placeholder")
+        
+        # token_hash -> (cached_until, expires_at, validation_result)
+        self._validation_cache = OrderedDict()
+        self._validation_lock = threading.Lock()
+    
+    @staticmethod
+    def _token_key(session_token: str) -> bytes:
+        """تجزئة رمز الجلسة لاستخدامها كمفتاح في الذاكرة المؤقتة"""
+        return hashlib.blake2b(session_token.encode(), digest_size=16).digest()
+    
+    def _get_cached_validation(self, token_key: bytes) -> Optional[Dict[str, Any]]:
+        """نتيجة تحقق مخزنة ما زالت صالحة، أو None"""
+        with self._validation_lock:
+            entry = self._validation_cache.get(token_key)
+            if entry is None:
+                return None
+            
+            cached_until, expires_at, result = entry
+            if time.monotonic() > cached_until or datetime.utcnow() > expires_at:
+                del self._validation_cache[token_key]
+                return None
+            
+            self._validation_cache.move_to_end(token_key)
+            return dict(result)
+    
+    def _cache_validation(self, token_key: bytes, expires_at: datetime, result: Dict[str, Any]):
+        """تخزين نتيجة تحقق ناجحة لفترة قصيرة"""
+        with self._validation_lock:
+            self._validation_cache[token_key] = (
+                time.monotonic() + _VALIDATION_CACHE_TTL, expires_at, dict(result)
+            )
+            self._validation_cache.move_to_end(token_key)
+            if len(self._validation_cache) > _VALIDATION_CACHE_SIZE:
+                self._validation_cache.popitem(last=False)
+    
+    def invalidate_session_cache(self, session_token: str):
+        """إزالة جلسة من ذاكرة التحقق المؤقتة"""
+        with self._validation_lock:
+            self._validation_cache.pop(self._token_key(session_token), None)
+    
+    def invalidate_user_cache(self, user_id: int):
+        """إزالة جميع جلسات المستخدم من ذاكرة التحقق المؤقتة"""
+        with self._validation_lock:
+            stale = [key for key, (_, _, result) in self._validation_cache.items()
+                     if result["user_id"] == user_id]
+            for key in stale:
+                del self._validation_cache[key]
     
     def register_user(self, username: str, master_password: str, enable_2fa: bool = False) -> Dict[str, Any]:
         """
@@ -140,6 +197,8 @@ class AuthManager:
             user = User.query.filter_by(username=username).first()
             
             if not user:
+                # نفس كلفة التحقق الحقيقي حتى لا يكشف التوقيت وجود اسم المستخدم
+                self.vault.verify_password(master_password, self._dummy_password_hash)
                 return {"success": False, "error": "اسم المستخدم أو كلمة المرور غير صحيحة"}
             
             # التحقق من القفل
@@ -165,6 +224,10 @@ class AuthManager:
                 if not totp.verify(totp_code):
                     return {"success": False, "error": "رمز المصادقة الثنائية غير صحيح"}
             
+            # ترقية التجزئة إذا تغيرت معاملات Argon2 منذ إنشائها
+            if self.vault.needs_rehash(user.master_password_hash):
+                user.master_password_hash = self.vault.hash_password(master_password)
+            
             # إعادة تعيين محاولات الدخول الفاشلة
             user.failed_login_attempts = 0
             user.locked_until = None
@@ -212,6 +275,11 @@ class AuthManager:
         التحقق من صحة الجلسة
         """
         try:
+            token_key = self._token_key(session_token)
+            cached = self._get_cached_validation(token_key)
+            if cached is not None:
+                return cached
+            
             session = Session.query.filter_by(
                 session_token=session_token,
                 is_active=True
@@ -230,12 +298,15 @@ class AuthManager:
             session.last_activity = datetime.utcnow()
             db.session.commit()
             
-            return {
+            result = {
                 "valid": True,
                 "user_id": session.user_id,
                 "username": session.user.username,
                 "session_id": session.id
             }
+            self._cache_validation(token_key, session.expires_at, result)
+            
+            return result
             
         except Exception as e:
             return {"valid": False, "error": f"خطأ في التحقق من الجلسة: {str(e)}"}
@@ -254,6 +325,7 @@ class AuthManager:
                 session.expires_at = datetime.utcnow() + self.session_timeout
                 session.last_activity = datetime.utcnow()
                 db.session.commit()
+                self.invalidate_session_cache(session_token)
                 return True
             
             return False
@@ -267,6 +339,7 @@ class AuthManager:
         تسجيل الخروج وإنهاء الجلسة
         """
         try:
+            self.invalidate_session_cache(session_token)
             session = Session.query.filter_by(session_token=session_token).first()
             
             if session:
@@ -291,6 +364,7 @@ class AuthManager:
                 session.is_active = False
             
             db.session.commit()
+            self.invalidate_user_cache(user_id)
             return True
             
         except Exception as e:
@@ -401,12 +475,26 @@ class AuthManager:
             return {"success": False, "error": f"خطأ في إلغاء المصادقة الثنائية: {str(e)}"}
 
 
+def get_auth_manager() -> AuthManager:
+    """
+    الحصول على مدير المصادقة المشترك للتطبيق الحالي (يُنشأ مرة واحدة)
+    """
+    from flask import current_app
+    
+    auth_manager = current_app.extensions.get('auth_manager')
+    if auth_manager is None:
+        auth_manager = current_app.extensions.setdefault(
+            'auth_manager', AuthManager(current_app.config['SECRET_KEY'])
+        )
+    return auth_manager
+
+
 def require_auth(f):
     """
     ديكوريتر للتحقق من المصادقة
     """
     from functools import wraps
-    from flask import request, jsonify, current_app
+    from flask import request, jsonify, g
     
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -415,16 +503,17 @@ def require_auth(f):
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "مطلوب رمز المصادقة"}), 401
         
-        session_token = auth_header.split(' ')[1]
-        auth_manager = AuthManager(current_app.config['SECRET_KEY'])
+        session_token = auth_header.partition(' ')[2]
+        auth_manager = get_auth_manager()
         
         validation_result = auth_manager.validate_session(session_token)
         
         if not validation_result["valid"]:
             return jsonify({"error": validation_result["error"]}), 401
         
-        # إضافة معلومات المستخدم إلى الطلب
+        # إضافة معلومات المستخدم والرمز إلى الطلب حتى لا تعيد المسارات تحليل الترويسة
         request.current_user = validation_result
+        g.session_token = session_token
         
         return f(*args, **kwargs)
     
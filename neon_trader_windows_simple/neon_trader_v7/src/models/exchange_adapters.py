@@ -4,18 +4,88 @@
 """
 
 import os
+import sys
 import json
 import hmac
-import hashlib
+import asyncio
 import time
-import requests
+import threading
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
 import logging
 from dataclasses import dataclass
+from decimal import Decimal, ROUND_DOWN
+from types import MappingProxyType
 
-@dataclass
+__all__ = [
+    'OrderResult', 'Balance', 'Position',
+    'ExchangeAdapter', 'BybitAdapter', 'BybitWebSocketClient',
+    'BinanceAdapter', 'ForexAdapter', 'StocksAdapter',
+    'ExchangeManager'
+]
+
+# جداول ثابتة لتوحيد صيغة الجهة ونوع الأمر دون إنشاء نصوص جديدة في كل طلب
+_SIDE_MAP = {
+    'buy': 'Buy', 'sell': 'Sell',
+    'Buy': 'Buy', 'Sell': 'Sell',
+    'BUY': 'Buy', 'SELL': 'Sell'
+}
+_ORDER_TYPE_MAP = {
+    'market': 'market', 'limit': 'limit',
+    'Market': 'market', 'Limit': 'limit',
+    'MARKET': 'market', 'LIMIT': 'limit'
+}
+
+# إعادة محاولة طلبات GET عند هذه الحالات بتأخير أُسّي (مثل Retry في مسار requests)
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_GET_RETRIES = 5
+_RETRY_BACKOFF = 0.25
+# سقف الانتظار الواحد (حتى مع Retry-After) ومجموع الانتظار لطلب واحد (ثوانٍ)
+_MAX_BACKOFF = 5.0
+_RETRY_BUDGET = 15.0
+
+# خطوة الكمية عند تعذر جلب بيانات الرمز
+_DEFAULT_QTY_STEP = Decimal('0.00000001')
+
+# أقصى عمر لسعر في ذاكرة الأسعار قبل الرجوع إلى طلب REST (ثوانٍ)
+_TICKER_MAX_AGE = 5.0
+
+# قائمة المنصات المدعومة (بيانات ثابتة للقراءة فقط)
+_SUPPORTED_EXCHANGES = (
+    MappingProxyType({
+        'type': 'bybit',
+        'name': 'Bybit',
+        'description': 'منصة تداول العملات المشفرة',
+        'supported': True
+    }),
+    MappingProxyType({
+        'type': 'binance',
+        'name': 'Binance',
+        'description': 'منصة تداول العملات المشفرة',
+        'supported': False  # قيد التطوير
+    }),
+    MappingProxyType({
+        'type': 'forex',
+        'name': 'Forex',
+        'description': 'تداول العملات الأجنبية',
+        'supported': False  # قيد التطوير
+    }),
+    MappingProxyType({
+        'type': 'stocks',
+        'name': 'Stocks',
+        'description': 'تداول الأسهم',
+        'supported': False  # قيد التطوير
+    })
+)
+
+# نسخة قواميس عادية قابلة للتسلسل إلى JSON تُبنى مرة واحدة وتُشارك بين الاستدعاءات (للقراءة فقط)
+_SUPPORTED_EXCHANGES_LIST = [dict(exchange) for exchange in _SUPPORTED_EXCHANGES]
+
+# استخدام __slots__ في الفئات البيانية عند توفرها (Python 3.10+)
+_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_SLOTS)
 class OrderResult:
     """نتيجة الأمر"""
     success: bool
@@ -25,7 +95,7 @@ class OrderResult:
     average_price: float = 0
     status: str = 'unknown'
 
-@dataclass
+@dataclass(**_SLOTS)
 class Balance:
     """رصيد العملة"""
     asset: str
@@ -33,7 +103,7 @@ class Balance:
     locked: float
     total: float
 
-@dataclass
+@dataclass(**_SLOTS)
 class Position:
     """المركز"""
     symbol: str
@@ -99,47 +169,143 @@ class BybitAdapter(ExchangeAdapter):
         else:
             self.base_url = "https://api.bybit.com"
         
-        self.session = requests.Session()
-        self.session.headers.update({
-            'X-BAPI-API-KEY': self.api_key,
-            'Content-Type': 'application/json'
-        })
+        # HTTP/2 عبر httpx (إن توفر) لتمرير الطلبات المتزامنة على اتصال TLS واحد
+        self.client = self._create_http2_client()
+        self.session = None
+        
+        if self.client is None:
+            # استيراد requests عند الحاجة فقط لتسريع تحميل الوحدة
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            
+            self.session = requests.Session()
+            self.session.headers.update({
+                'X-BAPI-API-KEY': self.api_key,
+                'Content-Type': 'application/json'
+            })
+            
+            # إعادة المحاولة تلقائياً للطلبات الآمنة فقط (GET)
+            # لا يُعاد إرسال POST حتى لا يتكرر إنشاء الأوامر
+            retry = Retry(
+                total=5,
+                backoff_factor=0.25,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['GET'],
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            self.session.mount('https://', HTTPAdapter(max_retries=retry))
+
+        # تجهيز الأجزاء الثابتة من التوقيع مرة واحدة
+        self._secret_bytes = self.api_secret.encode("utf-8")
+        self._sign_key_window = (self.api_key + "5000").encode("utf-8")
+
+        # ذاكرة أسعار الرموز المراقبة فقط: رمز -> (السعر، وقت التحديث monotonic)
+        self._watched: set = set()
+        self._ticker_cache: Dict[str, Tuple[float, float]] = {}
+        # الرموز التي كتبها كل مصدر (REST / WebSocket): إيقاف مصدر يحذف رموزه فقط
+        self._rest_symbols: set = set()
+        self._ws_symbols: set = set()
+        self._ticker_lock = threading.Lock()
+        self._ticker_stop = threading.Event()
+        self._ticker_thread: Optional[threading.Thread] = None
+
+        # حالة البث عبر WebSocket
+        self._ws_client: Optional['BybitWebSocketClient'] = None
+        self._ws_positions: Dict[str, Position] = {}
+
+        # عدد المنازل العشرية للسعر وخطوة الكمية لكل رمز
+        self._symbol_meta: Dict[str, Tuple[int, Decimal]] = {}
+
+    def _create_http2_client(self):
+        """إنشاء عميل httpx يدعم HTTP/2، أو None إذا لم تكن httpx[http2] مثبتة"""
+        try:
+            import httpx
+            import h2  # noqa: F401
+        except ImportError:
+            return None
+        
+        limits = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+        # retries في httpx تعيد محاولة أخطاء الاتصال فقط، لذا هي آمنة مع POST
+        transport = httpx.HTTPTransport(http2=True, limits=limits, retries=3)
+        return httpx.Client(
+            http2=True,
+            transport=transport,
+            base_url=self.base_url,
+            headers={
+                'X-BAPI-API-KEY': self.api_key,
+                'Content-Type': 'application/json'
+            },
+            timeout=httpx.Timeout(10.0, connect=3.0)
+        )
     
     def _generate_signature(self, timestamp: str, params: str) -> str:
         """توليد التوقيع"""
-        param_str = timestamp + self.api_key + "5000" + params
-        return hmac.new(
-            bytes(self.api_secret, "utf-8"),
-            param_str.encode("utf-8"),
-            hashlib.sha256
-        ).hexdigest()
+        # hmac.digest يستدعي مسار OpenSSL المباشر دون إنشاء كائن HMAC
+        message = timestamp.encode("utf-8") + self._sign_key_window + params.encode("utf-8")
+        return hmac.digest(self._secret_bytes, message, "sha256").hex()
+    
+    def _signed_headers(self, params_str: str) -> Dict[str, str]:
+        """رؤوس التوقيع بطابع زمني جديد"""
+        timestamp = str(int(time.time() * 1000))
+        return {
+            'X-BAPI-TIMESTAMP': timestamp,
+            'X-BAPI-SIGN': self._generate_signature(timestamp, params_str),
+            'X-BAPI-RECV-WINDOW': '5000'
+        }
+    
+    @staticmethod
+    def _retry_delay(response, attempt: int) -> float:
+        """مدة الانتظار قبل إعادة المحاولة: Retry-After إن وُجد وإلا تأخير أُسّي، بحد أقصى _MAX_BACKOFF"""
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), _MAX_BACKOFF)
+        return min(_RETRY_BACKOFF * (2 ** (attempt - 1)), _MAX_BACKOFF)
     
     def _make_request(self, method: str, endpoint: str, params: Dict = None) -> Dict:
         """إجراء طلب HTTP"""
         try:
-            timestamp = str(int(time.time() * 1000))
             params_str = json.dumps(params) if params else ""
+            headers = self._signed_headers(params_str)
             
-            signature = self._generate_signature(timestamp, params_str)
+            is_get = method.upper() == 'GET'
             
-            headers = {
-                'X-BAPI-TIMESTAMP': timestamp,
-                'X-BAPI-SIGN': signature,
-                'X-BAPI-RECV-WINDOW': '5000'
-            }
-            
-            url = f"{self.base_url}{endpoint}"
-            
-            if method.upper() == 'GET':
-                response = self.session.get(url, params=params, headers=headers)
+            if self.client is not None:
+                # GET فقط يُعاد عند 429/5xx؛ POST يُرسل مرة واحدة حتى لا يتكرر إنشاء الأوامر
+                waited = 0.0
+                for attempt in range(_GET_RETRIES + 1 if is_get else 1):
+                    if attempt:
+                        delay = self._retry_delay(response, attempt)
+                        if waited + delay > _RETRY_BUDGET:
+                            # نفدت ميزانية الانتظار: raise_for_status أدناه يعيد الخطأ
+                            break
+                        time.sleep(delay)
+                        waited += delay
+                        # توقيع جديد حتى لا تتجاوز المحاولات المتأخرة نافذة الاستلام
+                        headers = self._signed_headers(params_str)
+                    
+                    # إرسال النص الموقَّع نفسه كجسم الطلب
+                    response = self.client.request(
+                        method.upper(), endpoint,
+                        params=params if is_get else None,
+                        content=None if is_get else params_str,
+                        headers=headers
+                    )
+                    if response.status_code not in _RETRY_STATUSES:
+                        break
             else:
-                response = self.session.post(url, json=params, headers=headers)
+                url = f"{self.base_url}{endpoint}"
+                if is_get:
+                    response = self.session.get(url, params=params, headers=headers)
+                else:
+                    response = self.session.post(url, json=params, headers=headers)
             
             response.raise_for_status()
             return response.json()
             
         except Exception as e:
-            self.logger.error(f"خطأ في طلب Bybit: {e}")
+            self.logger.error("خطأ في طلب Bybit: %s", e)
             return {'retCode': -1, 'retMsg': str(e)}
     
     def test_connection(self) -> bool:
@@ -156,7 +322,7 @@ class BybitAdapter(ExchangeAdapter):
             result = self._make_request('GET', '/v5/account/wallet-balance', {'accountType': 'UNIFIED'})
             
             if result.get('retCode') != 0:
-                self.logger.error(f"خطأ في الحصول على الرصيد: {result.get('retMsg')}")
+                self.logger.error("خطأ في الحصول على الرصيد: %s", result.get('retMsg'))
                 return []
             
             balances = []
@@ -176,16 +342,54 @@ class BybitAdapter(ExchangeAdapter):
             return balances
             
         except Exception as e:
-            self.logger.error(f"خطأ في الحصول على رصيد Bybit: {e}")
+            self.logger.error("خطأ في الحصول على رصيد Bybit: %s", e)
             return []
     
+    def start_websocket(self) -> bool:
+        """بدء بث الأسعار والمراكز عبر WebSocket"""
+        try:
+            import websockets  # noqa: F401
+        except ImportError:
+            self.logger.error("مكتبة websockets غير مثبتة")
+            return False
+        
+        if self._ws_client and self._ws_client.is_running:
+            return True
+        
+        # تهيئة المراكز من REST لأن قناة المراكز لا ترسل لقطة أولية
+        initial_positions = self._fetch_positions()
+        with self._ticker_lock:
+            self._ws_positions = {pos.symbol: pos for pos in initial_positions}
+        
+        self._ws_client = BybitWebSocketClient(self)
+        self._ws_client.start()
+        return True
+    
+    def stop_websocket(self):
+        """إيقاف بث WebSocket"""
+        if self._ws_client:
+            self._ws_client.stop()
+            self._ws_client = None
+        
+        with self._ticker_lock:
+            self._ws_positions.clear()
+            self._drop_ticker_symbols(self._ws_symbols, self._rest_symbols)
+    
     def get_positions(self) -> List[Position]:
         """الحصول على المراكز المفتوحة"""
+        if self._ws_client and self._ws_client.is_running:
+            with self._ticker_lock:
+                return list(self._ws_positions.values())
+        
+        return self._fetch_positions()
+    
+    def _fetch_positions(self) -> List[Position]:
+        """الحصول على المراكز المفتوحة عبر REST"""
         try:
             result = self._make_request('GET', '/v5/position/list', {'category': 'linear'})
             
             if result.get('retCode') != 0:
-                self.logger.error(f"خطأ في الحصول على المراكز: {result.get('retMsg')}")
+                self.logger.error("خطأ في الحصول على المراكز: %s", result.get('retMsg'))
                 return []
             
             positions = []
@@ -207,18 +411,67 @@ class BybitAdapter(ExchangeAdapter):
             return positions
             
         except Exception as e:
-            self.logger.error(f"خطأ في الحصول على مراكز Bybit: {e}")
+            self.logger.error("خطأ في الحصول على مراكز Bybit: %s", e)
             return []
     
+    @staticmethod
+    def _step_decimals(step: str) -> int:
+        """عدد المنازل العشرية في خطوة السعر أو الكمية"""
+        if '.' not in step:
+            return 0
+        return len(step.rstrip('0').split('.')[1])
+    
+    def _get_symbol_meta(self, symbol: str) -> Optional[Tuple[int, Decimal]]:
+        """الحصول على دقة السعر وخطوة الكمية للرمز (مع التخزين المؤقت)"""
+        meta = self._symbol_meta.get(symbol)
+        if meta is not None:
+            return meta
+        
+        result = self._make_request('GET', '/v5/market/instruments-info', {
+            'category': 'linear',
+            'symbol': symbol
+        })
+        
+        if result.get('retCode') != 0:
+            return None
+        
+        instruments = result.get('result', {}).get('list', [])
+        if not instruments:
+            return None
+        
+        tick_size = instruments[0].get('priceFilter', {}).get('tickSize')
+        qty_step = instruments[0].get('lotSizeFilter', {}).get('qtyStep')
+        if not tick_size or not qty_step:
+            return None
+        
+        meta = (self._step_decimals(tick_size), Decimal(qty_step))
+        self._symbol_meta[symbol] = meta
+        return meta
+    
+    @staticmethod
+    def _format_number(value: float, decimals: Optional[int]) -> str:
+        """تنسيق رقم بدقة ثابتة دون صيغة علمية"""
+        if decimals is None:
+            return f"{value:.8f}".rstrip('0').rstrip('.')
+        return f"{value:.{decimals}f}"
+    
+    @staticmethod
+    def _format_quantity(value: float, step: Optional[Decimal]) -> str:
+        """تقريب الكمية للأسفل إلى مضاعف الخطوة حتى لا تتجاوز الرصيد أو حد المخاطرة"""
+        step = step or _DEFAULT_QTY_STEP
+        steps = (Decimal(str(value)) / step).to_integral_value(rounding=ROUND_DOWN)
+        return f"{(steps * step).quantize(step):f}"
+    
     def place_market_order(self, symbol: str, side: str, quantity: float) -> OrderResult:
         """وضع أمر سوق"""
         try:
+            meta = self._get_symbol_meta(symbol)
             params = {
                 'category': 'linear',
                 'symbol': symbol,
-                'side': side.capitalize(),
+                'side': _SIDE_MAP.get(side) or side.capitalize(),
                 'orderType': 'Market',
-                'qty': str(quantity)
+                'qty': self._format_quantity(quantity, meta[1] if meta else None)
             }
             
             result = self._make_request('POST', '/v5/order/create', params)
@@ -237,19 +490,20 @@ class BybitAdapter(ExchangeAdapter):
                 )
                 
         except Exception as e:
-            self.logger.error(f"خطأ في وضع أمر السوق: {e}")
+            self.logger.error("خطأ في وضع أمر السوق: %s", e)
             return OrderResult(success=False, error_message=str(e))
     
     def place_limit_order(self, symbol: str, side: str, quantity: float, price: float) -> OrderResult:
         """وضع أمر محدد"""
         try:
+            meta = self._get_symbol_meta(symbol)
             params = {
                 'category': 'linear',
                 'symbol': symbol,
-                'side': side.capitalize(),
+                'side': _SIDE_MAP.get(side) or side.capitalize(),
                 'orderType': 'Limit',
-                'qty': str(quantity),
-                'price': str(price)
+                'qty': self._format_quantity(quantity, meta[1] if meta else None),
+                'price': self._format_number(price, meta[0] if meta else None)
             }
             
             result = self._make_request('POST', '/v5/order/create', params)
@@ -268,7 +522,7 @@ class BybitAdapter(ExchangeAdapter):
                 )
                 
         except Exception as e:
-            self.logger.error(f"خطأ في وضع الأمر المحدد: {e}")
+            self.logger.error("خطأ في وضع الأمر المحدد: %s", e)
             return OrderResult(success=False, error_message=str(e))
     
     def cancel_order(self, symbol: str, order_id: str) -> bool:
@@ -284,11 +538,77 @@ class BybitAdapter(ExchangeAdapter):
             return result.get('retCode') == 0
             
         except Exception as e:
-            self.logger.error(f"خطأ في إلغاء الأمر: {e}")
+            self.logger.error("خطأ في إلغاء الأمر: %s", e)
             return False
     
+    def watch_symbols(self, symbols: List[str]):
+        """تسجيل رموز لتحديث أسعارها في الخلفية"""
+        with self._ticker_lock:
+            self._watched.update(symbols)
+    
+    def start_ticker_stream(self, interval: float = 0.5):
+        """بدء تحديث الأسعار في الخلفية"""
+        if self._ticker_thread and self._ticker_thread.is_alive():
+            return
+        
+        self._ticker_stop.clear()
+        self._ticker_thread = threading.Thread(
+            target=self._ticker_loop, args=(interval,), daemon=True
+        )
+        self._ticker_thread.start()
+    
+    def stop_ticker_stream(self):
+        """إيقاف تحديث الأسعار في الخلفية"""
+        self._ticker_stop.set()
+        if self._ticker_thread:
+            self._ticker_thread.join(timeout=5)
+            self._ticker_thread = None
+        
+        with self._ticker_lock:
+            self._drop_ticker_symbols(self._rest_symbols, self._ws_symbols)
+    
+    def _drop_ticker_symbols(self, owned: set, still_fed: set):
+        """حذف أسعار مصدر متوقف ما لم يغذّها المصدر الآخر (يُستدعى مع قفل الأسعار)"""
+        for symbol in owned - still_fed:
+            self._ticker_cache.pop(symbol, None)
+        owned.clear()
+    
+    def _ticker_loop(self, interval: float):
+        """حلقة تحديث الأسعار"""
+        while not self._ticker_stop.is_set():
+            self._refresh_tickers()
+            self._ticker_stop.wait(interval)
+    
+    def _refresh_tickers(self):
+        """تحديث جميع الأسعار بطلب واحد"""
+        try:
+            result = self._make_request('GET', '/v5/market/tickers', {'category': 'linear'})
+            
+            if result.get('retCode') != 0:
+                self.logger.error("خطأ في تحديث الأسعار: %s", result.get('retMsg'))
+                return
+            
+            now = time.monotonic()
+            with self._ticker_lock:
+                watched = self._watched
+                prices = {
+                    ticker['symbol']: (float(ticker.get('lastPrice', 0)), now)
+                    for ticker in result.get('result', {}).get('list', [])
+                    if ticker.get('symbol') in watched
+                }
+                self._ticker_cache.update(prices)
+                self._rest_symbols.update(prices)
+                
+        except Exception as e:
+            self.logger.error("خطأ في تحديث الأسعار: %s", e)
+    
     def get_ticker_price(self, symbol: str) -> float:
         """الحصول على سعر الرمز"""
+        # السعر المخزن يُستخدم ما دام حديثاً؛ توقف التحديث يعيدنا إلى REST بدلاً من سعر قديم
+        cached = self._ticker_cache.get(symbol)
+        if cached and cached[0] and time.monotonic() - cached[1] <= _TICKER_MAX_AGE:
+            return cached[0]
+        
         try:
             result = self._make_request('GET', '/v5/market/tickers', {
                 'category': 'linear',
@@ -303,9 +623,154 @@ class BybitAdapter(ExchangeAdapter):
             return 0
             
         except Exception as e:
-            self.logger.error(f"خطأ في الحصول على السعر: {e}")
+            self.logger.error("خطأ في الحصول على السعر: %s", e)
             return 0
 
+class BybitWebSocketClient:
+    """عميل WebSocket لبث أسعار ومراكز Bybit"""
+    
+    PING_INTERVAL = 20
+    
+    def __init__(self, adapter: BybitAdapter):
+        self.adapter = adapter
+        host = "stream-testnet.bybit.com" if adapter.testnet else "stream.bybit.com"
+        self.public_url = f"wss://{host}/v5/public/linear"
+        self.private_url = f"wss://{host}/v5/private"
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def is_running(self) -> bool:
+        """هل العميل يعمل"""
+        return bool(self._thread and self._thread.is_alive())
+    
+    def start(self):
+        """تشغيل حلقة الأحداث في خيط خلفي"""
+        if self.is_running:
+            return
+        
+        self._loop = asyncio.new_event_loop()
+        self._stop = asyncio.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """إيقاف العميل"""
+        if self._loop and self._stop and self.is_running:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+    
+    def _run(self):
+        """تشغيل حلقة الأحداث"""
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+    
+    async def _main(self):
+        """تشغيل القناتين العامة والخاصة حتى الإيقاف"""
+        tasks = [
+            asyncio.ensure_future(self._consume(self.public_url, self._subscribe_public)),
+            asyncio.ensure_future(self._consume(self.private_url, self._subscribe_private))
+        ]
+        
+        await self._stop.wait()
+        
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _consume(self, url: str, subscribe):
+        """الاتصال بقناة واستقبال الرسائل مع إعادة الاتصال عند الانقطاع"""
+        import websockets
+        
+        while not self._stop.is_set():
+            try:
+                async with websockets.connect(url, ping_interval=None) as ws:
+                    await subscribe(ws)
+                    pinger = asyncio.ensure_future(self._ping(ws))
+                    try:
+                        async for raw_message in ws:
+                            self._handle_message(json.loads(raw_message))
+                    finally:
+                        pinger.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error("خطأ في اتصال WebSocket %s: %s", url, e)
+                await asyncio.sleep(1)
+    
+    async def _ping(self, ws):
+        """إبقاء الاتصال حياً"""
+        while True:
+            await asyncio.sleep(self.PING_INTERVAL)
+            await ws.send(json.dumps({'op': 'ping'}))
+    
+    async def _subscribe_public(self, ws):
+        """الاشتراك في أسعار الرموز المراقبة"""
+        with self.adapter._ticker_lock:
+            symbols = sorted(self.adapter._watched)
+        
+        if symbols:
+            await ws.send(json.dumps({
+                'op': 'subscribe',
+                'args': [f"tickers.{symbol}" for symbol in symbols]
+            }))
+    
+    async def _subscribe_private(self, ws):
+        """تسجيل الدخول والاشتراك في قناة المراكز"""
+        expires = int((time.time() + 10) * 1000)
+        signature = hmac.digest(
+            self.adapter._secret_bytes, f"GET/realtime{expires}".encode("utf-8"), "sha256"
+        ).hex()
+        
+        await ws.send(json.dumps({
+            'op': 'auth',
+            'args': [self.adapter.api_key, expires, signature]
+        }))
+        await ws.send(json.dumps({'op': 'subscribe', 'args': ['position']}))
+    
+    def _handle_message(self, message: Dict):
+        """تحديث الحالة في الذاكرة من رسالة البث"""
+        topic = message.get('topic', '')
+        
+        if topic.startswith('tickers.'):
+            data = message.get('data', {})
+            last_price = data.get('lastPrice')
+            # رسائل delta قد لا تحتوي على السعر الأخير
+            if last_price:
+                symbol = data.get('symbol', topic[8:])
+                with self.adapter._ticker_lock:
+                    self.adapter._ticker_cache[symbol] = (float(last_price), time.monotonic())
+                    self.adapter._ws_symbols.add(symbol)
+        
+        elif topic == 'position':
+            with self.adapter._ticker_lock:
+                for pos in message.get('data', []):
+                    symbol = pos.get('symbol', '')
+                    size = float(pos.get('size', 0))
+                    
+                    if size <= 0:
+                        self.adapter._ws_positions.pop(symbol, None)
+                        continue
+                    
+                    pnl = float(pos.get('unrealisedPnl', 0))
+                    self.adapter._ws_positions[symbol] = Position(
+                        symbol=symbol,
+                        side=pos.get('side', ''),
+                        size=size,
+                        entry_price=float(pos.get('entryPrice', 0)),
+                        mark_price=float(pos.get('markPrice', 0)),
+                        pnl=pnl,
+                        pnl_percentage=pnl / float(pos.get('positionValue', 1) or 1) * 100
+                    )
+
 class BinanceAdapter(ExchangeAdapter):
     """محول منصة Binance (للمستقبل)"""
     
@@ -441,42 +906,50 @@ class ExchangeManager:
     
     def __init__(self):
         self.adapters: Dict[str, ExchangeAdapter] = {}
+        # جدول توجيه الأوامر: اسم المنصة -> نوع الأمر -> الدالة المرتبطة
+        self._dispatch: Dict[str, Dict[str, Any]] = {}
         self.logger = logging.getLogger(__name__)
     
     def add_exchange(self, name: str, exchange_type: str, api_key: str, 
                     api_secret: str, testnet: bool = True) -> bool:
         """إضافة منصة جديدة"""
         try:
-            if exchange_type.lower() == 'bybit':
+            exchange_kind = exchange_type.lower()
+            if exchange_kind == 'bybit':
                 adapter = BybitAdapter(api_key, api_secret, testnet)
-            elif exchange_type.lower() == 'binance':
+            elif exchange_kind == 'binance':
                 adapter = BinanceAdapter(api_key, api_secret, testnet)
-            elif exchange_type.lower() == 'forex':
+            elif exchange_kind == 'forex':
                 adapter = ForexAdapter(api_key, api_secret, testnet)
-            elif exchange_type.lower() == 'stocks':
+            elif exchange_kind == 'stocks':
                 adapter = StocksAdapter(api_key, api_secret, testnet)
             else:
-                self.logger.error(f"نوع المنصة غير مدعوم: {exchange_type}")
+                self.logger.error("نوع المنصة غير مدعوم: %s", exchange_type)
                 return False
             
             # اختبار الاتصال
             if adapter.test_connection():
                 self.adapters[name] = adapter
-                self.logger.info(f"تم إضافة المنصة بنجاح: {name}")
+                self._dispatch[name] = {
+                    'market': adapter.place_market_order,
+                    'limit': adapter.place_limit_order
+                }
+                self.logger.info("تم إضافة المنصة بنجاح: %s", name)
                 return True
             else:
-                self.logger.error(f"فشل في الاتصال بالمنصة: {name}")
+                self.logger.error("فشل في الاتصال بالمنصة: %s", name)
                 return False
                 
         except Exception as e:
-            self.logger.error(f"خطأ في إضافة المنصة {name}: {e}")
+            self.logger.error("خطأ في إضافة المنصة %s: %s", name, e)
             return False
     
     def remove_exchange(self, name: str) -> bool:
         """إزالة منصة"""
         if name in self.adapters:
             del self.adapters[name]
-            self.logger.info(f"تم إزالة المنصة: {name}")
+            self._dispatch.pop(name, None)
+            self.logger.info("تم إزالة المنصة: %s", name)
             return True
         return False
     
@@ -502,7 +975,7 @@ class ExchangeManager:
             try:
                 balances[name] = adapter.get_account_balance()
             except Exception as e:
-                self.logger.error(f"خطأ في الحصول على رصيد {name}: {e}")
+                self.logger.error("خطأ في الحصول على رصيد %s: %s", name, e)
                 balances[name] = []
         return balances
     
@@ -513,57 +986,33 @@ class ExchangeManager:
             try:
                 positions[name] = adapter.get_positions()
             except Exception as e:
-                self.logger.error(f"خطأ في الحصول على مراكز {name}: {e}")
+                self.logger.error("خطأ في الحصول على مراكز %s: %s", name, e)
                 positions[name] = []
         return positions
     
     def place_order_on_exchange(self, exchange_name: str, symbol: str, side: str, 
                                order_type: str, quantity: float, price: float = None) -> OrderResult:
         """وضع أمر على منصة محددة"""
-        adapter = self.get_exchange(exchange_name)
-        if not adapter:
+        dispatch = self._dispatch.get(exchange_name)
+        if dispatch is None:
             return OrderResult(success=False, error_message=f"المنصة غير موجودة: {exchange_name}")
         
+        order_kind = _ORDER_TYPE_MAP.get(order_type) or order_type.lower()
+        place = dispatch.get(order_kind)
+        if place is None:
+            return OrderResult(success=False, error_message=f"نوع الأمر غير مدعوم: {order_type}")
+        
         try:
-            if order_type.lower() == 'market':
-                return adapter.place_market_order(symbol, side, quantity)
-            elif order_type.lower() == 'limit':
+            if order_kind == 'limit':
                 if price is None:
                     return OrderResult(success=False, error_message="السعر مطلوب للأمر المحدد")
-                return adapter.place_limit_order(symbol, side, quantity, price)
-            else:
-                return OrderResult(success=False, error_message=f"نوع الأمر غير مدعوم: {order_type}")
+                return place(symbol, side, quantity, price)
+            return place(symbol, side, quantity)
                 
         except Exception as e:
-            self.logger.error(f"خطأ في وضع الأمر على {exchange_name}: {e}")
+            self.logger.error("خطأ في وضع الأمر على %s: %s", exchange_name, e)
             return OrderResult(success=False, error_message=str(e))
     
-    def get_supported_exchanges(self) -> List[Dict[str, str]]:
+    def get_supported_exchanges(self) -> List[Dict[str, Any]]:
         """الحصول على المنصات المدعومة"""
-        return [
-            {
-                'type': 'bybit',
-                'name': 'Bybit',
-                'description': 'منصة تداول العملات المشفرة',
-                'supported': True
-            },
-            {
-                'type': 'binance',
-                'name': 'Binance',
-                'description': 'منصة تداول العملات المشفرة',
-                'supported': False  # قيد التطوير
-            },
-            {
-                'type': 'forex',
-                'name': 'Forex',
-                'description': 'تداول العملات الأجنبية',
-                'supported': False  # قيد التطوير
-            },
-            {
-                'type': 'stocks',
-                'name': 'Stocks',
-                'description': 'تداول الأسهم',
-                'supported': False  # قيد التطوير
-            }
-        ]
-
+        return _SUPPORTED_EXCHANGES_LIST
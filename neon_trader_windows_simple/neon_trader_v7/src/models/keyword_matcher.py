@@ -0,0 +1,40 @@
+"""
+مطابقة الكلمات المفتاحية متعددة الأنماط في مرور واحد على النص
+"""
+
+from typing import Dict, Set
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+
+class KeywordMatcher:
+    """مطابق كلمات مفتاحية يعيد فئات جميع الكلمات الموجودة في النص"""
+
+    def __init__(self, keywords: Dict[str, str]):
+        # keywords: كلمة مفتاحية -> فئة
+        self.keywords = dict(keywords)
+        self._automaton = None
+
+        if AHOCORASICK_AVAILABLE:
+            automaton = ahocorasick.Automaton()
+            for word, category in self.keywords.items():
+                automaton.add_word(word, category)
+            automaton.make_automaton()
+            self._automaton = automaton
+
+    def match(self, text: str) -> Set[str]:
+        """إرجاع مجموعة فئات الكلمات المفتاحية الموجودة في النص"""
+        if self._automaton is not None:
+            return {category for _, category in self._automaton.iter(text)}
+
+        # الكلمات المطابقة تماماً أولاً عبر بحث في القاموس، ثم البحث الجزئي
+        # فقط عن الفئات التي لم تُطابق بعد
+        keywords = self.keywords
+        found = {keywords[token] for token in text.split() if token in keywords}
+        found.update(category for word, category in keywords.items()
+                     if category not in found and word in text)
+        return found
@@ -5,17 +5,38 @@
 
 import os
 import json
+import codecs
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Any, Tuple, Union
 import logging
+import threading
 from dataclasses import dataclass
+from collections import OrderedDict
+import matplotlib
+matplotlib.use('Agg')  # رسم دون واجهة رسومية قبل تحميل pyplot
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 from io import BytesIO
 import base64
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 # تعيين الخط العربي
 plt.rcParams['font.family'] = ['Noto Sans Arabic', 'Arial Unicode MS', 'Tahoma']
 plt.rcParams['axes.unicode_minus'] = False
@@ -56,6 +77,368 @@ class PerformanceMetrics:
     consecutive_wins: int
     consecutive_losses: int
 
+@dataclass
+class _ClosedTotals:
+    """مجاميع تراكمية للصفقات المغلقة تُحدَّث مع كل إضافة أو تعديل"""
+    count: int = 0
+    wins: int = 0
+    losses: int = 0
+    total_pnl: float = 0.0
+    total_pnl_percentage: float = 0.0
+    gross_profit: float = 0.0
+    gross_loss: float = 0.0
+    
+    @classmethod
+    def from_arrays(cls, pnl: np.ndarray, pnl_percentage: np.ndarray,
+                    signs: Optional[np.ndarray] = None) -> '_ClosedTotals':
+        """حساب المجاميع من أعمدة الصفقات المغلقة"""
+        # إشارة الربح تُحسب مرة واحدة ويُعاد استخدام أقنعتها
+        if signs is None:
+            signs = np.sign(pnl).astype(np.int8)
+        wins = pnl[signs == 1]
+        losses = pnl[signs == -1]
+        return cls(
+            count=int(pnl.size),
+            wins=int(wins.size),
+            losses=int(losses.size),
+            total_pnl=float(pnl.sum()),
+            total_pnl_percentage=float(pnl_percentage.sum()),
+            gross_profit=float(wins.sum()),
+            gross_loss=abs(float(losses.sum()))
+        )
+    
+    def apply(self, pnl: float, pnl_percentage: float, sign: int):
+        """إضافة صفقة (sign=1) أو طرحها (sign=-1)"""
+        self.count += sign
+        self.total_pnl += sign * pnl
+        self.total_pnl_percentage += sign * pnl_percentage
+        if pnl > 0:
+            self.wins += sign
+            self.gross_profit += sign * pnl
+        elif pnl < 0:
+            self.losses += sign
+            self.gross_loss -= sign * pnl
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+_NAT = np.iinfo(np.int64).min  # قيمة تمثل وقت خروج غير موجود
+_DAY_NS = 86_400 * 10**9
+_CHART_DPI = 100
+_JOURNAL_COMPACT_EVERY = 1000  # عدد العمليات في السجل قبل إعادة كتابة اللقطة الكاملة
+_ANALYTICS_CACHE_SIZE = 128
+_RISK_FREE_RATE = 2.0  # افتراض معدل خالي من المخاطر 2%
+
+
+def _datetime_to_ns(value: datetime) -> int:
+    """تحويل التاريخ إلى نانوثانية منذ 1970 (التواريخ ذات المنطقة الزمنية تُحوَّل إلى UTC)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _ONE_MICROSECOND * 1000
+
+
+def _ns_to_datetime(value: int) -> datetime:
+    """تحويل النانوثانية منذ 1970 إلى تاريخ"""
+    return _EPOCH + timedelta(microseconds=int(value) // 1000)
+
+
+# أقل عدد صفقات يستحق فيه استخدام نواة Numba بدلاً من NumPy
+_NUMBA_MIN_SIZE = 512
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _max_drawdown_kernel(pnl):
+        """أقصى انخفاض في مرور واحد دون مصفوفات وسيطة"""
+        cumulative = 0.0
+        peak = 0.0
+        max_drawdown = 0.0
+        for value in pnl:
+            cumulative += value
+            if cumulative > peak:
+                peak = cumulative
+            if peak - cumulative > max_drawdown:
+                max_drawdown = peak - cumulative
+        return max_drawdown
+
+    @njit(cache=True)
+    def _consecutive_kernel(pnl):
+        """أطول تسلسل رابح وخاسر في مرور واحد"""
+        max_wins = 0
+        max_losses = 0
+        wins = 0
+        losses = 0
+        for value in pnl:
+            if value > 0:
+                wins += 1
+                losses = 0
+                if wins > max_wins:
+                    max_wins = wins
+            elif value < 0:
+                losses += 1
+                wins = 0
+                if losses > max_losses:
+                    max_losses = losses
+            else:
+                wins = 0
+                losses = 0
+        return max_wins, max_losses
+
+    @njit(cache=True, fastmath=True)
+    def _mean_std_kernel(returns):
+        """المتوسط والانحراف المعياري (ويلفورد) في مرور واحد"""
+        mean = 0.0
+        m2 = 0.0
+        count = 0
+        for value in returns:
+            count += 1
+            delta = value - mean
+            mean += delta / count
+            m2 += delta * (value - mean)
+        return mean, np.sqrt(m2 / count)
+
+
+class _TradesColumns:
+    """تخزين الصفقات كأعمدة NumPy متوازية (SoA) مرتبة حسب وقت الدخول"""
+    
+    _DTYPES = {
+        'entry_time_ns': np.int64,
+        'exit_time_ns': np.int64,
+        'entry_price': np.float64,
+        'exit_price': np.float64,
+        'quantity': np.float64,
+        'pnl': np.float64,
+        'pnl_percentage': np.float64,
+        'fees': np.float64,
+        'symbol_code': np.int16,
+        'side_code': np.uint8,
+        'strategy_code': np.int16,
+        'status_code': np.uint8
+    }
+    
+    # الأعمدة النصية المُرمَّزة: (اسم العمود، جدول القيم، فهرس القيم)
+    _CODED_COLUMNS = (
+        ('symbol', 'symbols', '_symbol_index'),
+        ('side', 'sides', '_side_index'),
+        ('strategy', 'strategies', '_strategy_index'),
+        ('status', 'statuses', '_status_index')
+    )
+    
+    def __init__(self, capacity: int = 64):
+        self.size = 0
+        self._capacity = capacity
+        self._arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in self._DTYPES.items()}
+        
+        # المعرفات فريدة فلا فائدة من ترميزها
+        self.ids: List[str] = []
+        
+        # جداول ترميز النصوص المتكررة إلى أرقام صغيرة
+        self.symbols: List[str] = []
+        self.sides: List[str] = []
+        self.strategies: List[str] = []
+        self.statuses: List[str] = []
+        self._symbol_index: Dict[str, int] = {}
+        self._side_index: Dict[str, int] = {}
+        self._strategy_index: Dict[str, int] = {}
+        self._status_index: Dict[str, int] = {}
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    def __getitem__(self, name: str) -> np.ndarray:
+        """الحصول على عمود رقمي (عرض دون نسخ)"""
+        return self._arrays[name][:self.size]
+    
+    @staticmethod
+    def _intern(table: List[str], index: Dict[str, int], value: str) -> int:
+        """ترميز نص إلى رقم ثابت"""
+        code = index.get(value)
+        if code is None:
+            code = len(table)
+            table.append(value)
+            index[value] = code
+        return code
+    
+    def _grow(self):
+        """مضاعفة سعة الأعمدة"""
+        self._capacity *= 2
+        for name, array in self._arrays.items():
+            self._arrays[name] = np.resize(array, self._capacity)
+    
+    def append(self, trade: TradeRecord) -> int:
+        """إضافة صفقة في موضعها حسب وقت الدخول وإرجاع الفهرس"""
+        if self.size == self._capacity:
+            self._grow()
+        
+        n = self.size
+        entry_ns = _datetime_to_ns(trade.entry_time)
+        pos = int(np.searchsorted(self._arrays['entry_time_ns'][:n], entry_ns, side='right'))
+        
+        values = {
+            'entry_time_ns': entry_ns,
+            'exit_time_ns': _datetime_to_ns(trade.exit_time) if trade.exit_time else _NAT,
+            'entry_price': trade.entry_price,
+            'exit_price': trade.exit_price if trade.exit_price is not None else np.nan,
+            'quantity': trade.quantity,
+            'pnl': trade.pnl,
+            'pnl_percentage': trade.pnl_percentage,
+            'fees': trade.fees,
+            'symbol_code': self._intern(self.symbols, self._symbol_index, trade.symbol),
+            'side_code': self._intern(self.sides, self._side_index, trade.side),
+            'strategy_code': self._intern(self.strategies, self._strategy_index, trade.strategy),
+            'status_code': self._intern(self.statuses, self._status_index, trade.status)
+        }
+        
+        for name, array in self._arrays.items():
+            if pos < n:
+                array[pos + 1:n + 1] = array[pos:n]
+            array[pos] = values[name]
+        
+        self.ids.insert(pos, trade.id)
+        self.size += 1
+        return pos
+    
+    def extend(self, other: '_TradesColumns'):
+        """دمج أعمدة صفقات أخرى دفعة واحدة مع الحفاظ على الترتيب حسب وقت الدخول"""
+        n = self.size + other.size
+        while self._capacity < n:
+            self._grow()
+        
+        # إعادة ترميز النصوص إلى جداول هذا المخزن
+        remapped = {}
+        for name, table_attr, index_attr in self._CODED_COLUMNS:
+            table, index = getattr(self, table_attr), getattr(self, index_attr)
+            mapping = np.array([self._intern(table, index, value) for value in getattr(other, table_attr)], dtype=np.int64)
+            remapped[f'{name}_code'] = mapping[other[f'{name}_code']]
+        
+        # ترتيب مستقر: الصفقات الحالية تسبق الجديدة عند تساوي الوقت كما في append
+        order = np.argsort(np.concatenate((self['entry_time_ns'], other['entry_time_ns'])), kind='stable')
+        
+        for name, array in self._arrays.items():
+            merged = np.concatenate((array[:self.size], remapped.get(name, other[name])))
+            array[:n] = merged[order]
+        
+        ids = self.ids + other.ids
+        self.ids = [ids[i] for i in order.tolist()]
+        self.size = n
+    
+    def index_of(self, trade_id: str) -> int:
+        """فهرس الصفقة حسب المعرف أو -1"""
+        try:
+            return self.ids.index(trade_id)
+        except ValueError:
+            return -1
+    
+    def set_value(self, index: int, field: str, value: Any):
+        """تحديث حقل واحد لصفقة"""
+        if field == 'exit_time':
+            self._arrays['exit_time_ns'][index] = _datetime_to_ns(value) if value else _NAT
+        elif field == 'status':
+            self._arrays['status_code'][index] = self._intern(self.statuses, self._status_index, value)
+        else:
+            self._arrays[field][index] = value
+    
+    def status_mask(self, status: str, window: slice = slice(None)) -> np.ndarray:
+        """قناع الصفقات ذات الحالة المحددة ضمن النطاق"""
+        codes = self['status_code'][window]
+        code = self._status_index.get(status)
+        if code is None:
+            return np.zeros(len(codes), dtype=bool)
+        return codes == code
+    
+    def record(self, index: int) -> TradeRecord:
+        """إعادة بناء سجل الصفقة عند الحاجة فقط"""
+        arrays = self._arrays
+        exit_ns = arrays['exit_time_ns'][index]
+        exit_price = arrays['exit_price'][index]
+        
+        return TradeRecord(
+            id=self.ids[index],
+            symbol=self.symbols[arrays['symbol_code'][index]],
+            side=self.sides[arrays['side_code'][index]],
+            entry_time=_ns_to_datetime(arrays['entry_time_ns'][index]),
+            exit_time=_ns_to_datetime(exit_ns) if exit_ns != _NAT else None,
+            entry_price=float(arrays['entry_price'][index]),
+            exit_price=float(exit_price) if not np.isnan(exit_price) else None,
+            quantity=float(arrays['quantity'][index]),
+            pnl=float(arrays['pnl'][index]),
+            pnl_percentage=float(arrays['pnl_percentage'][index]),
+            fees=float(arrays['fees'][index]),
+            strategy=self.strategies[arrays['strategy_code'][index]],
+            status=self.statuses[arrays['status_code'][index]]
+        )
+    
+    def records(self, window: slice = slice(None)) -> List[TradeRecord]:
+        """إعادة بناء سجلات نطاق من الصفقات"""
+        return [self.record(i) for i in range(*window.indices(self.size))]
+    
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> '_TradesColumns':
+        """تحميل الأعمدة من DataFrame بتحويل كل عمود دفعة واحدة"""
+        n = len(frame)
+        columns = cls(max(64, n))
+        
+        # تحليل التواريخ بمحلل pandas؛ ذات المنطقة الزمنية تُحوَّل إلى UTC كما في _datetime_to_ns
+        for name in ('entry_time', 'exit_time'):
+            times = pd.to_datetime(frame[name], format='ISO8601', utc=True).dt.tz_localize(None)
+            frame[f'{name}_ns'] = times.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        
+        # ترتيب مستقر حسب وقت الدخول كما في الإضافة صفقة بصفقة
+        frame = frame.sort_values('entry_time_ns', kind='stable')
+        
+        for name, dtype in cls._DTYPES.items():
+            if not name.endswith('_code'):
+                columns._arrays[name][:n] = frame[name].to_numpy(dtype=dtype)
+        
+        for name, table_attr, index_attr in cls._CODED_COLUMNS:
+            codes, values = pd.factorize(frame[name])
+            values = values.tolist()
+            setattr(columns, table_attr, values)
+            setattr(columns, index_attr, {value: code for code, value in enumerate(values)})
+            columns._arrays[f'{name}_code'][:n] = codes
+        
+        columns.ids = frame['id'].tolist()
+        columns.size = n
+        return columns
+    
+    def to_arrow(self) -> 'pa.Table':
+        """تحويل الأعمدة إلى جدول Arrow (النصوص المتكررة كأعمدة قاموس)"""
+        columns = {
+            'id': pa.array(self.ids, type=pa.string())
+        }
+        
+        for name, table_attr, _ in self._CODED_COLUMNS:
+            columns[name] = pa.DictionaryArray.from_arrays(
+                pa.array(self[f'{name}_code'].astype(np.int32)),
+                pa.array(getattr(self, table_attr), type=pa.string())
+            )
+        
+        for name in self._DTYPES:
+            if not name.endswith('_code'):
+                columns[name] = pa.array(self[name])
+        
+        return pa.table(columns)
+    
+    @classmethod
+    def from_arrow(cls, table: 'pa.Table') -> '_TradesColumns':
+        """تحميل الأعمدة مباشرة من جدول Arrow دون بناء سجلات"""
+        n = table.num_rows
+        columns = cls(max(64, n))
+        
+        for name in cls._DTYPES:
+            if not name.endswith('_code'):
+                columns._arrays[name][:n] = table.column(name).to_numpy()
+        
+        for name, table_attr, index_attr in cls._CODED_COLUMNS:
+            encoded = table.column(name).cast(pa.string()).combine_chunks().dictionary_encode()
+            values = encoded.dictionary.to_pylist()
+            setattr(columns, table_attr, values)
+            setattr(columns, index_attr, {value: code for code, value in enumerate(values)})
+            columns._arrays[f'{name}_code'][:n] = encoded.indices.to_numpy()
+        
+        columns.ids = table.column('id').to_pylist()
+        columns.size = n
+        return columns
+
+
 class ReportsManager:
     """مدير التقارير والسجلات"""
     
@@ -63,6 +446,9 @@ class ReportsManager:
         self.logger = logging.getLogger(__name__)
         self.data_dir = data_dir or os.path.join(os.path.dirname(__file__), '..', 'data')
         self.trades_file = os.path.join(self.data_dir, 'trades.json')
+        self.trades_parquet_file = os.path.join(self.data_dir, 'trades.parquet')
+        self.trades_journal_file = os.path.join(self.data_dir, 'trades.jsonl')
+        self._journal_entries = 0
         self.performance_file = os.path.join(self.data_dir, 'performance.json')
         
         # إنشاء مجلد البيانات إذا لم يكن موجوداً
@@ -71,6 +457,28 @@ class ReportsManager:
         # تحميل البيانات الموجودة
         self.trades = self._load_trades()
         self.performance_history = self._load_performance_history()
+        
+        # ذاكرة نتائج التحليلات؛ رقم الإصدار يزداد مع كل تعديل فتصبح المفاتيح القديمة غير قابلة للوصول
+        self._version = 0
+        self._analytics_cache: OrderedDict = OrderedDict()
+        
+        # مجاميع السجل الكامل تُحسب مرة عند التحميل ثم تُحدَّث تراكمياً
+        self._closed_totals = self._compute_closed_totals(slice(0, len(self.trades)))
+        self._group_totals = {
+            'symbol': self._group_performance(self.trades['symbol_code'], self.trades.symbols, slice(None)),
+            'strategy': self._group_performance(self.trades['strategy_code'], self.trades.strategies, slice(None))
+        }
+        
+        # منحنى الأرباح التراكمية للسجل الكامل [التراكمي، القمة] يُمدَّد عند الإضافة في النهاية
+        self._curve = np.empty((2, 0))
+        self._curve_size = 0
+        self._curve_version = -1
+        self._curve_max_drawdown = 0.0
+        
+        # شكل الرسم البياني يُنشأ مرة واحدة ويُعاد رسمه في كل استدعاء
+        self._chart_fig: Optional[Figure] = None
+        self._chart_axes: Optional[Tuple] = None
+        self._chart_lock = threading.Lock()
     
     def add_trade_record(self, trade_data: Dict[str, Any]) -> str:
         """إضافة سجل صفقة جديدة"""
@@ -93,8 +501,11 @@ class ReportsManager:
                 status=trade_data.get('status', 'open')
             )
             
-            self.trades.append(trade_record)
-            self._save_trades()
+            pos = self.trades.append(trade_record)
+            self._apply_trade_totals(pos, 1)
+            self._extend_equity_curve(pos)
+            self._version += 1
+            self._append_journal({'op': 'add', 'trade': self._trades_to_records(slice(pos, pos + 1))[0]})
             
             self.logger.info(f"تم إضافة سجل صفقة جديدة: {trade_id}")
             return trade_id
@@ -106,28 +517,25 @@ class ReportsManager:
     def update_trade_record(self, trade_id: str, update_data: Dict[str, Any]) -> bool:
         """تحديث سجل صفقة موجودة"""
         try:
-            for i, trade in enumerate(self.trades):
-                if trade.id == trade_id:
-                    # تحديث البيانات
-                    if 'exit_time' in update_data:
-                        self.trades[i].exit_time = datetime.fromisoformat(update_data['exit_time'])
-                    if 'exit_price' in update_data:
-                        self.trades[i].exit_price = float(update_data['exit_price'])
-                    if 'pnl' in update_data:
-                        self.trades[i].pnl = float(update_data['pnl'])
-                    if 'pnl_percentage' in update_data:
-                        self.trades[i].pnl_percentage = float(update_data['pnl_percentage'])
-                    if 'status' in update_data:
-                        self.trades[i].status = update_data['status']
-                    if 'fees' in update_data:
-                        self.trades[i].fees = float(update_data['fees'])
-                    
-                    self._save_trades()
-                    self.logger.info(f"تم تحديث سجل الصفقة: {trade_id}")
-                    return True
-            
-            self.logger.warning(f"لم يتم العثور على الصفقة: {trade_id}")
-            return False
+            i = self.trades.index_of(trade_id)
+            if i < 0:
+                self.logger.warning(f"لم يتم العثور على الصفقة: {trade_id}")
+                return False
+            
+            # تحليل الحقول أولاً: قيمة غير صالحة ترفض التحديث قبل المساس بالمجاميع
+            fields = self._parse_update(update_data)
+            
+            # طرح مساهمة الصفقة القديمة من المجاميع ثم إعادة إضافتها بعد التحديث
+            self._apply_trade_totals(i, -1)
+            
+            for field, value in fields.items():
+                self.trades.set_value(i, field, value)
+            
+            self._apply_trade_totals(i, 1)
+            self._version += 1
+            self._append_journal({'op': 'update', 'id': trade_id, 'fields': update_data})
+            self.logger.info(f"تم تحديث سجل الصفقة: {trade_id}")
+            return True
             
         except Exception as e:
             self.logger.error(f"خطأ في تحديث سجل الصفقة: {e}")
@@ -138,72 +546,89 @@ class ReportsManager:
         """حساب مقاييس الأداء"""
         try:
             # تصفية الصفقات حسب التاريخ
-            filtered_trades = self._filter_trades_by_date(start_date, end_date)
-            closed_trades = [t for t in filtered_trades if t.status == 'closed']
-            
-            if not closed_trades:
-                return PerformanceMetrics(
-                    total_trades=0, winning_trades=0, losing_trades=0,
-                    win_rate=0, total_pnl=0, total_pnl_percentage=0,
-                    max_drawdown=0, sharpe_ratio=0, profit_factor=0,
-                    average_win=0, average_loss=0, largest_win=0, largest_loss=0,
-                    consecutive_wins=0, consecutive_losses=0
-                )
-            
-            # حساب المقاييس الأساسية
-            total_trades = len(closed_trades)
-            winning_trades = len([t for t in closed_trades if t.pnl > 0])
-            losing_trades = len([t for t in closed_trades if t.pnl < 0])
-            win_rate = (winning_trades / total_trades) * 100 if total_trades > 0 else 0
-            
-            total_pnl = sum(t.pnl for t in closed_trades)
-            total_pnl_percentage = sum(t.pnl_percentage for t in closed_trades)
-            
-            # حساب الأرباح والخسائر
-            wins = [t.pnl for t in closed_trades if t.pnl > 0]
-            losses = [t.pnl for t in closed_trades if t.pnl < 0]
-            
-            average_win = np.mean(wins) if wins else 0
-            average_loss = np.mean(losses) if losses else 0
-            largest_win = max(wins) if wins else 0
-            largest_loss = min(losses) if losses else 0
-            
-            # حساب عامل الربح
-            gross_profit = sum(wins) if wins else 0
-            gross_loss = abs(sum(losses)) if losses else 0
-            profit_factor = gross_profit / gross_loss if gross_loss > 0 else float('inf')
-            
-            # حساب أقصى انخفاض
-            max_drawdown = self._calculate_max_drawdown(closed_trades)
-            
-            # حساب نسبة شارب
-            sharpe_ratio = self._calculate_sharpe_ratio(closed_trades)
-            
-            # حساب الانتصارات والخسائر المتتالية
-            consecutive_wins, consecutive_losses = self._calculate_consecutive_trades(closed_trades)
-            
-            return PerformanceMetrics(
-                total_trades=total_trades,
-                winning_trades=winning_trades,
-                losing_trades=losing_trades,
-                win_rate=win_rate,
-                total_pnl=total_pnl,
-                total_pnl_percentage=total_pnl_percentage,
-                max_drawdown=max_drawdown,
-                sharpe_ratio=sharpe_ratio,
-                profit_factor=profit_factor,
-                average_win=average_win,
-                average_loss=average_loss,
-                largest_win=largest_win,
-                largest_loss=largest_loss,
-                consecutive_wins=consecutive_wins,
-                consecutive_losses=consecutive_losses
+            window = self._filter_trades_by_date(start_date, end_date)
+            return self._cached(
+                ('metrics', window.start, window.stop),
+                lambda: self._compute_performance_metrics(window)
             )
             
         except Exception as e:
             self.logger.error(f"خطأ في حساب مقاييس الأداء: {e}")
             return PerformanceMetrics(0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
     
+    def _compute_performance_metrics(self, window: slice) -> PerformanceMetrics:
+        """حساب مقاييس الأداء لنطاق من الصفقات"""
+        closed = self.trades.status_mask('closed', window)
+        pnl = self.trades['pnl'][window][closed]
+        pnl_percentage = self.trades['pnl_percentage'][window][closed]
+        signs = np.sign(pnl).astype(np.int8)
+        
+        # السجل الكامل يستخدم المجاميع التراكمية بدلاً من إعادة الجمع
+        if window.start == 0 and window.stop == len(self.trades):
+            totals = self._closed_totals
+        else:
+            totals = _ClosedTotals.from_arrays(pnl, pnl_percentage, signs)
+        
+        if not len(pnl):
+            return PerformanceMetrics(
+                total_trades=0, winning_trades=0, losing_trades=0,
+                win_rate=0, total_pnl=0, total_pnl_percentage=0,
+                max_drawdown=0, sharpe_ratio=0, profit_factor=0,
+                average_win=0, average_loss=0, largest_win=0, largest_loss=0,
+                consecutive_wins=0, consecutive_losses=0
+            )
+        
+        # حساب المقاييس الأساسية
+        total_trades = totals.count
+        winning_trades = totals.wins
+        losing_trades = totals.losses
+        win_rate = (winning_trades / total_trades) * 100 if total_trades > 0 else 0
+        
+        total_pnl = totals.total_pnl
+        total_pnl_percentage = totals.total_pnl_percentage
+        
+        # حساب الأرباح والخسائر
+        gross_profit = totals.gross_profit
+        gross_loss = totals.gross_loss
+        
+        average_win = gross_profit / winning_trades if winning_trades else 0
+        average_loss = -gross_loss / losing_trades if losing_trades else 0
+        largest_win = float(pnl.max()) if winning_trades else 0
+        largest_loss = float(pnl.min()) if losing_trades else 0
+        
+        # حساب عامل الربح
+        profit_factor = gross_profit / gross_loss if gross_loss > 0 else float('inf')
+        
+        # حساب أقصى انخفاض (الصفقات مرتبة مسبقاً حسب وقت الدخول)
+        if window.start == 0 and window.stop == len(self.trades):
+            max_drawdown = self._full_history_max_drawdown()
+        else:
+            max_drawdown = self._calculate_max_drawdown(pnl)
+        
+        # حساب نسبة شارب
+        sharpe_ratio = self._calculate_sharpe_ratio(pnl_percentage)
+        
+        # حساب الانتصارات والخسائر المتتالية
+        consecutive_wins, consecutive_losses = self._calculate_consecutive_trades(pnl, signs)
+        
+        return PerformanceMetrics(
+            total_trades=total_trades,
+            winning_trades=winning_trades,
+            losing_trades=losing_trades,
+            win_rate=win_rate,
+            total_pnl=total_pnl,
+            total_pnl_percentage=total_pnl_percentage,
+            max_drawdown=max_drawdown,
+            sharpe_ratio=sharpe_ratio,
+            profit_factor=profit_factor,
+            average_win=average_win,
+            average_loss=average_loss,
+            largest_win=largest_win,
+            largest_loss=largest_loss,
+            consecutive_wins=consecutive_wins,
+            consecutive_losses=consecutive_losses
+        )
+    
     def generate_daily_report(self, date: datetime = None) -> Dict[str, Any]:
         """توليد تقرير يومي"""
         try:
@@ -220,8 +645,8 @@ class ReportsManager:
             daily_metrics = self.calculate_performance_metrics(start_date, end_date)
             
             # إحصائيات إضافية
-            open_trades = [t for t in daily_trades if t.status == 'open']
-            closed_trades = [t for t in daily_trades if t.status == 'closed']
+            open_trades = int(self.trades.status_mask('open', daily_trades).sum())
+            closed_trades = int(self.trades.status_mask('closed', daily_trades).sum())
             
             # تحليل الرموز
             symbols_analysis = self._analyze_symbols_performance(daily_trades)
@@ -232,9 +657,9 @@ class ReportsManager:
             return {
                 'date': date.strftime('%Y-%m-%d'),
                 'summary': {
-                    'total_trades': len(daily_trades),
-                    'open_trades': len(open_trades),
-                    'closed_trades': len(closed_trades),
+                    'total_trades': self._window_length(daily_trades),
+                    'open_trades': open_trades,
+                    'closed_trades': closed_trades,
                     'daily_pnl': daily_metrics.total_pnl,
                     'daily_pnl_percentage': daily_metrics.total_pnl_percentage,
                     'win_rate': daily_metrics.win_rate
@@ -242,7 +667,7 @@ class ReportsManager:
                 'performance_metrics': daily_metrics.__dict__,
                 'symbols_analysis': symbols_analysis,
                 'strategies_analysis': strategies_analysis,
-                'trades_details': [self._trade_to_dict(t) for t in daily_trades]
+                'trades_details': self._trades_to_records(daily_trades)
             }
             
         except Exception as e:
@@ -264,23 +689,25 @@ class ReportsManager:
             # مقاييس الأداء الأسبوعي
             weekly_metrics = self.calculate_performance_metrics(week_start, week_end)
             
-            # تحليل يومي للأسبوع
+            # تحليل يومي للأسبوع من تجميع واحد (دون توليد تقرير يومي كامل لكل يوم)
+            first_day = week_start.replace(hour=0, minute=0, second=0, microsecond=0)
+            daily_pnl, daily_counts = self._daily_pnl_histogram(first_day, 7)
+            
             daily_analysis = []
-            for i in range(7):
-                day = week_start + timedelta(days=i)
-                day_report = self.generate_daily_report(day)
+            for i, (day_pnl, trades_count) in enumerate(zip(daily_pnl.tolist(), daily_counts.tolist())):
+                day = first_day + timedelta(days=i)
                 daily_analysis.append({
                     'date': day.strftime('%Y-%m-%d'),
                     'day_name': day.strftime('%A'),
-                    'pnl': day_report.get('summary', {}).get('daily_pnl', 0),
-                    'trades_count': day_report.get('summary', {}).get('total_trades', 0)
+                    'pnl': day_pnl,
+                    'trades_count': trades_count
                 })
             
             return {
                 'week_start': week_start.strftime('%Y-%m-%d'),
                 'week_end': week_end.strftime('%Y-%m-%d'),
                 'summary': {
-                    'total_trades': len(weekly_trades),
+                    'total_trades': self._window_length(weekly_trades),
                     'weekly_pnl': weekly_metrics.total_pnl,
                     'weekly_pnl_percentage': weekly_metrics.total_pnl_percentage,
                     'win_rate': weekly_metrics.win_rate,
@@ -317,33 +744,33 @@ class ReportsManager:
             # مقاييس الأداء الشهري
             monthly_metrics = self.calculate_performance_metrics(month_start, month_end)
             
-            # تحليل أسبوعي للشهر
-            weekly_analysis = []
-            current_week_start = month_start
-            week_number = 1
+            # تحليل أسبوعي للشهر: تجميع يومي واحد ثم جمع كل 7 أيام
+            days = (month_end - month_start).days
+            daily_pnl, daily_counts = self._daily_pnl_histogram(month_start, days)
+            week_starts = np.arange(0, days, 7)
+            weekly_pnl = np.add.reduceat(daily_pnl, week_starts)
+            weekly_counts = np.add.reduceat(daily_counts, week_starts)
             
-            while current_week_start < month_end:
+            weekly_analysis = []
+            for week_number, (offset, week_pnl, trades_count) in enumerate(
+                    zip(week_starts.tolist(), weekly_pnl.tolist(), weekly_counts.tolist()), start=1):
+                current_week_start = month_start + timedelta(days=offset)
                 current_week_end = min(current_week_start + timedelta(days=7), month_end)
-                week_trades = self._filter_trades_by_date(current_week_start, current_week_end)
-                week_pnl = sum(t.pnl for t in week_trades if t.status == 'closed')
                 
                 weekly_analysis.append({
                     'week_number': week_number,
                     'start_date': current_week_start.strftime('%Y-%m-%d'),
                     'end_date': current_week_end.strftime('%Y-%m-%d'),
                     'pnl': week_pnl,
-                    'trades_count': len(week_trades)
+                    'trades_count': trades_count
                 })
-                
-                current_week_start = current_week_end
-                week_number += 1
             
             return {
                 'month': month,
                 'year': year,
                 'month_name': month_start.strftime('%B %Y'),
                 'summary': {
-                    'total_trades': len(monthly_trades),
+                    'total_trades': self._window_length(monthly_trades),
                     'monthly_pnl': monthly_metrics.total_pnl,
                     'monthly_pnl_percentage': monthly_metrics.total_pnl_percentage,
                     'win_rate': monthly_metrics.win_rate,
@@ -360,125 +787,125 @@ class ReportsManager:
             self.logger.error(f"خطأ في توليد التقرير الشهري: {e}")
             return {}
     
-    def generate_performance_chart(self, period_days: int = 30) -> str:
-        """توليد رسم بياني للأداء"""
+    def generate_performance_chart(self, period_days: int = 30, return_format: str = 'base64',
+                                   out_path: Optional[str] = None) -> Union[str, bytes]:
+        """توليد رسم بياني للأداء
+        
+        return_format: 'base64' (افتراضي)، 'bytes' لبيانات PNG الخام، أو 'path' للحفظ في out_path
+        """
+        # خطأ استدعاء لا يُخفى كرسم فارغ
+        if return_format == 'path' and not out_path:
+            raise ValueError("out_path مطلوب عند return_format='path'")
+        
         try:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=period_days)
             
-            # الحصول على البيانات اليومية
-            daily_data = []
-            current_date = start_date
-            cumulative_pnl = 0
+            # تجميع الأرباح اليومية في مرور واحد بدلاً من تصفية كل يوم على حدة
+            first_day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            days = period_days + 1  # يشمل اليوم الحالي
+            daily_pnl_values, _ = self._daily_pnl_histogram(first_day, days)
+            cumulative_pnl_values = np.cumsum(daily_pnl_values)
+            dates = [first_day + timedelta(days=i) for i in range(days)]
             
-            while current_date <= end_date:
-                day_start = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                day_end = day_start + timedelta(days=1)
-                
-                day_trades = self._filter_trades_by_date(day_start, day_end)
-                day_pnl = sum(t.pnl for t in day_trades if t.status == 'closed')
-                cumulative_pnl += day_pnl
+            with self._chart_lock:
+                fig = self._render_performance_chart(dates, daily_pnl_values, cumulative_pnl_values)
                 
-                daily_data.append({
-                    'date': current_date.strftime('%Y-%m-%d'),
-                    'daily_pnl': day_pnl,
-                    'cumulative_pnl': cumulative_pnl,
-                    'trades_count': len(day_trades)
-                })
+                if return_format == 'path':
+                    # الكتابة مباشرة إلى الملف دون مخزن وسيط
+                    fig.savefig(out_path, format='png', facecolor='#1a1a2e', dpi=_CHART_DPI, bbox_inches='tight')
+                    return out_path
                 
-                current_date += timedelta(days=1)
-            
-            # إنشاء الرسم البياني
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
-            
-            dates = [datetime.strptime(d['date'], '%Y-%m-%d') for d in daily_data]
-            cumulative_pnl_values = [d['cumulative_pnl'] for d in daily_data]
-            daily_pnl_values = [d['daily_pnl'] for d in daily_data]
-            
-            # الرسم البياني للأرباح التراكمية
-            ax1.plot(dates, cumulative_pnl_values, linewidth=2, color='#00ff88')
-            ax1.fill_between(dates, cumulative_pnl_values, alpha=0.3, color='#00ff88')
-            ax1.set_title('الأرباح والخسائر التراكمية', fontsize=14, fontweight='bold')
-            ax1.set_ylabel('الأرباح/الخسائر ($)', fontsize=12)
-            ax1.grid(True, alpha=0.3)
-            ax1.axhline(y=0, color='white', linestyle='--', alpha=0.5)
-            
-            # الرسم البياني للأرباح اليومية
-            colors = ['#00ff88' if pnl >= 0 else '#ff4444' for pnl in daily_pnl_values]
-            ax2.bar(dates, daily_pnl_values, color=colors, alpha=0.7)
-            ax2.set_title('الأرباح والخسائر اليومية', fontsize=14, fontweight='bold')
-            ax2.set_ylabel('الأرباح/الخسائر اليومية ($)', fontsize=12)
-            ax2.set_xlabel('التاريخ', fontsize=12)
-            ax2.grid(True, alpha=0.3)
-            ax2.axhline(y=0, color='white', linestyle='-', alpha=0.5)
-            
-            # تنسيق التواريخ
-            fig.autofmt_xdate()
-            
-            # تطبيق الثيم الداكن
-            fig.patch.set_facecolor('#1a1a2e')
-            for ax in [ax1, ax2]:
-                ax.set_facecolor('#16213e')
-                ax.tick_params(colors='white')
-                ax.xaxis.label.set_color('white')
-                ax.yaxis.label.set_color('white')
-                ax.title.set_color('white')
-                ax.spines['bottom'].set_color('white')
-                ax.spines['top'].set_color('white')
-                ax.spines['right'].set_color('white')
-                ax.spines['left'].set_color('white')
+                buffer = BytesIO()
+                fig.savefig(buffer, format='png', facecolor='#1a1a2e', dpi=_CHART_DPI, bbox_inches='tight')
             
-            plt.tight_layout()
+            if return_format == 'bytes':
+                return buffer.getvalue()
             
-            # حفظ الرسم كـ base64
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png', facecolor='#1a1a2e', dpi=150, bbox_inches='tight')
-            buffer.seek(0)
-            
-            chart_base64 = base64.b64encode(buffer.getvalue()).decode()
-            plt.close()
-            
-            return chart_base64
+            return base64.b64encode(buffer.getvalue()).decode()
             
         except Exception as e:
             self.logger.error(f"خطأ في توليد الرسم البياني: {e}")
             return ""
     
+    def _get_chart_figure(self) -> Tuple[Figure, Any, Any]:
+        """إرجاع شكل الرسم البياني المشترك بعد مسح محاوره (يُنشأ عند أول استخدام)"""
+        if self._chart_fig is None:
+            # Figure مباشرة دون pyplot حتى لا يُسجَّل في مدير الأشكال العام
+            fig = Figure(figsize=(12, 8))
+            ax1, ax2 = fig.subplots(2, 1)
+            
+            # أجزاء الثيم الداكن التي لا يعيد مسح المحاور ضبطها
+            fig.patch.set_facecolor('#1a1a2e')
+            for ax in (ax1, ax2):
+                for spine in ax.spines.values():
+                    spine.set_color('white')
+            
+            self._chart_fig = fig
+            self._chart_axes = (ax1, ax2)
+        else:
+            for ax in self._chart_axes:
+                ax.clear()
+        
+        ax1, ax2 = self._chart_axes
+        return self._chart_fig, ax1, ax2
+    
+    def _render_performance_chart(self, dates: List[datetime], daily_pnl_values: np.ndarray,
+                                  cumulative_pnl_values: np.ndarray) -> Figure:
+        """رسم الأداء على الشكل المشترك"""
+        fig, ax1, ax2 = self._get_chart_figure()
+        
+        # الرسم البياني للأرباح التراكمية
+        ax1.plot(dates, cumulative_pnl_values, linewidth=2, color='#00ff88')
+        ax1.fill_between(dates, cumulative_pnl_values, alpha=0.3, color='#00ff88')
+        ax1.set_title('الأرباح والخسائر التراكمية', fontsize=14, fontweight='bold')
+        ax1.set_ylabel('الأرباح/الخسائر ($)', fontsize=12)
+        ax1.grid(True, alpha=0.3)
+        ax1.axhline(y=0, color='white', linestyle='--', alpha=0.5)
+        
+        # الرسم البياني للأرباح اليومية
+        colors = ['#00ff88' if pnl >= 0 else '#ff4444' for pnl in daily_pnl_values]
+        ax2.bar(dates, daily_pnl_values, color=colors, alpha=0.7)
+        ax2.set_title('الأرباح والخسائر اليومية', fontsize=14, fontweight='bold')
+        ax2.set_ylabel('الأرباح/الخسائر اليومية ($)', fontsize=12)
+        ax2.set_xlabel('التاريخ', fontsize=12)
+        ax2.grid(True, alpha=0.3)
+        ax2.axhline(y=0, color='white', linestyle='-', alpha=0.5)
+        
+        # تنسيق التواريخ
+        fig.autofmt_xdate()
+        
+        # تطبيق الثيم الداكن (مسح المحاور يعيد هذه القيم إلى الافتراضي)
+        for ax in (ax1, ax2):
+            ax.set_facecolor('#16213e')
+            ax.tick_params(colors='white')
+            ax.xaxis.label.set_color('white')
+            ax.yaxis.label.set_color('white')
+            ax.title.set_color('white')
+        
+        fig.tight_layout()
+        
+        return fig
+    
     def export_trades_to_csv(self, start_date: datetime = None, end_date: datetime = None) -> str:
         """تصدير الصفقات إلى ملف CSV"""
         try:
-            filtered_trades = self._filter_trades_by_date(start_date, end_date)
+            window = self._filter_trades_by_date(start_date, end_date)
             
-            if not filtered_trades:
+            if not self._window_length(window):
                 return ""
             
-            # تحويل إلى DataFrame
-            trades_data = []
-            for trade in filtered_trades:
-                trades_data.append({
-                    'ID': trade.id,
-                    'الرمز': trade.symbol,
-                    'الجهة': trade.side,
-                    'وقت الدخول': trade.entry_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'وقت الخروج': trade.exit_time.strftime('%Y-%m-%d %H:%M:%S') if trade.exit_time else '',
-                    'سعر الدخول': trade.entry_price,
-                    'سعر الخروج': trade.exit_price or '',
-                    'الكمية': trade.quantity,
-                    'الربح/الخسارة': trade.pnl,
-                    'النسبة المئوية': trade.pnl_percentage,
-                    'الرسوم': trade.fees,
-                    'الاستراتيجية': trade.strategy,
-                    'الحالة': trade.status
-                })
-            
-            df = pd.DataFrame(trades_data)
+            columns = self._trades_slice_to_columns(window)
             
             # حفظ الملف
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f"trades_export_{timestamp}.csv"
             filepath = os.path.join(self.data_dir, filename)
             
-            df.to_csv(filepath, index=False, encoding='utf-8-sig')
+            if PYARROW_AVAILABLE:
+                self._write_trades_csv_arrow(columns, filepath)
+            else:
+                self._write_trades_csv_pandas(columns, filepath)
             
             self.logger.info(f"تم تصدير الصفقات إلى: {filepath}")
             return filepath
@@ -487,64 +914,160 @@ class ReportsManager:
             self.logger.error(f"خطأ في تصدير الصفقات: {e}")
             return ""
     
-    def _load_trades(self) -> List[TradeRecord]:
-        """تحميل الصفقات من الملف"""
+    def _write_trades_csv_arrow(self, columns: Dict[str, np.ndarray], filepath: str):
+        """كتابة CSV مباشرة من الأعمدة عبر كاتب PyArrow"""
+        exit_price = columns['exit_price']
+        
+        def format_times(times: np.ndarray) -> 'pa.Array':
+            seconds = pa.array(times.astype('datetime64[s]'), mask=np.isnat(times))
+            return pc.strftime(seconds, format='%Y-%m-%d %H:%M:%S')
+        
+        table = pa.table({
+            'ID': pa.array(columns['id'], type=pa.string()),
+            'الرمز': pa.array(columns['symbol'], type=pa.string()),
+            'الجهة': pa.array(columns['side'], type=pa.string()),
+            'وقت الدخول': format_times(columns['entry_time']),
+            'وقت الخروج': format_times(columns['exit_time']),
+            'سعر الدخول': columns['entry_price'],
+            'سعر الخروج': pa.array(exit_price, mask=np.isnan(exit_price) | (exit_price == 0)),
+            'الكمية': columns['quantity'],
+            'الربح/الخسارة': columns['pnl'],
+            'النسبة المئوية': columns['pnl_percentage'],
+            'الرسوم': columns['fees'],
+            'الاستراتيجية': pa.array(columns['strategy'], type=pa.string()),
+            'الحالة': pa.array(columns['status'], type=pa.string())
+        })
+        
+        # BOM في البداية ليتعرف Excel على الترميز كما في utf-8-sig
+        with open(filepath, 'wb') as f:
+            f.write(codecs.BOM_UTF8)
+            pa_csv.write_csv(table, f)
+    
+    def _write_trades_csv_pandas(self, columns: Dict[str, np.ndarray], filepath: str):
+        """كتابة CSV عبر pandas عند عدم توفر PyArrow"""
+        exit_price = columns['exit_price']
+        
+        df = pd.DataFrame({
+            'ID': columns['id'],
+            'الرمز': columns['symbol'],
+            'الجهة': columns['side'],
+            'وقت الدخول': pd.Series(columns['entry_time']).dt.strftime('%Y-%m-%d %H:%M:%S'),
+            'وقت الخروج': pd.Series(columns['exit_time']).dt.strftime('%Y-%m-%d %H:%M:%S').fillna(''),
+            'سعر الدخول': columns['entry_price'],
+            'سعر الخروج': np.where(np.isnan(exit_price) | (exit_price == 0), '', exit_price.astype(object)),
+            'الكمية': columns['quantity'],
+            'الربح/الخسارة': columns['pnl'],
+            'النسبة المئوية': columns['pnl_percentage'],
+            'الرسوم': columns['fees'],
+            'الاستراتيجية': columns['strategy'],
+            'الحالة': columns['status']
+        })
+        
+        df.to_csv(filepath, index=False, encoding='utf-8-sig')
+    
+    @staticmethod
+    def _parse_update(update_data: Dict[str, Any]) -> Dict[str, Any]:
+        """تحليل حقول التحديث إلى قيمها النهائية دون تعديل أي صفقة"""
+        fields = {}
+        if 'exit_time' in update_data:
+            fields['exit_time'] = datetime.fromisoformat(update_data['exit_time'])
+        if 'exit_price' in update_data:
+            fields['exit_price'] = float(update_data['exit_price'])
+        if 'pnl' in update_data:
+            fields['pnl'] = float(update_data['pnl'])
+        if 'pnl_percentage' in update_data:
+            fields['pnl_percentage'] = float(update_data['pnl_percentage'])
+        if 'status' in update_data:
+            fields['status'] = update_data['status']
+        if 'fees' in update_data:
+            fields['fees'] = float(update_data['fees'])
+        return fields
+    
+    @classmethod
+    def _apply_update(cls, trades: _TradesColumns, i: int, update_data: Dict[str, Any]):
+        """تطبيق حقول التحديث على صفقة"""
+        for field, value in cls._parse_update(update_data).items():
+            trades.set_value(i, field, value)
+    
+    def _load_trades(self) -> _TradesColumns:
+        """تحميل الصفقات من الملف (اللقطة الكاملة ثم سجل العمليات اللاحقة)"""
         try:
-            if os.path.exists(self.trades_file):
-                with open(self.trades_file, 'r', encoding='utf-8') as f:
-                    trades_data = json.load(f)
-                
-                trades = []
-                for trade_dict in trades_data:
-                    trade = TradeRecord(
-                        id=trade_dict['id'],
-                        symbol=trade_dict['symbol'],
-                        side=trade_dict['side'],
-                        entry_time=datetime.fromisoformat(trade_dict['entry_time']),
-                        exit_time=datetime.fromisoformat(trade_dict['exit_time']) if trade_dict.get('exit_time') else None,
-                        entry_price=trade_dict['entry_price'],
-                        exit_price=trade_dict.get('exit_price'),
-                        quantity=trade_dict['quantity'],
-                        pnl=trade_dict['pnl'],
-                        pnl_percentage=trade_dict['pnl_percentage'],
-                        fees=trade_dict['fees'],
-                        strategy=trade_dict['strategy'],
-                        status=trade_dict['status']
-                    )
-                    trades.append(trade)
-                
-                return trades
-            
-            return []
+            return self._replay_journal(self._load_snapshot())
             
         except Exception as e:
             self.logger.error(f"خطأ في تحميل الصفقات: {e}")
-            return []
+            return _TradesColumns()
+    
+    def _load_snapshot(self) -> _TradesColumns:
+        """تحميل اللقطة الكاملة للصفقات"""
+        # التخزين العمودي يُحمَّل مباشرة إلى الأعمدة؛ JSON للتوافق مع الإصدارات السابقة
+        if PYARROW_AVAILABLE and os.path.exists(self.trades_parquet_file):
+            return _TradesColumns.from_arrow(pq.read_table(self.trades_parquet_file))
+        
+        if os.path.exists(self.trades_file):
+            # قراءة عمودية مباشرة؛ التواريخ تُحلَّل في from_frame
+            frame = pd.read_json(self.trades_file, dtype=False, convert_dates=False, precise_float=True)
+            if len(frame):
+                return _TradesColumns.from_frame(frame)
+        
+        return _TradesColumns()
+    
+    def _replay_journal(self, trades: _TradesColumns) -> _TradesColumns:
+        """إعادة تطبيق عمليات السجل على اللقطة المحملة"""
+        if not os.path.exists(self.trades_journal_file) or os.path.getsize(self.trades_journal_file) == 0:
+            return trades
+        
+        journal = pd.read_json(self.trades_journal_file, lines=True, dtype=False, convert_dates=False, precise_float=True)
+        self._journal_entries = len(journal)
+        ops = journal['op']
+        
+        # الإضافات تُدمج دفعة واحدة؛ الموجودة في اللقطة تُتجاهل (انقطاع بين كتابة اللقطة وتفريغ السجل)
+        if (ops == 'add').any():
+            added = pd.DataFrame(journal.loc[ops == 'add', 'trade'].tolist())
+            added = added[~added['id'].isin(trades.ids)].drop_duplicates('id')
+            if len(added):
+                trades.extend(_TradesColumns.from_frame(added))
+        
+        # التحديث يأتي دائماً بعد إضافة الصفقة نفسها فيكفي تطبيقه بعد الدمج
+        if (ops == 'update').any():
+            positions = {trade_id: i for i, trade_id in enumerate(trades.ids)}
+            updates = journal[ops == 'update']
+            for trade_id, fields in zip(updates['id'].tolist(), updates['fields'].tolist()):
+                i = positions.get(trade_id)
+                if i is not None:
+                    self._apply_update(trades, i, fields)
+        
+        return trades
+    
+    def _append_journal(self, entry: Dict[str, Any]):
+        """إلحاق عملية بسجل الصفقات (JSONL) بدلاً من إعادة كتابة الملف كاملاً"""
+        try:
+            with open(self.trades_journal_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            
+            self._journal_entries += 1
+            if self._journal_entries >= _JOURNAL_COMPACT_EVERY:
+                self._save_trades()
+                
+        except Exception as e:
+            self.logger.error(f"خطأ في حفظ الصفقات: {e}")
     
     def _save_trades(self):
-        """حفظ الصفقات إلى الملف"""
+        """حفظ لقطة كاملة للصفقات ثم تفريغ سجل العمليات"""
         try:
-            trades_data = []
-            for trade in self.trades:
-                trade_dict = {
-                    'id': trade.id,
-                    'symbol': trade.symbol,
-                    'side': trade.side,
-                    'entry_time': trade.entry_time.isoformat(),
-                    'exit_time': trade.exit_time.isoformat() if trade.exit_time else None,
-                    'entry_price': trade.entry_price,
-                    'exit_price': trade.exit_price,
-                    'quantity': trade.quantity,
-                    'pnl': trade.pnl,
-                    'pnl_percentage': trade.pnl_percentage,
-                    'fees': trade.fees,
-                    'strategy': trade.strategy,
-                    'status': trade.status
-                }
-                trades_data.append(trade_dict)
-            
-            with open(self.trades_file, 'w', encoding='utf-8') as f:
-                json.dump(trades_data, f, ensure_ascii=False, indent=2)
+            # الكتابة إلى ملف مؤقت ثم استبداله: انقطاع أثناء الكتابة يترك اللقطة السابقة والسجل سليمين
+            if PYARROW_AVAILABLE:
+                path = self.trades_parquet_file
+                pq.write_table(self.trades.to_arrow(), path + '.tmp', compression='zstd')
+            else:
+                path = self.trades_file
+                with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(self._trades_to_records(slice(None)), f, ensure_ascii=False, indent=2)
+            os.replace(path + '.tmp', path)
+            
+            # اللقطة تتضمن كل العمليات السابقة (تُفرَّغ فقط بعد استبدال اللقطة)
+            open(self.trades_journal_file, 'w').close()
+            self._journal_entries = 0
                 
         except Exception as e:
             self.logger.error(f"خطأ في حفظ الصفقات: {e}")
@@ -561,158 +1084,280 @@ class ReportsManager:
             return []
     
     def _filter_trades_by_date(self, start_date: Optional[datetime], 
-                              end_date: Optional[datetime]) -> List[TradeRecord]:
-        """تصفية الصفقات حسب التاريخ"""
-        filtered_trades = self.trades
+                              end_date: Optional[datetime]) -> slice:
+        """تصفية الصفقات حسب التاريخ (نطاق من الأعمدة المرتبة حسب وقت الدخول)"""
+        entry_times = self.trades['entry_time_ns']
+        
+        # الحد المفقود يُستبدل بأقصى قيمة ممكنة ليُحسب الطرفان ببحث ثنائي واحد
+        bounds = np.array([
+            _datetime_to_ns(start_date) if start_date else _NAT,
+            _datetime_to_ns(end_date) if end_date else np.iinfo(np.int64).max
+        ], dtype=np.int64)
+        start, stop = np.searchsorted(entry_times, bounds, side='left').tolist()
+        
+        return slice(start, max(start, stop))
+    
+    def _compute_closed_totals(self, window: slice) -> _ClosedTotals:
+        """مجاميع الصفقات المغلقة في النطاق"""
+        closed = self.trades.status_mask('closed', window)
+        return _ClosedTotals.from_arrays(
+            self.trades['pnl'][window][closed],
+            self.trades['pnl_percentage'][window][closed]
+        )
+    
+    def _apply_trade_totals(self, index: int, sign: int):
+        """إضافة مساهمة صفقة إلى مجاميع السجل الكامل (sign=1) أو طرحها (sign=-1)"""
+        trades = self.trades
+        pnl = float(trades['pnl'][index])
         
-        if start_date:
-            filtered_trades = [t for t in filtered_trades if t.entry_time >= start_date]
+        if trades.statuses[trades['status_code'][index]] == 'closed':
+            self._closed_totals.apply(pnl, float(trades['pnl_percentage'][index]), sign)
         
-        if end_date:
-            filtered_trades = [t for t in filtered_trades if t.entry_time < end_date]
+        volume = float(trades['quantity'][index] * trades['entry_price'][index])
+        for kind, names, code in (('symbol', trades.symbols, trades['symbol_code'][index]),
+                                  ('strategy', trades.strategies, trades['strategy_code'][index])):
+            groups = self._group_totals[kind]
+            name = names[code]
+            group = groups.setdefault(name, {
+                'total_trades': 0, 'winning_trades': 0, 'total_pnl': 0.0, 'total_volume': 0.0, 'win_rate': 0
+            })
+            group['total_trades'] += sign
+            group['total_pnl'] += sign * pnl
+            group['total_volume'] += sign * volume
+            if pnl > 0:
+                group['winning_trades'] += sign
+            
+            if group['total_trades'] <= 0:
+                del groups[name]
+            else:
+                group['win_rate'] = group['winning_trades'] / group['total_trades'] * 100
+    
+    def _cached(self, key: Tuple, compute):
+        """إرجاع نتيجة مخزنة للمفتاح في الإصدار الحالي أو حسابها وتخزينها"""
+        key = key + (self._version,)
+        cache = self._analytics_cache
         
-        return filtered_trades
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        
+        value = compute()
+        cache[key] = value
+        if len(cache) > _ANALYTICS_CACHE_SIZE:
+            cache.popitem(last=False)
+        return value
     
-    def _calculate_max_drawdown(self, trades: List[TradeRecord]) -> float:
-        """حساب أقصى انخفاض"""
-        if not trades:
-            return 0
+    def _daily_pnl_histogram(self, first_day: datetime, days: int) -> Tuple[np.ndarray, np.ndarray]:
+        """أرباح الصفقات المغلقة وعدد الصفقات لكل يوم بدءاً من first_day"""
+        window = self._filter_trades_by_date(first_day, first_day + timedelta(days=days))
+        day_index = (self.trades['entry_time_ns'][window] - _datetime_to_ns(first_day)) // _DAY_NS
+        closed = self.trades.status_mask('closed', window)
         
-        cumulative_pnl = 0
-        peak = 0
-        max_drawdown = 0
+        daily_pnl = np.bincount(day_index[closed], weights=self.trades['pnl'][window][closed], minlength=days)
+        daily_counts = np.bincount(day_index, minlength=days)
+        return daily_pnl, daily_counts
+    
+    @staticmethod
+    def _window_length(window: slice) -> int:
+        """عدد الصفقات في النطاق"""
+        return window.stop - window.start
+    
+    def _closed_pnl(self, window: slice) -> float:
+        """مجموع أرباح الصفقات المغلقة في النطاق"""
+        return self._cached(
+            ('closed_pnl', window.start, window.stop),
+            lambda: float(self.trades['pnl'][window][self.trades.status_mask('closed', window)].sum())
+        )
+    
+    def _full_history_max_drawdown(self) -> float:
+        """أقصى انخفاض للسجل الكامل من المنحنى التراكمي المخزن"""
+        if self._curve_version != self._version:
+            # الصفقات غير المغلقة تساهم بصفر فلا تغيّر المنحنى
+            closed_pnl = np.where(self.trades.status_mask('closed'), self.trades['pnl'], 0.0)
+            cumulative = np.cumsum(closed_pnl)
+            peaks = np.maximum.accumulate(np.maximum(cumulative, 0))
+            
+            self._curve = np.empty((2, max(64, 2 * cumulative.size)))
+            self._curve[0, :cumulative.size] = cumulative
+            self._curve[1, :cumulative.size] = peaks
+            self._curve_size = cumulative.size
+            self._curve_max_drawdown = float((peaks - cumulative).max()) if cumulative.size else 0.0
+            self._curve_version = self._version
         
-        for trade in sorted(trades, key=lambda x: x.entry_time):
-            cumulative_pnl += trade.pnl
-            
-            if cumulative_pnl > peak:
-                peak = cumulative_pnl
-            
-            drawdown = peak - cumulative_pnl
-            if drawdown > max_drawdown:
-                max_drawdown = drawdown
+        return self._curve_max_drawdown
+    
+    def _extend_equity_curve(self, pos: int):
+        """تمديد المنحنى التراكمي بصفقة أُضيفت في نهاية السجل (O(1) بدلاً من إعادة الحساب)"""
+        # الإدراج في منتصف السجل يغيّر ما بعده، فيُترك المنحنى ليُعاد حسابه عند الطلب
+        if self._curve_version != self._version or pos != self._curve_size:
+            return
         
-        return max_drawdown
+        if self._curve_size == self._curve.shape[1]:
+            grown = np.empty((2, max(64, 2 * self._curve_size)))
+            grown[:, :self._curve_size] = self._curve[:, :self._curve_size]
+            self._curve = grown
+        
+        last_cumulative = self._curve[0, pos - 1] if pos else 0.0
+        last_peak = self._curve[1, pos - 1] if pos else 0.0
+        closed = self.trades.statuses[self.trades['status_code'][pos]] == 'closed'
+        
+        cumulative = last_cumulative + (float(self.trades['pnl'][pos]) if closed else 0.0)
+        peak = max(last_peak, cumulative)
+        
+        self._curve[0, pos] = cumulative
+        self._curve[1, pos] = peak
+        self._curve_size += 1
+        self._curve_max_drawdown = max(self._curve_max_drawdown, peak - cumulative)
+        
+        # المنحنى صالح للإصدار التالي الذي تنشئه هذه الإضافة
+        self._curve_version = self._version + 1
     
-    def _calculate_sharpe_ratio(self, trades: List[TradeRecord]) -> float:
-        """حساب نسبة شارب"""
-        if not trades:
+    def _calculate_max_drawdown(self, pnl: np.ndarray) -> float:
+        """حساب أقصى انخفاض"""
+        if not len(pnl):
             return 0
         
-        returns = [t.pnl_percentage for t in trades]
+        if NUMBA_AVAILABLE and pnl.size > _NUMBA_MIN_SIZE:
+            return float(_max_drawdown_kernel(pnl))
         
-        if len(returns) < 2:
+        # القمة تبدأ من صفر كما في الحساب التراكمي الأصلي
+        cumulative_pnl = np.cumsum(pnl)
+        peak = np.maximum.accumulate(np.maximum(cumulative_pnl, 0))
+        return float((peak - cumulative_pnl).max())
+    
+    def _calculate_sharpe_ratio(self, returns: np.ndarray) -> float:
+        """حساب نسبة شارب"""
+        if returns.size < 2:
             return 0
         
-        mean_return = np.mean(returns)
-        std_return = np.std(returns)
+        if NUMBA_AVAILABLE and returns.size > _NUMBA_MIN_SIZE:
+            mean_return, std_return = _mean_std_kernel(returns)
+            if std_return == 0:
+                return 0
+            return float((mean_return - _RISK_FREE_RATE) / std_return)
+        
+        # المتوسط يُحسب مرة واحدة ويُعاد استخدامه للانحراف المعياري (بدلاً من np.std)
+        mean_return = float(returns.mean())
+        deviations = returns - mean_return
+        std_return = float(np.sqrt(np.dot(deviations, deviations) / returns.size))
         
         if std_return == 0:
             return 0
         
-        # افتراض معدل خالي من المخاطر 2%
-        risk_free_rate = 2.0
-        
-        return (mean_return - risk_free_rate) / std_return
+        return (mean_return - _RISK_FREE_RATE) / std_return
     
-    def _calculate_consecutive_trades(self, trades: List[TradeRecord]) -> Tuple[int, int]:
+    def _calculate_consecutive_trades(self, pnl: np.ndarray,
+                                      signs: Optional[np.ndarray] = None) -> Tuple[int, int]:
         """حساب الصفقات المتتالية الرابحة والخاسرة"""
-        if not trades:
+        if not len(pnl):
             return 0, 0
         
-        sorted_trades = sorted(trades, key=lambda x: x.entry_time)
-        
-        max_consecutive_wins = 0
-        max_consecutive_losses = 0
-        current_consecutive_wins = 0
-        current_consecutive_losses = 0
-        
-        for trade in sorted_trades:
-            if trade.pnl > 0:
-                current_consecutive_wins += 1
-                current_consecutive_losses = 0
-                max_consecutive_wins = max(max_consecutive_wins, current_consecutive_wins)
-            elif trade.pnl < 0:
-                current_consecutive_losses += 1
-                current_consecutive_wins = 0
-                max_consecutive_losses = max(max_consecutive_losses, current_consecutive_losses)
-            else:
-                current_consecutive_wins = 0
-                current_consecutive_losses = 0
+        if NUMBA_AVAILABLE and pnl.size > _NUMBA_MIN_SIZE:
+            max_consecutive_wins, max_consecutive_losses = _consecutive_kernel(pnl)
+            return int(max_consecutive_wins), int(max_consecutive_losses)
+        
+        # ترميز طول التسلسلات (RLE) على إشارة الربح: 1 ربح، -1 خسارة، 0 تعادل
+        if signs is None:
+            signs = np.sign(pnl).astype(np.int8)
+        boundaries = np.r_[0, np.flatnonzero(np.diff(signs)) + 1, signs.size]
+        run_lengths = np.diff(boundaries)
+        run_signs = signs[boundaries[:-1]]
+        
+        max_consecutive_wins = int(run_lengths[run_signs == 1].max(initial=0))
+        max_consecutive_losses = int(run_lengths[run_signs == -1].max(initial=0))
         
         return max_consecutive_wins, max_consecutive_losses
     
-    def _analyze_symbols_performance(self, trades: List[TradeRecord]) -> Dict[str, Any]:
-        """تحليل أداء الرموز"""
-        symbols_data = {}
+    def _group_performance(self, codes: np.ndarray, names: List[str], window: slice) -> Dict[str, Any]:
+        """تجميع الأداء حسب عمود مُرمَّز (رمز أو استراتيجية)"""
+        codes = codes[window]
+        if not codes.size:
+            return {}
         
-        for trade in trades:
-            if trade.symbol not in symbols_data:
-                symbols_data[trade.symbol] = {
-                    'total_trades': 0,
-                    'winning_trades': 0,
-                    'total_pnl': 0,
-                    'total_volume': 0
-                }
-            
-            symbols_data[trade.symbol]['total_trades'] += 1
-            symbols_data[trade.symbol]['total_pnl'] += trade.pnl
-            symbols_data[trade.symbol]['total_volume'] += trade.quantity * trade.entry_price
-            
-            if trade.pnl > 0:
-                symbols_data[trade.symbol]['winning_trades'] += 1
+        # الرموز أرقام صغيرة متتالية، فيكفي bincount دون ترتيب
+        pnl = self.trades['pnl'][window]
+        volume = self.trades['quantity'][window] * self.trades['entry_price'][window]
+        groups = len(names)
+        
+        totals = np.bincount(codes, minlength=groups)
+        total_pnl = np.bincount(codes, weights=pnl, minlength=groups)
+        total_volume = np.bincount(codes, weights=volume, minlength=groups)
+        winning = np.bincount(codes, weights=pnl > 0, minlength=groups).astype(np.int64)
         
-        # حساب معدل الفوز لكل رمز
-        for symbol in symbols_data:
-            total = symbols_data[symbol]['total_trades']
-            winning = symbols_data[symbol]['winning_trades']
-            symbols_data[symbol]['win_rate'] = (winning / total * 100) if total > 0 else 0
+        group_codes = np.flatnonzero(totals)
+        totals = totals[group_codes]
+        total_pnl = total_pnl[group_codes]
+        total_volume = total_volume[group_codes]
+        winning = winning[group_codes]
         
-        return symbols_data
+        groups_data = {}
+        for code, total, wins, group_pnl, group_volume in zip(
+                group_codes.tolist(), totals.tolist(), winning.tolist(),
+                total_pnl.tolist(), total_volume.tolist()):
+            groups_data[names[code]] = {
+                'total_trades': total,
+                'winning_trades': wins,
+                'total_pnl': group_pnl,
+                'total_volume': group_volume,
+                'win_rate': (wins / total * 100) if total > 0 else 0
+            }
+        
+        return groups_data
+    
+    def _analyze_symbols_performance(self, window: slice) -> Dict[str, Any]:
+        """تحليل أداء الرموز"""
+        if window.start == 0 and window.stop == len(self.trades):
+            # نسخ حتى لا يعدّل المستدعي المجاميع التراكمية
+            return {name: dict(group) for name, group in self._group_totals['symbol'].items()}
+        
+        return self._cached(
+            ('symbols', window.start, window.stop),
+            lambda: self._group_performance(self.trades['symbol_code'], self.trades.symbols, window)
+        )
     
-    def _analyze_strategies_performance(self, trades: List[TradeRecord]) -> Dict[str, Any]:
+    def _analyze_strategies_performance(self, window: slice) -> Dict[str, Any]:
         """تحليل أداء الاستراتيجيات"""
-        strategies_data = {}
-        
-        for trade in trades:
-            if trade.strategy not in strategies_data:
-                strategies_data[trade.strategy] = {
-                    'total_trades': 0,
-                    'winning_trades': 0,
-                    'total_pnl': 0,
-                    'total_volume': 0
-                }
-            
-            strategies_data[trade.strategy]['total_trades'] += 1
-            strategies_data[trade.strategy]['total_pnl'] += trade.pnl
-            strategies_data[trade.strategy]['total_volume'] += trade.quantity * trade.entry_price
-            
-            if trade.pnl > 0:
-                strategies_data[trade.strategy]['winning_trades'] += 1
-        
-        # حساب معدل الفوز لكل استراتيجية
-        for strategy in strategies_data:
-            total = strategies_data[strategy]['total_trades']
-            winning = strategies_data[strategy]['winning_trades']
-            strategies_data[strategy]['win_rate'] = (winning / total * 100) if total > 0 else 0
-        
-        return strategies_data
-    
-    def _trade_to_dict(self, trade: TradeRecord) -> Dict[str, Any]:
-        """تحويل سجل الصفقة إلى قاموس"""
+        if window.start == 0 and window.stop == len(self.trades):
+            # نسخ حتى لا يعدّل المستدعي المجاميع التراكمية
+            return {name: dict(group) for name, group in self._group_totals['strategy'].items()}
+        
+        return self._cached(
+            ('strategies', window.start, window.stop),
+            lambda: self._group_performance(self.trades['strategy_code'], self.trades.strategies, window)
+        )
+    
+    def _trades_slice_to_columns(self, window: slice) -> Dict[str, np.ndarray]:
+        """أعمدة نطاق من الصفقات (النصوص المُرمَّزة تُفك دفعة واحدة)"""
+        trades = self.trades
+        
         return {
-            'id': trade.id,
-            'symbol': trade.symbol,
-            'side': trade.side,
-            'entry_time': trade.entry_time.isoformat(),
-            'exit_time': trade.exit_time.isoformat() if trade.exit_time else None,
-            'entry_price': trade.entry_price,
-            'exit_price': trade.exit_price,
-            'quantity': trade.quantity,
-            'pnl': trade.pnl,
-            'pnl_percentage': trade.pnl_percentage,
-            'fees': trade.fees,
-            'strategy': trade.strategy,
-            'status': trade.status
+            'id': np.array(trades.ids[window], dtype=object),
+            'symbol': np.array(trades.symbols, dtype=object)[trades['symbol_code'][window]],
+            'side': np.array(trades.sides, dtype=object)[trades['side_code'][window]],
+            # قيمة _NAT هي نفسها تمثيل NaT في datetime64
+            'entry_time': trades['entry_time_ns'][window].view('datetime64[ns]'),
+            'exit_time': trades['exit_time_ns'][window].view('datetime64[ns]'),
+            'entry_price': trades['entry_price'][window],
+            'exit_price': trades['exit_price'][window],
+            'quantity': trades['quantity'][window],
+            'pnl': trades['pnl'][window],
+            'pnl_percentage': trades['pnl_percentage'][window],
+            'fees': trades['fees'][window],
+            'strategy': np.array(trades.strategies, dtype=object)[trades['strategy_code'][window]],
+            'status': np.array(trades.statuses, dtype=object)[trades['status_code'][window]]
         }
-
+    
+    def _trades_to_records(self, window: slice) -> List[Dict[str, Any]]:
+        """تحويل نطاق من الصفقات إلى قواميس للاستجابة دون بناء سجلات وسيطة"""
+        columns = self._trades_slice_to_columns(window)
+        
+        for name in ('entry_time', 'exit_time'):
+            times = columns[name]
+            columns[name] = np.where(np.isnat(times), None, np.datetime_as_string(times, unit='us'))
+        
+        exit_price = columns['exit_price']
+        columns['exit_price'] = np.where(np.isnan(exit_price), None, exit_price.astype(object))
+        
+        # tolist يحوّل كل عمود إلى قيم Python دفعة واحدة، ثم تُجمع الصفوف بـ zip
+        names = list(columns)
+        return [dict(zip(names, row)) for row in zip(*(column.tolist() for column in columns.values()))]
@@ -7,45 +7,71 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
-from enum import Enum
+from enum import IntEnum
+import os
 import json
-import uuid
-from dataclasses import dataclass, asdict
+import heapq
+import itertools
+from dataclasses import dataclass
 import threading
 import time
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
-class OrderType(Enum):
+
+class _CodedEnum(IntEnum):
+    """
+    تعداد برموز صحيحة لمقارنات سريعة، مع قبول الأسماء النصية وإرجاعها في الواجهة
+    """
+    
+    @classmethod
+    def _missing_(cls, value):
+        # OrderSide("buy") وما شابه كما في الإصدارات السابقة
+        if isinstance(value, str):
+            return cls.__members__.get(value.upper())
+        return None
+    
+    @property
+    def label(self) -> str:
+        """الاسم النصي المستخدم في الواجهة"""
+        return self.name.lower()
+
+
+class OrderType(_CodedEnum):
     """أنواع الأوامر"""
-    MARKET = "market"
-    LIMIT = "limit"
-    STOP = "stop"
-    STOP_LIMIT = "stop_limit"
-    OCO = "oco"  # One-Cancels-the-Other
-    TRAIL = "trail"
-    BREAK_EVEN = "break_even"
+    MARKET = 0
+    LIMIT = 1
+    STOP = 2
+    STOP_LIMIT = 3
+    OCO = 4  # One-Cancels-the-Other
+    TRAIL = 5
+    BREAK_EVEN = 6
 
 
-class OrderSide(Enum):
+class OrderSide(_CodedEnum):
     """جهة الأمر"""
-    BUY = "buy"
-    SELL = "sell"
+    BUY = 0
+    SELL = 1
 
 
-class OrderStatus(Enum):
+class OrderStatus(_CodedEnum):
     """حالة الأمر"""
-    PENDING = "pending"
-    OPEN = "open"
-    FILLED = "filled"
-    PARTIALLY_FILLED = "partially_filled"
-    CANCELLED = "cancelled"
-    REJECTED = "rejected"
+    PENDING = 0
+    OPEN = 1
+    FILLED = 2
+    PARTIALLY_FILLED = 3
+    CANCELLED = 4
+    REJECTED = 5
 
 
-class PositionSide(Enum):
+class PositionSide(_CodedEnum):
     """جهة المركز"""
-    LONG = "long"
-    SHORT = "short"
+    LONG = 0
+    SHORT = 1
 
 
 @dataclass
@@ -69,7 +95,25 @@ class Order:
         if self.created_at is None:
             self.created_at = datetime.utcnow()
         if self.updated_at is None:
-            self.updated_at = datetime.utcnow()
+            self.updated_at = self.created_at
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """تحويل الأمر إلى قاموس مسطح"""
+        return {
+            'id': self.id,
+            'symbol': self.symbol,
+            'side': self.side.label,
+            'type': self.type.label,
+            'quantity': self.quantity,
+            'price': self.price,
+            'stop_price': self.stop_price,
+            'status': self.status.label,
+            'filled_quantity': self.filled_quantity,
+            'average_price': self.average_price,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'exchange_order_id': self.exchange_order_id
+        }
 
 
 @dataclass
@@ -85,12 +129,29 @@ class Position:
     realized_pnl: float = 0.0
     created_at: datetime = None
     updated_at: datetime = None
+    side_sign: int = 0  # +1 للمركز الطويل و-1 للقصير؛ يُحسب من الجهة مرة واحدة
     
     def __post_init__(self):
+        self.side_sign = 1 if self.side == PositionSide.LONG else -1
         if self.created_at is None:
             self.created_at = datetime.utcnow()
         if self.updated_at is None:
-            self.updated_at = datetime.utcnow()
+            self.updated_at = self.created_at
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """تحويل المركز إلى قاموس مسطح"""
+        return {
+            'id': self.id,
+            'symbol': self.symbol,
+            'side': self.side.label,
+            'quantity': self.quantity,
+            'entry_price': self.entry_price,
+            'current_price': self.current_price,
+            'unrealized_pnl': self.unrealized_pnl,
+            'realized_pnl': self.realized_pnl,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
 
 
 @dataclass
@@ -108,6 +169,19 @@ class Trade:
     def __post_init__(self):
         if self.timestamp is None:
             self.timestamp = datetime.utcnow()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """تحويل الصفقة إلى قاموس مسطح"""
+        return {
+            'id': self.id,
+            'order_id': self.order_id,
+            'symbol': self.symbol,
+            'side': self.side.label,
+            'quantity': self.quantity,
+            'price': self.price,
+            'commission': self.commission,
+            'timestamp': self.timestamp
+        }
 
 
 class RiskManager:
@@ -183,6 +257,112 @@ class RiskManager:
         self.daily_pnl += pnl_change
 
 
+class _PositionColumns:
+    """
+    أعمدة NumPy (SoA) للقيم الرقمية المتغيرة في المراكز المفتوحة
+    """
+    
+    _COLUMNS = ('quantity', 'entry_price', 'current_price', 'side_sign', 'unrealized_pnl')
+    
+    def __init__(self, capacity: int = 16):
+        self.size = 0
+        self._capacity = capacity
+        self._arrays = {name: np.zeros(capacity, dtype=np.float64) for name in self._COLUMNS}
+        self._rows: Dict[str, int] = {}
+        self._ids: List[str] = []
+    
+    def clear(self):
+        """حذف كل الصفوف مع إبقاء المصفوفات المحجوزة"""
+        self.size = 0
+        self._rows.clear()
+        self._ids.clear()
+    
+    def __getitem__(self, name: str) -> np.ndarray:
+        """الحصول على عمود (عرض دون نسخ)"""
+        return self._arrays[name][:self.size]
+    
+    def add(self, position: Position) -> int:
+        """إضافة مركز وإرجاع رقم صفه"""
+        if self.size == self._capacity:
+            self._capacity *= 2
+            for name, array in self._arrays.items():
+                self._arrays[name] = np.resize(array, self._capacity)
+        
+        row = self.size
+        self._arrays['quantity'][row] = position.quantity
+        self._arrays['entry_price'][row] = position.entry_price
+        self._arrays['current_price'][row] = position.current_price
+        self._arrays['side_sign'][row] = position.side_sign
+        self._arrays['unrealized_pnl'][row] = position.unrealized_pnl
+        
+        self._rows[position.id] = row
+        self._ids.append(position.id)
+        self.size += 1
+        return row
+    
+    def remove(self, position_id: str):
+        """حذف مركز بنقل الصف الأخير مكانه"""
+        row = self._rows.pop(position_id)
+        last = self.size - 1
+        
+        if row != last:
+            for array in self._arrays.values():
+                array[row] = array[last]
+            moved_id = self._ids[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        
+        self._ids.pop()
+        self.size = last
+    
+    def set_entry(self, position_id: str, quantity: float, entry_price: float):
+        """تحديث الكمية وسعر الدخول بعد زيادة المركز أو تقليله"""
+        row = self._rows[position_id]
+        self._arrays['quantity'][row] = quantity
+        self._arrays['entry_price'][row] = entry_price
+    
+    def mark_to_market(self, rows, price: float):
+        """تحديث السعر والربح غير المحقق للصفوف المحددة دفعة واحدة"""
+        quantity = self._arrays['quantity']
+        entry_price = self._arrays['entry_price']
+        side_sign = self._arrays['side_sign']
+        
+        self._arrays['current_price'][rows] = price
+        self._arrays['unrealized_pnl'][rows] = side_sign[rows] * (price - entry_price[rows]) * quantity[rows]
+    
+    def row(self, position_id: str) -> int:
+        """رقم صف المركز"""
+        return self._rows[position_id]
+    
+    def sync(self, position: Position):
+        """نسخ القيم الحالية من الأعمدة إلى كائن المركز"""
+        row = self._rows[position.id]
+        position.quantity = float(self._arrays['quantity'][row])
+        position.entry_price = float(self._arrays['entry_price'][row])
+        position.current_price = float(self._arrays['current_price'][row])
+        position.unrealized_pnl = float(self._arrays['unrealized_pnl'][row])
+
+
+_ID_BYTES = 16
+_ID_POOL_SIZE = 4096
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+# سجل الصفقة المنفذة؛ ts بالنانوثانية منذ 1970 والجهة برمز OrderSide
+_TRADE_DTYPE = np.dtype([
+    ('ts', 'i8'),
+    ('symbol', 'U32'),
+    ('side', 'u1'),
+    ('quantity', 'f8'),
+    ('price', 'f8'),
+    ('commission', 'f8'),
+    ('realized_pnl', 'f8'),
+    ('order_id', 'U32'),
+    ('id', 'U32')
+])
+
+
 class PaperTradingEngine:
     """
     محرك التداول الورقي (Paper Trading)
@@ -194,11 +374,65 @@ class PaperTradingEngine:
         self.current_balance = initial_balance
         self.orders: Dict[str, Order] = {}
         self.positions: Dict[str, Position] = {}
-        self.trades: List[Trade] = []
         self.market_data: Dict[str, Dict] = {}
         self.risk_manager = RiskManager()
         self.is_running = False
-        self._lock = threading.Lock()
+        
+        # أقفال منفصلة بدلاً من قفل واحد لكل المحرك. ترتيب الأخذ: الأوامر ثم المراكز؛
+        # قفل بيانات السوق لا يُؤخذ بعده أي قفل آخر
+        self._market_lock = threading.Lock()
+        self._orders_lock = threading.Lock()
+        self._positions_lock = threading.Lock()  # المراكز والصفقات والرصيد
+        
+        # مخزن بايتات عشوائية للمعرفات: استدعاء نظام واحد لكل 256 معرفاً
+        self._id_lock = threading.Lock()
+        self._rand_pool = os.urandom(_ID_POOL_SIZE)
+        self._rand_off = 0
+        
+        # فهارس حسب الرمز لتجنب المرور على كل المراكز والأوامر مع كل سعر
+        self._positions_by_symbol: Dict[str, Position] = {}
+        
+        # أكوام مستويات التنفيذ لكل رمز: قمة الكومة تكفي لمعرفة هل يُنفَّذ أي أمر
+        # _triggers_below: تُنفَّذ عند السعر <= المستوى (شراء محدد، بيع وقف) كومة عظمى
+        # _triggers_above: تُنفَّذ عند السعر >= المستوى (بيع محدد، شراء وقف) كومة صغرى
+        self._triggers_below: Dict[str, List[Tuple[float, int, Order]]] = {}
+        self._triggers_above: Dict[str, List[Tuple[float, int, Order]]] = {}
+        self._trigger_seq = itertools.count()
+        
+        # القيم الرقمية للمراكز كأعمدة؛ كائنات Position تُحدَّث منها عند القراءة فقط
+        self._position_columns = _PositionColumns(self.risk_manager.max_positions)
+        
+        # الصفقات المنفذة كمصفوفة مهيكلة تتضاعف سعتها بدلاً من قائمة كائنات
+        self._trades = np.empty(1024, dtype=_TRADE_DTYPE)
+        self._trade_count = 0
+        self._reset_running_stats()
+    
+    def _reset_running_stats(self):
+        """
+        عدادات الأداء التراكمية المحدثة عند كل صفقة
+        """
+        # صفقات الإغلاق فقط: الربح المحقق يحدد الرابحة والخاسرة
+        self._closed_trades = 0
+        self._winning_trades = 0
+        self._losing_trades = 0
+        self._total_realized_pnl = 0.0
+        self._total_volume = 0.0
+        self._equity_high = self.initial_balance
+        self._max_drawdown = 0.0
+    
+    def _new_id(self) -> str:
+        """
+        معرف عشوائي جديد (128 بت بصيغة hex) من المخزن المسبق
+        """
+        with self._id_lock:
+            if self._rand_off + _ID_BYTES > _ID_POOL_SIZE:
+                self._rand_pool = os.urandom(_ID_POOL_SIZE)
+                self._rand_off = 0
+            
+            pool, offset = self._rand_pool, self._rand_off
+            self._rand_off = offset + _ID_BYTES
+        
+        return pool[offset:offset + _ID_BYTES].hex()
     
     def start(self):
         """بدء محرك التداول"""
@@ -208,14 +442,40 @@ class PaperTradingEngine:
         """إيقاف محرك التداول"""
         self.is_running = False
     
+    def reset(self, initial_balance: Optional[float] = None):
+        """
+        إعادة المحرك لحالته الأولى في مكانه مع إبقاء المخازن المحجوزة
+        """
+        if initial_balance is not None:
+            self.initial_balance = initial_balance
+        
+        with self._orders_lock:
+            self.orders.clear()
+            self._triggers_below.clear()
+            self._triggers_above.clear()
+            
+            with self._positions_lock:
+                self.current_balance = self.initial_balance
+                self.positions.clear()
+                self._positions_by_symbol.clear()
+                self._position_columns.clear()
+                self._trade_count = 0
+                self._reset_running_stats()
+                self.risk_manager.daily_pnl = 0.0
+        
+        with self._market_lock:
+            self.market_data.clear()
+    
     def update_market_price(self, symbol: str, price: float, timestamp: datetime = None):
         """
         تحديث سعر السوق
         """
+        # وقت واحد لكل تحديث يُمرَّر لكل ما يُعدَّل خلاله
+        now = datetime.utcnow()
         if timestamp is None:
-            timestamp = datetime.utcnow()
+            timestamp = now
         
-        with self._lock:
+        with self._market_lock:
             if symbol not in self.market_data:
                 self.market_data[symbol] = {}
             
@@ -223,12 +483,13 @@ class PaperTradingEngine:
                 'price': price,
                 'timestamp': timestamp
             })
-            
-            # تحديث المراكز المفتوحة
-            self._update_positions(symbol, price)
-            
-            # فحص الأوامر المعلقة
-            self._check_pending_orders(symbol, price)
+        
+        # تحديث المراكز المفتوحة
+        with self._positions_lock:
+            self._update_positions(symbol, price, now)
+        
+        # فحص الأوامر المعلقة
+        self._check_pending_orders(symbol, price, now)
     
     def place_order(self, symbol: str, side: OrderSide, order_type: OrderType,
                    quantity: float, price: Optional[float] = None,
@@ -241,7 +502,7 @@ class PaperTradingEngine:
         
         # إنشاء الأمر
         order = Order(
-            id=str(uuid.uuid4()),
+            id=self._new_id(),
             symbol=symbol,
             side=side,
             type=order_type,
@@ -258,20 +519,65 @@ class PaperTradingEngine:
         if not is_valid:
             return False, error_msg, None
         
-        with self._lock:
+        with self._orders_lock:
             self.orders[order.id] = order
             
             # تنفيذ الأمر إذا كان من نوع السوق
             if order_type == OrderType.MARKET:
-                self._execute_market_order(order)
+                self._execute_market_order(order, order.created_at)
+            else:
+                self._push_trigger(order)
             
             return True, "تم وضع الأمر بنجاح", order.id
     
+    def place_orders_batch(self, specs: List[Dict[str, Any]]) -> List[Tuple[bool, str, Optional[str]]]:
+        """
+        وضع مجموعة أوامر بالتتابع تحت قفل الأوامر دون أن يتخللها أمر آخر
+        الأمر الأول أساسي: فشل تحققه يرفض الدفعة كلها؛ ما بعده (أوامر الحماية) يُتخطى منفرداً عند فشل تحققه
+        كل عنصر قاموس بمفاتيح symbol, side, type, quantity وprice/stop_price اختيارياً
+        """
+        if not self.is_running:
+            return [(False, "محرك التداول متوقف", None)] * len(specs)
+        
+        results = []
+        with self._orders_lock:
+            for spec in specs:
+                order = Order(
+                    id=self._new_id(),
+                    symbol=spec['symbol'],
+                    side=spec['side'],
+                    type=spec['type'],
+                    quantity=spec['quantity'],
+                    price=spec.get('price'),
+                    stop_price=spec.get('stop_price')
+                )
+                
+                # التحقق مقابل الحالة بعد تنفيذ ما سبقه من الدفعة
+                with self._positions_lock:
+                    is_valid, error_msg = self.risk_manager.validate_order(
+                        order, self.current_balance, list(self.positions.values())
+                    )
+                
+                if not is_valid:
+                    if not results:
+                        return [(False, error_msg, None)] * len(specs)
+                    results.append((False, error_msg, None))
+                    continue
+                
+                self.orders[order.id] = order
+                if order.type == OrderType.MARKET:
+                    self._execute_market_order(order, order.created_at)
+                else:
+                    self._push_trigger(order)
+                results.append((True, "تم وضع الأمر بنجاح", order.id))
+        
+        return results
+    
     def cancel_order(self, order_id: str) -> Tuple[bool, str]:
         """
         إلغاء أمر
         """
-        with self._lock:
+        with self._orders_lock:
             if order_id not in self.orders:
                 return False, "الأمر غير موجود"
             
@@ -289,7 +595,7 @@ class PaperTradingEngine:
         """
         إغلاق مركز (كلي أو جزئي)
         """
-        with self._lock:
+        with self._positions_lock:
             if position_id not in self.positions:
                 return False, "المركز غير موجود"
             
@@ -301,132 +607,241 @@ class PaperTradingEngine:
             
             # تحديد جهة أمر الإغلاق
             close_side = OrderSide.SELL if position.side == PositionSide.LONG else OrderSide.BUY
-            
-            # وضع أمر إغلاق
-            success, message, order_id = self.place_order(
-                position.symbol, close_side, OrderType.MARKET, close_quantity
-            )
-            
-            return success, message
+            symbol = position.symbol
+        
+        # وضع أمر إغلاق (خارج قفل المراكز لأن التنفيذ يأخذ قفل الأوامر أولاً)
+        success, message, order_id = self.place_order(
+            symbol, close_side, OrderType.MARKET, close_quantity
+        )
+        
+        return success, message
     
     def get_account_summary(self) -> Dict[str, Any]:
         """
         ملخص الحساب
         """
-        with self._lock:
-            total_unrealized_pnl = sum(pos.unrealized_pnl for pos in self.positions.values())
-            total_realized_pnl = sum(trade.price * trade.quantity for trade in self.trades)
+        with self._orders_lock:
+            pending_orders = len([o for o in self.orders.values() if o.status == OrderStatus.PENDING])
+        
+        with self._positions_lock:
+            total_unrealized_pnl = float(self._position_columns['unrealized_pnl'].sum())
             
             return {
                 "initial_balance": self.initial_balance,
                 "current_balance": self.current_balance,
                 "total_unrealized_pnl": total_unrealized_pnl,
-                "total_realized_pnl": total_realized_pnl,
-                "total_equity": self.current_balance + total_unrealized_pnl,
+                "total_realized_pnl": self._total_realized_pnl,
+                "total_volume": self._total_volume,
+                "total_equity": self._equity(),
                 "open_positions": len(self.positions),
-                "pending_orders": len([o for o in self.orders.values() if o.status == OrderStatus.PENDING]),
-                "total_trades": len(self.trades)
+                "pending_orders": pending_orders,
+                "total_trades": self._trade_count
             }
     
+    def get_performance_snapshot(self) -> Dict[str, Any]:
+        """
+        إحصائيات الأداء من العدادات التراكمية دون المرور على الصفقات
+        """
+        with self._positions_lock:
+            total_trades = self._closed_trades
+            winning_trades = self._winning_trades
+            losing_trades = self._losing_trades
+            current_equity = self._equity()
+            max_drawdown = self._max_drawdown
+        
+        win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
+        total_return = (current_equity - self.initial_balance) / self.initial_balance * 100
+        
+        return {
+            "total_trades": total_trades,
+            "winning_trades": winning_trades,
+            "losing_trades": losing_trades,
+            "win_rate": round(win_rate, 2),
+            "total_return": round(total_return, 2),
+            "current_equity": current_equity,
+            "max_drawdown": round(max_drawdown, 2),
+            "sharpe_ratio": 0.0   # يحتاج بيانات تاريخية
+        }
+    
     def get_positions(self) -> List[Dict[str, Any]]:
         """
         الحصول على المراكز المفتوحة
         """
-        with self._lock:
-            return [asdict(pos) for pos in self.positions.values()]
+        with self._positions_lock:
+            positions = []
+            for pos in self.positions.values():
+                self._position_columns.sync(pos)
+                positions.append(pos.to_dict())
+            return positions
     
     def get_orders(self, status: Optional[OrderStatus] = None) -> List[Dict[str, Any]]:
         """
         الحصول على الأوامر
         """
-        with self._lock:
+        with self._orders_lock:
             orders = list(self.orders.values())
             
             if status:
                 orders = [o for o in orders if o.status == status]
             
-            return [asdict(order) for order in orders]
+            return [order.to_dict() for order in orders]
     
     def get_trades(self, symbol: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
         """
         الحصول على الصفقات
         """
-        with self._lock:
-            trades = self.trades
+        with self._positions_lock:
+            trades = self._trades[:self._trade_count]
             
             if symbol:
-                trades = [t for t in trades if t.symbol == symbol]
-            
-            # ترتيب حسب التاريخ (الأحدث أولاً)
-            trades = sorted(trades, key=lambda x: x.timestamp, reverse=True)
+                trades = trades[trades['symbol'] == symbol]
             
-            return [asdict(trade) for trade in trades[:limit]]
+            # ترتيب حسب التاريخ (الأحدث أولاً، والأقدم إدراجاً أولاً عند التساوي)
+            newest_first = np.argsort(-trades['ts'], kind='stable')[:limit]
+            rows = trades[newest_first].tolist()
+        
+        # بناء القواميس للصفوف المطلوبة فقط
+        return [
+            {
+                'id': trade_id,
+                'order_id': order_id,
+                'symbol': trade_symbol,
+                'side': OrderSide(side).label,
+                'quantity': quantity,
+                'price': price,
+                'commission': commission,
+                'timestamp': _EPOCH + timedelta(microseconds=ts // 1000)
+            }
+            for ts, trade_symbol, side, quantity, price, commission, _, order_id, trade_id in rows
+        ]
     
-    def _execute_market_order(self, order: Order):
+    def _execute_market_order(self, order: Order, now: datetime, price_hint: Optional[float] = None):
         """
-        تنفيذ أمر السوق
+        تنفيذ أمر السوق (يُستدعى مع قفل الأوامر)
         """
-        if order.symbol not in self.market_data:
+        # مسار التحديث يمرر السعر الذي وصل للتو فلا حاجة لقراءة بيانات السوق
+        current_price = price_hint
+        if current_price is None:
+            with self._market_lock:
+                market_data = self.market_data.get(order.symbol)
+                current_price = market_data['price'] if market_data else None
+        
+        if current_price is None:
             order.status = OrderStatus.REJECTED
             return
         
-        current_price = self.market_data[order.symbol]['price']
-        
         # تنفيذ الأمر
         order.status = OrderStatus.FILLED
         order.filled_quantity = order.quantity
         order.average_price = current_price
-        order.updated_at = datetime.utcnow()
+        order.updated_at = now
         
         # إنشاء صفقة
         trade = Trade(
-            id=str(uuid.uuid4()),
+            id=self._new_id(),
             order_id=order.id,
             symbol=order.symbol,
             side=order.side,
             quantity=order.quantity,
-            price=current_price
+            price=current_price,
+            timestamp=now
         )
         
-        self.trades.append(trade)
+        with self._positions_lock:
+            # تحديث المراكز
+            realized_pnl = self._update_position_from_trade(trade)
+            
+            self._record_trade(trade, realized_pnl)
+            
+            # تحديث الرصيد
+            trade_value = trade.quantity * trade.price
+            if trade.side == OrderSide.BUY:
+                self.current_balance -= trade_value
+            else:
+                self.current_balance += trade_value
+            
+            self._update_drawdown()
+    
+    def _record_trade(self, trade: Trade, realized_pnl: Optional[float]):
+        """
+        كتابة الصفقة في الصف التالي من مصفوفة الصفقات
+        realized_pnl يكون None لصفقات الفتح والزيادة التي لا تغلق شيئاً
+        """
+        closing = realized_pnl is not None
+        if not closing:
+            realized_pnl = 0.0
+        
+        n = self._trade_count
+        if n == len(self._trades):
+            self._trades = np.resize(self._trades, 2 * n)
         
-        # تحديث المراكز
-        self._update_position_from_trade(trade)
+        self._trades[n] = (
+            (trade.timestamp - _EPOCH) // _ONE_MICROSECOND * 1000,
+            trade.symbol,
+            trade.side,
+            trade.quantity,
+            trade.price,
+            trade.commission,
+            realized_pnl,
+            trade.order_id,
+            trade.id
+        )
+        self._trade_count = n + 1
         
-        # تحديث الرصيد
-        trade_value = trade.quantity * trade.price
-        if trade.side == OrderSide.BUY:
-            self.current_balance -= trade_value
-        else:
-            self.current_balance += trade_value
+        if closing:
+            self._closed_trades += 1
+            self._winning_trades += int(realized_pnl > 0)
+            self._losing_trades += int(realized_pnl < 0)
+        self._total_realized_pnl += realized_pnl
+        self._total_volume += trade.price * trade.quantity
     
-    def _update_position_from_trade(self, trade: Trade):
+    def _equity(self) -> float:
         """
-        تحديث المراكز من الصفقة
+        الحقوق = النقد + قيمة المراكز بسعر السوق (سالبة للمراكز القصيرة) (يُستدعى مع قفل المراكز)
+        """
+        columns = self._position_columns
+        return self.current_balance + float(np.dot(columns['side_sign'] * columns['quantity'],
+                                                   columns['current_price']))
+    
+    def _update_drawdown(self):
+        """
+        تحديث أعلى قيمة للحقوق وأقصى تراجع عنها (يُستدعى مع قفل المراكز)
+        """
+        equity = self._equity()
+        if equity > self._equity_high:
+            self._equity_high = equity
+        elif self._equity_high > 0:
+            drawdown = (self._equity_high - equity) / self._equity_high * 100
+            if drawdown > self._max_drawdown:
+                self._max_drawdown = drawdown
+    
+    def _update_position_from_trade(self, trade: Trade) -> Optional[float]:
+        """
+        تحديث المراكز من الصفقة وإرجاع الربح المحقق منها، أو None إذا لم تُغلق أي كمية
         """
         symbol = trade.symbol
         
         # البحث عن مركز موجود
-        existing_position = None
-        for pos in self.positions.values():
-            if pos.symbol == symbol:
-                existing_position = pos
-                break
+        existing_position = self._positions_by_symbol.get(symbol)
         
         if existing_position is None:
             # إنشاء مركز جديد
             position_side = PositionSide.LONG if trade.side == OrderSide.BUY else PositionSide.SHORT
             
             position = Position(
-                id=str(uuid.uuid4()),
+                id=self._new_id(),
                 symbol=symbol,
                 side=position_side,
                 quantity=trade.quantity,
                 entry_price=trade.price,
-                current_price=trade.price
+                current_price=trade.price,
+                created_at=trade.timestamp
             )
             
             self.positions[position.id] = position
+            self._positions_by_symbol[symbol] = position
+            self._position_columns.add(position)
+            return None
         else:
             # تحديث المركز الموجود
             if ((existing_position.side == PositionSide.LONG and trade.side == OrderSide.BUY) or
@@ -437,55 +852,137 @@ class PaperTradingEngine:
                 total_quantity = existing_position.quantity + trade.quantity
                 existing_position.entry_price = total_value / total_quantity
                 existing_position.quantity = total_quantity
+                self._position_columns.set_entry(existing_position.id, total_quantity, existing_position.entry_price)
+                realized_pnl = None
             else:
+                # الربح المحقق على الكمية المغلقة
+                closed_quantity = min(trade.quantity, existing_position.quantity)
+                realized_pnl = existing_position.side_sign * (trade.price - existing_position.entry_price) * closed_quantity
+                existing_position.realized_pnl += realized_pnl
+                
                 # تقليل المركز أو إغلاقه
                 if trade.quantity >= existing_position.quantity:
                     # إغلاق المركز
                     del self.positions[existing_position.id]
+                    del self._positions_by_symbol[symbol]
+                    self._position_columns.remove(existing_position.id)
                 else:
                     # تقليل المركز
                     existing_position.quantity -= trade.quantity
+                    self._position_columns.set_entry(
+                        existing_position.id, existing_position.quantity, existing_position.entry_price
+                    )
             
-            existing_position.updated_at = datetime.utcnow()
+            existing_position.updated_at = trade.timestamp
+            return realized_pnl
     
-    def _update_positions(self, symbol: str, current_price: float):
+    def _update_positions(self, symbol: str, current_price: float, now: datetime):
         """
         تحديث المراكز بالأسعار الحالية
         """
-        for position in self.positions.values():
-            if position.symbol == symbol:
-                position.current_price = current_price
-                
-                # حساب الربح/الخسارة غير المحققة
-                if position.side == PositionSide.LONG:
-                    position.unrealized_pnl = (current_price - position.entry_price) * position.quantity
-                else:
-                    position.unrealized_pnl = (position.entry_price - current_price) * position.quantity
-                
-                position.updated_at = datetime.utcnow()
+        position = self._positions_by_symbol.get(symbol)
+        if position is None:
+            return
+        
+        # حساب الربح/الخسارة غير المحققة على الأعمدة: الإشارة × (السعر - الدخول) × الكمية
+        self._position_columns.mark_to_market(self._position_columns.row(position.id), current_price)
+        self._update_drawdown()
+        
+        position.updated_at = now
     
-    def _check_pending_orders(self, symbol: str, current_price: float):
+    def _check_pending_orders(self, symbol: str, current_price: float, now: datetime):
         """
         فحص الأوامر المعلقة وتنفيذها إذا لزم الأمر
         """
-        for order in self.orders.values():
-            if (order.symbol == symbol and 
-                order.status == OrderStatus.PENDING):
-                
-                should_execute = False
-                
-                if order.type == OrderType.LIMIT:
-                    if ((order.side == OrderSide.BUY and current_price <= order.price) or
-                        (order.side == OrderSide.SELL and current_price >= order.price)):
-                        should_execute = True
-                
-                elif order.type == OrderType.STOP:
-                    if ((order.side == OrderSide.BUY and current_price >= order.stop_price) or
-                        (order.side == OrderSide.SELL and current_price <= order.stop_price)):
-                        should_execute = True
-                
-                if should_execute:
-                    self._execute_market_order(order)
+        with self._orders_lock:
+            for order in self._pop_triggered(symbol, current_price):
+                # الأوامر الملغاة تبقى في الكومة حتى تصل إلى القمة ثم تُهمَل هنا
+                if order.status == OrderStatus.PENDING:
+                    self._execute_market_order(order, now, current_price)
+    
+    def _push_trigger(self, order: Order):
+        """
+        إضافة مستوى تنفيذ الأمر المعلق إلى كومة رمزه (يُستدعى مع قفل الأوامر)
+        """
+        if order.type == OrderType.LIMIT:
+            level = order.price
+            fires_below = order.side == OrderSide.BUY
+        elif order.type == OrderType.STOP:
+            level = order.stop_price
+            fires_below = order.side == OrderSide.SELL
+        else:
+            # الأنواع الأخرى لا تُنفَّذ تلقائياً من السعر
+            return
+        
+        if level is None:
+            return
+        
+        if fires_below:
+            heapq.heappush(self._triggers_below.setdefault(order.symbol, []), (-level, next(self._trigger_seq), order))
+        else:
+            heapq.heappush(self._triggers_above.setdefault(order.symbol, []), (level, next(self._trigger_seq), order))
+    
+    def _pop_triggered(self, symbol: str, current_price: float) -> List[Order]:
+        """
+        سحب الأوامر التي تجاوز السعر مستواها من الكومتين بترتيب وضعها
+        """
+        triggered = []
+        
+        below = self._triggers_below.get(symbol)
+        while below and current_price <= -below[0][0]:
+            _, seq, order = heapq.heappop(below)
+            triggered.append((seq, order))
+        
+        above = self._triggers_above.get(symbol)
+        while above and current_price >= above[0][0]:
+            _, seq, order = heapq.heappop(above)
+            triggered.append((seq, order))
+        
+        # التنفيذ بترتيب الوضع (FIFO) لا بترتيب المستويات: ترتيب التنفيذ يغير الرصيد والمراكز
+        triggered.sort(key=lambda entry: entry[0])
+        return [order for _, order in triggered]
+
+
+# رموز الإشارة التي تُرجعها نواة Donchian
+_SIGNAL_ACTIONS = {1: "buy", -1: "sell"}
+
+def _donchian_loop(prices, current_price, risk_reward_ratio):
+    """
+    إشارة Donchian في مرور واحد: (رمز الإشارة، الدخول، وقف الخسارة، جني الربح، الثقة)
+    تُترجم مسبقاً (build_aot.py) أو عند الاستيراد عبر Numba
+    """
+    highest_high = prices[0]
+    lowest_low = prices[0]
+    for price in prices:
+        if price > highest_high:
+            highest_high = price
+        if price < lowest_low:
+            lowest_low = price
+    
+    if current_price > highest_high:
+        stop_loss = lowest_low
+        take_profit = current_price + (current_price - stop_loss) * risk_reward_ratio
+        breakout_strength = (current_price - highest_high) / highest_high
+        return 1, current_price, stop_loss, take_profit, min(max(breakout_strength * 100, 0.3), 0.9)
+    
+    if current_price < lowest_low:
+        stop_loss = highest_high
+        take_profit = current_price - (stop_loss - current_price) * risk_reward_ratio
+        breakout_strength = (lowest_low - current_price) / lowest_low
+        return -1, current_price, stop_loss, take_profit, min(max(breakout_strength * 100, 0.3), 0.9)
+    
+    return 0, current_price, 0.0, 0.0, 0.0
+
+
+# النواة المترجمة مسبقاً لا تحتاج ترجمة عند التشغيل؛ وإلا تُترجم بـ Numba عند الاستيراد
+try:
+    from src.models.trader_kernels import donchian as _donchian_kernel
+    DONCHIAN_KERNEL_AVAILABLE = True
+except ImportError:
+    DONCHIAN_KERNEL_AVAILABLE = NUMBA_AVAILABLE
+    if NUMBA_AVAILABLE:
+        _donchian_kernel = njit(cache=True, fastmath=True)(_donchian_loop)
+        _donchian_kernel(np.zeros(2), 0.0, 2.0)
 
 
 class DonchianBreakoutStrategy:
@@ -496,75 +993,92 @@ class DonchianBreakoutStrategy:
     def __init__(self, period: int = 20, risk_reward_ratio: float = 2.0):
         self.period = period
         self.risk_reward_ratio = risk_reward_ratio
-        self.price_history: Dict[str, List[float]] = {}
+        
+        # مخزن دائري بحجم الفترة لكل رمز، وعدد الأسعار المكتوبة فيه
+        self._buf: Dict[str, np.ndarray] = {}
+        self._idx: Dict[str, int] = {}
+    
+    def reset(self):
+        """
+        نسيان الأسعار السابقة مع إبقاء المخازن الدائرية لكل رمز
+        """
+        for symbol in self._idx:
+            self._idx[symbol] = 0
     
     def update_price(self, symbol: str, price: float):
         """
         تحديث تاريخ الأسعار
         """
-        if symbol not in self.price_history:
-            self.price_history[symbol] = []
-        
-        self.price_history[symbol].append(price)
+        if symbol not in self._buf:
+            self._buf[symbol] = np.empty(self.period, dtype=np.float64)
+            self._idx[symbol] = 0
         
-        # الاحتفاظ بالفترة المطلوبة فقط
-        if len(self.price_history[symbol]) > self.period:
-            self.price_history[symbol] = self.price_history[symbol][-self.period:]
+        # الكتابة فوق أقدم سعر بدلاً من قص القائمة
+        idx = self._idx[symbol]
+        self._buf[symbol][idx % self.period] = price
+        self._idx[symbol] = idx + 1
     
     def get_signal(self, symbol: str, current_price: float) -> Optional[Dict[str, Any]]:
         """
         الحصول على إشارة التداول
         """
-        if (symbol not in self.price_history or 
-            len(self.price_history[symbol]) < self.period):
+        if self._idx.get(symbol, 0) < self.period:
             return None
         
-        prices = self.price_history[symbol]
+        prices = self._buf[symbol]
         
-        # حساب أعلى وأقل سعر في الفترة
-        highest_high = max(prices)
-        lowest_low = min(prices)
+        if DONCHIAN_KERNEL_AVAILABLE:
+            action_code, entry_price, stop_loss, take_profit, confidence = _donchian_kernel(
+                prices, float(current_price), float(self.risk_reward_ratio)
+            )
+        else:
+            action_code, entry_price, stop_loss, take_profit, confidence = self._donchian_signal(
+                prices, current_price
+            )
         
-        signal = None
+        if action_code == 0:
+            return None
+        
+        return {
+            "action": _SIGNAL_ACTIONS[int(action_code)],
+            "entry_price": entry_price,
+            "stop_loss": stop_loss,
+            "take_profit": take_profit,
+            "confidence": confidence
+        }
+    
+    def _donchian_signal(self, prices: np.ndarray, current_price: float) -> Tuple[int, float, float, float, float]:
+        """
+        حساب الإشارة عبر NumPy عند عدم توفر Numba
+        """
+        # حساب أعلى وأقل سعر في الفترة (المخزن ممتلئ فترتيب العناصر لا يهم)
+        highest_high = float(prices.max())
+        lowest_low = float(prices.min())
         
         # إشارة شراء - كسر أعلى سعر
         if current_price > highest_high:
             stop_loss = lowest_low
             take_profit = current_price + (current_price - stop_loss) * self.risk_reward_ratio
-            
-            signal = {
-                "action": "buy",
-                "entry_price": current_price,
-                "stop_loss": stop_loss,
-                "take_profit": take_profit,
-                "confidence": self._calculate_confidence(prices, current_price, "buy")
-            }
+            confidence = self._calculate_confidence(highest_high, lowest_low, current_price, "buy")
+            return 1, current_price, stop_loss, take_profit, confidence
         
         # إشارة بيع - كسر أقل سعر
-        elif current_price < lowest_low:
+        if current_price < lowest_low:
             stop_loss = highest_high
             take_profit = current_price - (stop_loss - current_price) * self.risk_reward_ratio
-            
-            signal = {
-                "action": "sell",
-                "entry_price": current_price,
-                "stop_loss": stop_loss,
-                "take_profit": take_profit,
-                "confidence": self._calculate_confidence(prices, current_price, "sell")
-            }
+            confidence = self._calculate_confidence(highest_high, lowest_low, current_price, "sell")
+            return -1, current_price, stop_loss, take_profit, confidence
         
-        return signal
+        return 0, current_price, 0.0, 0.0, 0.0
     
-    def _calculate_confidence(self, prices: List[float], current_price: float, action: str) -> float:
+    def _calculate_confidence(self, highest: float, lowest: float, current_price: float, action: str) -> float:
         """
         حساب مستوى الثقة في الإشارة
         """
         # حساب بسيط لمستوى الثقة بناءً على قوة الكسر
         if action == "buy":
-            highest = max(prices)
             breakout_strength = (current_price - highest) / highest
         else:
-            lowest = min(prices)
             breakout_strength = (lowest - current_price) / lowest
         
         # تحويل إلى نسبة مئوية وتحديد مستوى الثقة
@@ -5,14 +5,70 @@
 
 import os
 import json
+import re
 import base64
+import hmac
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
 from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
+from argon2.exceptions import VerificationError, InvalidHashError
 import secrets
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+# ذاكرة المفاتيح المشتقة: المفتاح (بصمة كلمة المرور، الملح) حتى لا تُخزَّن كلمة المرور نفسها
+_KEY_CACHE_SIZE = 8
+_key_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+_key_cache_lock = threading.Lock()
+
+# ملفات الخزنة القديمة كانت نصاً بترميز base64
+_BASE64_TEXT = re.compile(rb'[A-Za-z0-9+/=\s]+')
+
+
+class _VaultFileState:
+    """
+    حالة الكتابة المشتركة لملف خزنة واحد بين كل مديريه (الجلسة، الاستيراد، إعادة التشفير)
+    """
+    
+    __slots__ = ('cond', 'seq', 'written_seq', 'failed_seq', 'pending')
+    
+    def __init__(self):
+        self.cond = threading.Condition(threading.RLock())
+        # رقم تسلسلي لكل لقطة: الكتابة الأقدم لا تستبدل ملفاً كُتب من لقطة أحدث
+        self.seq = 0
+        self.written_seq = 0
+        # أحدث لقطة فشلت كتابتها
+        self.failed_seq = 0
+        # لقطات مشفرة لم تُكتب بعد
+        self.pending = 0
+
+
+_file_states: "dict[str, _VaultFileState]" = {}
+_file_states_lock = threading.Lock()
+
+
+def _vault_file_state(path: str) -> _VaultFileState:
+    """حالة الكتابة لمسار ملف الخزنة (واحدة لكل ملف في العملية)"""
+    key = os.path.abspath(path)
+    with _file_states_lock:
+        state = _file_states.get(key)
+        if state is None:
+            state = _file_states[key] = _VaultFileState()
+        return state
+
+
+def _password_digest(password: str) -> bytes:
+    """بصمة كلمة المرور للمقارنة والفهرسة دون الاحتفاظ بها"""
+    return hashlib.blake2b(password.encode()).digest()
+
 
 class EncryptedVault:
     """
@@ -20,29 +76,45 @@ class EncryptedVault:
     """
     
     def __init__(self):
-        self.ph = PasswordHasher()
+        # Argon2id بمعاملات صريحة؛ التجزئات الأقدم تُعاد عند الدخول التالي (needs_rehash)
+        self.ph = PasswordHasher(time_cost=3, memory_cost=64 * 1024, parallelism=2,
+                                 hash_len=32, salt_len=16)
         
     def derive_key(self, password: str, salt: bytes) -> bytes:
         """
         اشتقاق مفتاح التشفير من كلمة المرور والملح
         """
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        return kdf.derive(password.encode())
+        cache_key = (_password_digest(password), bytes(salt))
+        
+        with _key_cache_lock:
+            key = _key_cache.get(cache_key)
+            if key is not None:
+                _key_cache.move_to_end(cache_key)
+                return key
+        
+        # PBKDF2 من OpenSSL مباشرة؛ نفس ناتج PBKDF2HMAC فالبيانات المشفرة سابقاً تبقى صالحة
+        key = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000, 32)
+        
+        with _key_cache_lock:
+            _key_cache[cache_key] = key
+            if len(_key_cache) > _KEY_CACHE_SIZE:
+                _key_cache.popitem(last=False)
+        
+        return key
     
-    def encrypt_data(self, data: dict, password: str) -> str:
+    def extract_salt(self, encrypted_package: bytes) -> bytes:
+        """
+        استخراج الملح من البيانات المشفرة
+        """
+        return bytes(encrypted_package[:16])
+    
+    def encrypt_data(self, data: dict, password: str, salt: bytes = None) -> bytes:
         """
         تشفير البيانات باستخدام AES-256-GCM
         """
-        # تحويل البيانات إلى JSON
-        json_data = json.dumps(data).encode()
-        
-        # توليد ملح عشوائي
-        salt = os.urandom(16)
+        # توليد ملح عشوائي (أو إعادة استخدام ملح الخزنة فيبقى المفتاح المشتق نفسه)
+        if salt is None:
+            salt = os.urandom(16)
         
         # اشتقاق مفتاح التشفير
         key = self.derive_key(password, salt)
@@ -50,26 +122,29 @@ class EncryptedVault:
         # إنشاء مثيل AESGCM
         aesgcm = AESGCM(key)
         
+        return self.encrypt_with(aesgcm, salt, data)
+    
+    def encrypt_with(self, aesgcm: AESGCM, salt: bytes, data: dict) -> bytes:
+        """
+        تشفير البيانات بمثيل AESGCM جاهز (دون اشتقاق المفتاح)
+        """
         # توليد nonce عشوائي
         nonce = os.urandom(12)
         
+        # تحويل البيانات إلى JSON (orjson يُرجع bytes مباشرة)
+        json_data = orjson.dumps(data) if ORJSON_AVAILABLE else json.dumps(data).encode()
+        
         # تشفير البيانات
         ciphertext = aesgcm.encrypt(nonce, json_data, None)
         
-        # دمج الملح والـ nonce والبيانات المشفرة
-        encrypted_package = salt + nonce + ciphertext
-        
-        # تحويل إلى base64 للتخزين
-        return base64.b64encode(encrypted_package).decode()
+        # دمج الملح والـ nonce والبيانات المشفرة (تُخزَّن كبايتات خام)
+        return salt + nonce + ciphertext
     
-    def decrypt_data(self, encrypted_data: str, password: str) -> dict:
+    def decrypt_data(self, encrypted_package: bytes, password: str) -> dict:
         """
         فك تشفير البيانات
         """
         try:
-            # فك تشفير base64
-            encrypted_package = base64.b64decode(encrypted_data.encode())
-            
             # استخراج الملح والـ nonce والبيانات المشفرة
             salt = encrypted_package[:16]
             nonce = encrypted_package[16:28]
@@ -85,6 +160,8 @@ class EncryptedVault:
             decrypted_data = aesgcm.decrypt(nonce, ciphertext, None)
             
             # تحويل من JSON
+            if ORJSON_AVAILABLE:
+                return orjson.loads(decrypted_data)
             return json.loads(decrypted_data.decode())
             
         except Exception as e:
@@ -100,12 +177,21 @@ class EncryptedVault:
         """
         التحقق من كلمة المرور
         """
+        # argon2 يقارن التجزئة بزمن ثابت؛ وأي فشل (عدم تطابق أو تجزئة تالفة) يعيد False بنفس المسار
         try:
-            self.ph.verify(hashed, password)
-            return True
-        except VerifyMismatchError:
+            return self.ph.verify(hashed, password)
+        except (VerificationError, InvalidHashError):
             return False
     
+    def needs_rehash(self, hashed: str) -> bool:
+        """
+        هل أُنشئت التجزئة بمعاملات مختلفة عن الحالية
+        """
+        try:
+            return self.ph.check_needs_rehash(hashed)
+        except InvalidHashError:
+            return True
+    
     def generate_api_key_id(self) -> str:
         """
         توليد معرف فريد لمفتاح API
@@ -123,6 +209,23 @@ class VaultManager:
         self.vault_file_path = vault_file_path or "vault.enc"
         self.decrypted_data = None
         self.is_unlocked = False
+        
+        # الملح ومثيل AESGCM للخزنة المفتوحة؛ الحفظ بنفس كلمة المرور لا يعيد الاشتقاق
+        self._salt = None
+        self._aesgcm = None
+        self._password_digest = None
+        
+        # قفل المدير لمثيل التشفير، وترتيب الكتابات مشترك لكل من يكتب الملف نفسه
+        self._save_lock = threading.Lock()
+        self._file = _vault_file_state(self.vault_file_path)
+    
+    def _set_cipher(self, password: str, salt: bytes):
+        """
+        الاحتفاظ بمثيل AESGCM المشتق لكلمة المرور والملح
+        """
+        self._salt = salt
+        self._aesgcm = AESGCM(self.vault.derive_key(password, salt))
+        self._password_digest = _password_digest(password)
     
     def create_vault(self, master_password: str, initial_data: dict = None) -> bool:
         """
@@ -138,10 +241,7 @@ class VaultManager:
             
             encrypted_data = self.vault.encrypt_data(data, master_password)
             
-            with open(self.vault_file_path, 'w') as f:
-                f.write(encrypted_data)
-            
-            return True
+            return self._write_snapshot(self._next_seq(), encrypted_data)
         except Exception as e:
             print(f"خطأ في إنشاء الخزنة: {str(e)}")
             return False
@@ -154,10 +254,15 @@ class VaultManager:
             if not os.path.exists(self.vault_file_path):
                 return False
             
-            with open(self.vault_file_path, 'r') as f:
+            with open(self.vault_file_path, 'rb') as f:
                 encrypted_data = f.read()
             
+            # التوافق مع الخزائن المحفوظة سابقاً كنص base64
+            if _BASE64_TEXT.fullmatch(encrypted_data):
+                encrypted_data = base64.b64decode(encrypted_data)
+            
             self.decrypted_data = self.vault.decrypt_data(encrypted_data, master_password)
+            self._set_cipher(master_password, self.vault.extract_salt(encrypted_data))
             self.is_unlocked = True
             return True
             
@@ -172,24 +277,121 @@ class VaultManager:
         """
         self.decrypted_data = None
         self.is_unlocked = False
+        self._salt = None
+        self._aesgcm = None
+        self._password_digest = None
     
     def save_vault(self, master_password: str) -> bool:
         """
         حفظ الخزنة بعد التعديل
         """
-        if not self.is_unlocked or not self.decrypted_data:
+        snapshot = self._encrypt_snapshot(master_password)
+        if snapshot is None:
             return False
+        return self._write_snapshot(*snapshot)
+    
+    def save_vault_async(self, master_password: str, executor):
+        """
+        تشفير لقطة من الخزنة الآن وكتابتها على القرص في الخلفية
+        يعيد رقم الحفظ لمتابعته عبر save_status، أو None إذا تعذر التشفير
+        """
+        snapshot = self._encrypt_snapshot(master_password)
+        if snapshot is None:
+            return None
+        executor.submit(self._write_snapshot, *snapshot)
+        return snapshot[0]
+    
+    def save_status(self, seq: int) -> str:
+        """
+        حالة الحفظ رقم seq: "saved" إذا كُتبت هي أو لقطة أحدث منها، أو "failed" أو "pending"
+        أو "unknown" لرقم لم يصدر في هذه العملية (الأرقام تبدأ من جديد عند إعادة التشغيل)
+        """
+        state = self._file
+        with state.cond:
+            if seq > state.seq:
+                return "unknown"
+            if state.written_seq >= seq:
+                return "saved"
+            if state.failed_seq >= seq:
+                return "failed"
+            return "pending"
+    
+    def _encrypt_snapshot(self, master_password: str):
+        """
+        تشفير البيانات الحالية وإرجاع (رقم الحفظ، البيانات المشفرة) أو None
+        """
+        if not self.is_unlocked or not self.decrypted_data:
+            return None
         
         try:
-            encrypted_data = self.vault.encrypt_data(self.decrypted_data, master_password)
-            
-            with open(self.vault_file_path, 'w') as f:
-                f.write(encrypted_data)
+            # قفل الملف قبل قفل المدير دائماً (بنفس ترتيب rekey)
+            with self._file.cond, self._save_lock:
+                # كلمة مرور مختلفة (تغيير كلمة المرور) تتطلب اشتقاق مفتاح جديد بنفس الملح
+                if self._aesgcm is None or not hmac.compare_digest(self._password_digest, _password_digest(master_password)):
+                    self._set_cipher(master_password, self._salt or os.urandom(16))
+                
+                # مثيل AESGCM المحفوظ مع nonce جديد: لا عمل PBKDF2 عند الحفظ
+                encrypted_data = self.vault.encrypt_with(self._aesgcm, self._salt, self.decrypted_data)
+                return self._next_seq(), encrypted_data
+        except Exception as e:
+            print(f"خطأ في تشفير الخزنة: {str(e)}")
+            return None
+    
+    def _next_seq(self) -> int:
+        """
+        حجز رقم الكتابة التالي لملف الخزنة؛ كل رقم يُتبع بـ _write_snapshot
+        """
+        state = self._file
+        with state.cond:
+            state.seq += 1
+            state.pending += 1
+            return state.seq
+    
+    def _write_snapshot(self, seq: int, encrypted_data: bytes) -> bool:
+        """
+        كتابة لقطة مشفرة إلى ملف الخزنة ما لم تُكتب لقطة أحدث منها
+        """
+        state = self._file
+        try:
+            with state.cond:
+                if seq < state.written_seq:
+                    return True
+                
+                # ملف مؤقت ثم استبدال: النسخة الحالية تبقى سليمة حتى تكتمل الكتابة
+                tmp_path = self.vault_file_path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(encrypted_data)
+                os.replace(tmp_path, self.vault_file_path)
+                state.written_seq = seq
             
             return True
         except Exception as e:
             print(f"خطأ في حفظ الخزنة: {str(e)}")
+            with state.cond:
+                state.failed_seq = max(state.failed_seq, seq)
             return False
+        finally:
+            with state.cond:
+                state.pending -= 1
+                state.cond.notify_all()
+    
+    def rekey(self, current_password: str, new_password: str) -> str:
+        """
+        إعادة تشفير ملف الخزنة بكلمة مرور جديدة بعد اكتمال الكتابات المعلقة
+        تعيد "done" أو "skipped" (تعذر الفتح بكلمة المرور الحالية) أو "failed"
+        """
+        state = self._file
+        with state.cond:
+            state.cond.wait_for(lambda: state.pending == 0)
+            
+            # الخزنة المفتوحة في الجلسة تحمل أحدث البيانات؛ وإلا تُقرأ من الملف
+            if not self.is_unlocked and not self.unlock_vault(current_password):
+                return "skipped"
+            
+            try:
+                return "done" if self.save_vault(new_password) else "failed"
+            finally:
+                self.lock_vault()
     
     def add_api_key(self, exchange_name: str, api_key: str, api_secret: str, 
                    api_passphrase: str = None, testnet: bool = True) -> str:
@@ -241,6 +443,15 @@ class VaultManager:
         
         return safe_list
     
+    @property
+    def api_keys_count(self) -> int:
+        """
+        عدد مفاتيح API دون بناء القائمة الآمنة (0 إذا كانت الخزنة مقفلة)
+        """
+        if not self.is_unlocked:
+            return 0
+        return len(self.decrypted_data["api_keys"])
+    
     def remove_api_key(self, key_id: str) -> bool:
         """
         حذف مفتاح API
@@ -261,17 +472,85 @@ class VaultManager:
         if not self.is_unlocked:
             raise ValueError("الخزنة مقفلة")
         
-        return self.vault.encrypt_data(self.decrypted_data, export_password)
+        # base64 فقط عند حدود التصدير النصية
+        return base64.b64encode(self.vault.encrypt_data(self.decrypted_data, export_password)).decode()
     
     def import_vault(self, encrypted_data: str, import_password: str) -> bool:
         """
         استيراد خزنة من بيانات مشفرة
         """
         try:
-            self.decrypted_data = self.vault.decrypt_data(encrypted_data, import_password)
+            encrypted_package = base64.b64decode(encrypted_data.encode())
+            self.decrypted_data = self.vault.decrypt_data(encrypted_package, import_password)
+            self._set_cipher(import_password, self.vault.extract_salt(encrypted_package))
             self.is_unlocked = True
             return True
         except Exception as e:
             print(f"خطأ في استيراد الخزنة: {str(e)}")
             return False
 
+
+class VaultSessionCache:
+    """
+    الخزائن المفتوحة في الذاكرة لكل مستخدم: حجم محدود ومهلة خمول تُقفل بعدها الخزنة
+    """
+    
+    def __init__(self, maxsize: int = 1024, idle_timeout: float = 900):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        # user_id -> [last_used, vault_manager, queued_at]، مرتبة حسب queued_at (الأقدم أولاً)
+        # القفل للتعديل فقط؛ القراءة get() على القاموس ذرية وتحدّث last_used في مكانها
+        self._entries: "OrderedDict[int, list]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, user_id: int):
+        """الخزنة المفتوحة للمستخدم أو None إذا لم تُفتح أو انتهت مهلتها"""
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        
+        if now - entry[0] <= self.idle_timeout:
+            entry[0] = now
+            return entry[1]
+        
+        # انتهت المهلة: الإزالة تحت القفل ما لم تُستبدل الخزنة في الأثناء
+        with self._lock:
+            if self._entries.get(user_id) is not entry:
+                return None
+            del self._entries[user_id]
+        
+        entry[1].lock_vault()
+        return None
+    
+    def set(self, user_id: int, vault_manager: VaultManager):
+        """حفظ خزنة مفتوحة وإقفال ما تجاوز المهلة أو الحجم"""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(user_id, None)
+            if previous is not None and previous[1] is not vault_manager:
+                evicted.append(previous[1])
+            self._entries[user_id] = [now, vault_manager, now]
+            
+            # الأقدم في المقدمة؛ ما استُخدم منذ إدراجه يُعاد إلى النهاية بدلاً من إقفاله،
+            # ونتوقف عند أول مدخل ما زال ضمن المهلة والحجم
+            while self._entries:
+                oldest_id, entry = next(iter(self._entries.items()))
+                if entry[0] != entry[2]:
+                    entry[2] = entry[0]
+                    self._entries.move_to_end(oldest_id)
+                    continue
+                if len(self._entries) <= self.maxsize and now - entry[0] <= self.idle_timeout:
+                    break
+                del self._entries[oldest_id]
+                evicted.append(entry[1])
+        
+        for expired in evicted:
+            expired.lock_vault()
+    
+    def pop(self, user_id: int):
+        """إزالة خزنة المستخدم من الذاكرة وإرجاعها (دون إقفالها)"""
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+        return entry[1] if entry is not None else None
@@ -4,12 +4,188 @@
 """
 
 import os
+import re
+import time
+import random
+import wave
+import struct
+import hashlib
+import threading
+from collections import deque
+import uuid
+from bisect import bisect_left
 import tempfile
-import subprocess
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, Iterable, BinaryIO, Union
 import logging
 from datetime import datetime
 import json
+from functools import lru_cache
+from src.models.keyword_matcher import KeywordMatcher
+
+# إعدادات ملف الصوت الوهمي: أحادي، 16 بت، 44.1 كيلوهرتز
+_SAMPLE_RATE = 44100
+_SAMPLE_WIDTH = 2
+
+# مخزن صمت ثابت (30 ثانية) تُقتطع منه المقاطع دون نسخ بدلاً من إنشاء بايتات جديدة لكل طلب
+_MAX_CHUNK_SECS = 30
+_SILENCE = memoryview(bytes(_SAMPLE_RATE * _SAMPLE_WIDTH * _MAX_CHUNK_SECS))
+
+# ترويسة WAV للبث المتدفق: حقلا الحجم بأقصى قيمة لأن الطول الكلي غير معروف مسبقاً
+WAV_STREAM_HEADER = struct.pack(
+    '<4sI4s4sIHHIIHH4sI',
+    b'RIFF', 0xFFFFFFFF, b'WAVE',
+    b'fmt ', 16, 1, 1, _SAMPLE_RATE, _SAMPLE_RATE * _SAMPLE_WIDTH, _SAMPLE_WIDTH, _SAMPLE_WIDTH * 8,
+    b'data', 0xFFFFFFFF
+)
+
+# جدول تحويل واحد للرموز الخاصة والأرقام الإنجليزية، يُبنى مرة واحدة عند التحميل
+_SPEECH_TRANS = str.maketrans({
+    '$': 'دولار ',
+    '%': ' بالمئة',
+    '&': ' و ',
+    '@': ' في ',
+    **dict(zip('0123456789', '٠١٢٣٤٥٦٧٨٩')),
+})
+
+# قوالب جمل الملخصات الصوتية
+_SYMBOL_TEMPLATE = "{symbol} يتداول عند {price:.0f} دولار، وقد {change_text} بنسبة {abs_change:.1f} بالمئة خلال آخر 24 ساعة."
+_OPPORTUNITY_TEMPLATE = "{symbol}: {description}. احتمالية النجاح {probability:.0f} بالمئة."
+
+# وصف اتجاه التغير حسب الإشارة (1، -1، 0)
+_CHANGE_WORDS = {1: "ارتفع", -1: "انخفض", 0: "استقر"}
+
+# حدود مستويات التقلب ووصفها
+_VOLATILITY_BOUNDS = (0.3, 0.6)
+_VOLATILITY_LEVELS = ("منخفضة", "متوسطة", "عالية")
+
+# نهاية الجملة: علامة ترقيم يليها فراغ أو نهاية النص (لا تنطبق على 12.50)
+_SENTENCE_END = re.compile(r'[.!?؟](?=\s|$)')
+_ABBREVIATIONS = frozenset({'Dr.', 'Mr.', 'Mrs.', 'Ms.', 'St.', 'vs.', 'e.g.', 'i.e.', 'etc.'})
+_MIN_SENTENCE_LENGTH = 10
+
+# الأصوات المدعومة (ثابتة)
+_SUPPORTED_VOICES = {
+    'female_voice': {
+        'name': 'صوت أنثوي',
+        'language': 'ar',
+        'description': 'صوت أنثوي عربي طبيعي'
+    },
+    'male_voice': {
+        'name': 'صوت ذكوري',
+        'language': 'ar',
+        'description': 'صوت ذكوري عربي طبيعي'
+    }
+}
+
+# أوامر صوتية محتملة لمحاكاة تحويل الكلام إلى نص
+_MOCK_COMMANDS = (
+    "ما هو سعر البيتكوين الحالي؟",
+    "أظهر لي الخطة اليومية",
+    "ما هي التوصيات الحالية؟",
+    "كيف أداء محفظتي اليوم؟",
+    "أريد شراء بيتكوين",
+    "ما هي المخاطر في السوق؟",
+    "أغلق جميع المراكز",
+    "أظهر لي الأرباح والخسائر"
+)
+
+# توحيد أشكال الألف والياء وحذف التطويل قبل مطابقة الأوامر
+_ARABIC_NORM = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ى': 'ي', 'ـ': ''})
+
+# الكلمات المفتاحية للأوامر الصوتية مصنفة حسب النية أو العملة (بعد التوحيد)
+_COMMAND_KEYWORDS = KeywordMatcher({word.translate(_ARABIC_NORM): category for word, category in {
+    'سعر': 'price', 'كم': 'price', 'قيمة': 'price',
+    'بتكوين': 'btc', 'bitcoin': 'btc',
+    'إيثريوم': 'eth', 'ethereum': 'eth',
+    'كاردانو': 'ada',
+    'خطة': 'plan', 'تخطيط': 'plan', 'برنامج': 'plan',
+    'توصية': 'recommend', 'نصيحة': 'recommend', 'اقتراح': 'recommend',
+    'محفظة': 'portfolio', 'أداء': 'portfolio', 'ربح': 'portfolio', 'خسارة': 'portfolio',
+    'شراء': 'buy', 'اشتري': 'buy',
+    'بيع': 'sell', 'بع': 'sell',
+    'إغلاق': 'close', 'أغلق': 'close',
+}.items()})
+
+@lru_cache(maxsize=1024)
+def _analyze_normalized_command(normalized_text: str) -> Optional[Dict[str, Any]]:
+    """تحليل أمر صوتي بعد توحيده، مع تخزين النتائج للأوامر المتكررة"""
+    hits = _COMMAND_KEYWORDS.match(normalized_text)
+    
+    # تحليل بسيط للأوامر الشائعة
+    if 'price' in hits:
+        if 'btc' in hits:
+            return {
+                'command': 'get_price',
+                'parameters': {'symbol': 'BTCUSDT'},
+                'confidence': 0.9
+            }
+        elif 'eth' in hits:
+            return {
+                'command': 'get_price',
+                'parameters': {'symbol': 'ETHUSDT'},
+                'confidence': 0.9
+            }
+    
+    elif 'plan' in hits:
+        return {
+            'command': 'show_daily_plan',
+            'parameters': {},
+            'confidence': 0.8
+        }
+    
+    elif 'recommend' in hits:
+        return {
+            'command': 'show_recommendations',
+            'parameters': {},
+            'confidence': 0.8
+        }
+    
+    elif 'portfolio' in hits:
+        return {
+            'command': 'show_portfolio',
+            'parameters': {},
+            'confidence': 0.8
+        }
+    
+    elif 'buy' in hits:
+        # محاولة استخراج اسم العملة
+        symbol = 'BTCUSDT'  # افتراضي
+        if 'eth' in hits:
+            symbol = 'ETHUSDT'
+        elif 'ada' in hits:
+            symbol = 'ADAUSDT'
+        
+        return {
+            'command': 'place_buy_order',
+            'parameters': {'symbol': symbol},
+            'confidence': 0.7
+        }
+    
+    elif 'sell' in hits:
+        return {
+            'command': 'place_sell_order',
+            'parameters': {},
+            'confidence': 0.7
+        }
+    
+    elif 'close' in hits:
+        return {
+            'command': 'close_positions',
+            'parameters': {},
+            'confidence': 0.8
+        }
+    
+    else:
+        return {
+            'command': 'unknown',
+            'parameters': {},
+            'confidence': 0.3
+        }
+
+
+def _normalize_command_text(text: str) -> str:
+    """توحيد نص الأمر: أحرف صغيرة، توحيد الألف والياء وحذف التطويل"""
+    return text.lower().translate(_ARABIC_NORM)
 
 class VoiceAssistant:
     """المساعد الصوتي للتداول"""
@@ -18,37 +194,97 @@ class VoiceAssistant:
         self.logger = logging.getLogger(__name__)
         self.temp_dir = tempfile.gettempdir()
         
+        # ملفات الصوت المولدة بترتيب إنشائها: التنظيف يحذف من البداية حتى أول ملف حديث
+        # بدلاً من المرور على كل محتويات المجلد المؤقت
+        self._generated = deque()
+        self._generated_at: Dict[str, float] = {}
+        self._generated_lock = threading.Lock()
+        self._index_existing_audio()
+    
+    def _index_existing_audio(self):
+        """فهرسة ملفات الصوت المتبقية من تشغيل سابق (مرة واحدة عند البدء)"""
+        try:
+            with os.scandir(self.temp_dir) as entries:
+                existing = sorted(
+                    (entry.stat().st_ctime, entry.path) for entry in entries
+                    if entry.name.startswith('speech_') and entry.name.endswith('.wav')
+                )
+        except OSError as e:
+            self.logger.error(f"خطأ في فهرسة ملفات الصوت: {e}")
+            return
+        
+        for created_at, path in existing:
+            self._register_audio(path, created_at)
+    
+    def _register_audio(self, audio_path: str, created_at: Optional[float] = None):
+        """تسجيل ملف صوت مولد لتنظيفه لاحقاً"""
+        if created_at is None:
+            created_at = time.time()
+        with self._generated_lock:
+            self._generated.append((created_at, audio_path))
+            self._generated_at[audio_path] = created_at
+        
     def text_to_speech(self, text: str, voice_type: str = 'female_voice', 
                       language: str = 'ar') -> Optional[str]:
         """تحويل النص إلى كلام"""
         try:
-            # تنظيف النص
-            cleaned_text = self._clean_text_for_speech(text)
+            # اسم ملف مشتق من النص ونوع الصوت: النص المكرر يعيد نفس الملف دون إعادة التوليد
+            digest = hashlib.sha1(f"{voice_type}:{text}".encode('utf-8')).hexdigest()[:12]
+            audio_filename = f"speech_{digest}.wav"
             
-            # إنشاء ملف مؤقت للصوت
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            audio_filename = f"speech_{timestamp}.wav"
             audio_path = os.path.join(self.temp_dir, audio_filename)
+            if os.path.exists(audio_path):
+                return audio_path
             
-            # محاكاة تحويل النص إلى كلام
-            # في التطبيق الحقيقي، يمكن استخدام خدمات مثل Google TTS أو Azure Speech
-            self._generate_mock_audio(cleaned_text, audio_path, voice_type)
-            
-            return audio_path
+            return self._sentences_to_speech((text,), voice_type, audio_filename)
             
         except Exception as e:
             self.logger.error(f"خطأ في تحويل النص إلى كلام: {e}")
             return None
     
-    def speech_to_text(self, audio_file_path: str, language: str = 'ar') -> Optional[str]:
-        """تحويل الكلام إلى نص"""
+    def _sentences_to_speech(self, sentences: Iterable[str], voice_type: str,
+                             audio_filename: Optional[str] = None) -> str:
+        """تحويل سلسلة جمل إلى ملف صوتي مؤقت وإرجاع مساره"""
+        # إنشاء ملف مؤقت للصوت
+        if audio_filename is None:
+            # معرف عشوائي بدلاً من الوقت بدقة الثانية: ملخصان في نفس الثانية لا يتصادمان
+            audio_filename = f"speech_{uuid.uuid4().hex[:16]}.wav"
+        audio_path = os.path.join(self.temp_dir, audio_filename)
+        
+        # الكتابة إلى ملف جزئي ثم نقله، حتى لا يُقدَّم لطلب متزامن ملف ناقص
+        partial_path = f"{audio_path[:-4]}.{uuid.uuid4().hex[:8]}.wav"
+        
+        # محاكاة تحويل النص إلى كلام
+        # في التطبيق الحقيقي، يمكن استخدام خدمات مثل Google TTS أو Azure Speech
+        cleaned = (self._clean_text_for_speech(sentence) for sentence in self._iter_sentences(sentences))
+        self._generate_mock_audio(cleaned, partial_path, voice_type)
+        
+        # نقل مباشر بدلاً من فحص الوجود ثم النقل (استدعاء نظام واحد دون سباق)؛
+        # الملف الجزئي يغيب فقط عند فشل كتابة WAV واللجوء للملف النصي
         try:
-            if not os.path.exists(audio_file_path):
-                raise FileNotFoundError(f"ملف الصوت غير موجود: {audio_file_path}")
+            os.replace(partial_path, audio_path)
+        except FileNotFoundError:
+            pass
+        else:
+            self._register_audio(audio_path)
+        
+        return audio_path
+    
+    def synthesize_stream(self, text: str, voice_type: str = 'female_voice',
+                          chunk_ms: int = 20) -> Iterator[bytes]:
+        """تحويل النص إلى كلام كمقاطع PCM متتالية (بدون ترويسة WAV)"""
+        # خوادم WSGI تتطلب bytes وليس memoryview
+        return map(bytes, self._iter_pcm(self._clean_text_for_speech(text), voice_type, chunk_ms))
+    
+    def speech_to_text(self, audio: Union[str, BinaryIO], language: str = 'ar') -> Optional[str]:
+        """تحويل الكلام إلى نص (من مسار ملف أو كائن ملف في الذاكرة)"""
+        try:
+            if isinstance(audio, str) and not os.path.exists(audio):
+                raise FileNotFoundError(f"ملف الصوت غير موجود: {audio}")
             
             # محاكاة تحويل الكلام إلى نص
             # في التطبيق الحقيقي، يمكن استخدام خدمات مثل Google Speech-to-Text
-            transcribed_text = self._mock_speech_recognition(audio_file_path)
+            transcribed_text = self._mock_speech_recognition(audio)
             
             return transcribed_text
             
@@ -60,13 +296,8 @@ class VoiceAssistant:
                                     voice_type: str = 'female_voice') -> Optional[str]:
         """توليد ملخص صوتي للسوق"""
         try:
-            # إنشاء نص الملخص
-            summary_text = self._create_market_summary_text(market_data)
-            
-            # تحويل إلى كلام
-            audio_path = self.text_to_speech(summary_text, voice_type)
-            
-            return audio_path
+            # تحويل الملخص إلى كلام جملةً جملة أثناء تكوينه
+            return self._sentences_to_speech(self._iter_market_summary_parts(market_data), voice_type)
             
         except Exception as e:
             self.logger.error(f"خطأ في توليد الملخص الصوتي: {e}")
@@ -76,13 +307,8 @@ class VoiceAssistant:
                                 voice_type: str = 'female_voice') -> Optional[str]:
         """توليد صوت للخطة اليومية"""
         try:
-            # إنشاء نص الخطة
-            plan_text = self._create_daily_plan_text(daily_plan)
-            
-            # تحويل إلى كلام
-            audio_path = self.text_to_speech(plan_text, voice_type)
-            
-            return audio_path
+            # تحويل الخطة إلى كلام جملةً جملة أثناء تكوينها
+            return self._sentences_to_speech(self._iter_daily_plan_parts(daily_plan), voice_type)
             
         except Exception as e:
             self.logger.error(f"خطأ في توليد صوت الخطة اليومية: {e}")
@@ -104,11 +330,11 @@ class VoiceAssistant:
             self.logger.error(f"خطأ في توليد التنبيه الصوتي: {e}")
             return None
     
-    def process_voice_command(self, audio_file_path: str) -> Dict[str, Any]:
+    def process_voice_command(self, audio: Union[str, BinaryIO]) -> Dict[str, Any]:
         """معالجة أمر صوتي"""
         try:
             # تحويل الصوت إلى نص
-            text = self.speech_to_text(audio_file_path)
+            text = self.speech_to_text(audio)
             
             if not text:
                 return {
@@ -136,129 +362,153 @@ class VoiceAssistant:
     
     def _clean_text_for_speech(self, text: str) -> str:
         """تنظيف النص للكلام"""
-        # إزالة الرموز الخاصة
-        cleaned = text.replace('$', 'دولار ')
-        cleaned = cleaned.replace('%', ' بالمئة')
-        cleaned = cleaned.replace('&', ' و ')
-        cleaned = cleaned.replace('@', ' في ')
+        # استبدال الرموز الخاصة وتحويل الأرقام إلى عربية في مرور واحد،
+        # ثم إزالة المسافات الزائدة
+        return ' '.join(text.translate(_SPEECH_TRANS).split())
+    
+    def _iter_pcm(self, text: str, voice_type: str, chunk_ms: int) -> Iterator[memoryview]:
+        """توليد مقاطع PCM وهمية (صمت) بطول مقدر من النص"""
+        # في التطبيق الحقيقي، هنا سيتم بث مخرجات خدمة TTS
+        duration = max(len(text) * 0.1, 1.0)  # تقدير المدة بناءً على طول النص
         
-        # تحويل الأرقام الإنجليزية إلى عربية للنطق الأفضل
-        english_to_arabic = str.maketrans('0123456789', '٠١٢٣٤٥٦٧٨٩')
-        cleaned = cleaned.translate(english_to_arabic)
+        remaining = int(duration * _SAMPLE_RATE) * _SAMPLE_WIDTH
+        chunk_bytes = max(int(_SAMPLE_RATE * chunk_ms / 1000), 1) * _SAMPLE_WIDTH
+        chunk = _SILENCE[:min(chunk_bytes, len(_SILENCE))]
         
-        # إزالة المسافات الزائدة
-        cleaned = ' '.join(cleaned.split())
+        while remaining >= len(chunk):
+            yield chunk
+            remaining -= len(chunk)
         
-        return cleaned
+        if remaining:
+            yield chunk[:remaining]
     
-    def _generate_mock_audio(self, text: str, output_path: str, voice_type: str):
+    def _generate_mock_audio(self, sentences: Iterable[str], output_path: str, voice_type: str):
         """توليد صوت وهمي للاختبار"""
-        # إنشاء ملف صوتي فارغ للاختبار
-        # في التطبيق الحقيقي، هنا سيتم استدعاء خدمة TTS
+        sentences = iter(sentences)
+        spoken = []
         
-        # إنشاء ملف WAV بسيط
-        duration = max(len(text) * 0.1, 1.0)  # تقدير المدة بناءً على طول النص
-        
-        # استخدام أداة مدمجة لإنشاء صوت بسيط
+        # كتابة ملف WAV من نفس مقاطع البث بأكبر مقطع ممكن لتقليل عدد الكتابات،
+        # بدءاً من أول جملة دون انتظار اكتمال النص
         try:
-            # إنشاء ملف صوتي صامت بالمدة المحسوبة
-            subprocess.run([
-                'ffmpeg', '-f', 'lavfi', '-i', f'anullsrc=duration={duration}:sample_rate=44100:channel_layout=mono',
-                '-y', output_path
-            ], check=True, capture_output=True)
+            with wave.open(output_path, 'wb') as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(_SAMPLE_WIDTH)
+                wav_file.setframerate(_SAMPLE_RATE)
+                
+                for sentence in sentences:
+                    spoken.append(sentence)
+                    for chunk in self._iter_pcm(sentence, voice_type, chunk_ms=_MAX_CHUNK_SECS * 1000):
+                        wav_file.writeframesraw(chunk)
             
             self.logger.info(f"تم إنشاء ملف صوتي وهمي: {output_path}")
             
-        except subprocess.CalledProcessError:
-            # إذا لم يكن ffmpeg متاحاً، إنشاء ملف نصي بدلاً من ذلك
+        except (OSError, wave.Error):
+            # إذا تعذرت كتابة الملف الصوتي، إنشاء ملف نصي بدلاً من ذلك
+            text = ' '.join(spoken + list(sentences))
             with open(output_path.replace('.wav', '.txt'), 'w', encoding='utf-8') as f:
                 f.write(f"نص للتحويل الصوتي: {text}\nنوع الصوت: {voice_type}")
             
             self.logger.warning("تم إنشاء ملف نصي بدلاً من الصوت")
     
-    def _mock_speech_recognition(self, audio_file_path: str) -> str:
+    def _mock_speech_recognition(self, audio: Union[str, BinaryIO]) -> str:
         """محاكاة تحويل الكلام إلى نص"""
         # في التطبيق الحقيقي، هنا سيتم استدعاء خدمة STT
         
-        # أوامر صوتية محتملة للاختبار
-        mock_commands = [
-            "ما هو سعر البيتكوين الحالي؟",
-            "أظهر لي الخطة اليومية",
-            "ما هي التوصيات الحالية؟",
-            "كيف أداء محفظتي اليوم؟",
-            "أريد شراء بيتكوين",
-            "ما هي المخاطر في السوق؟",
-            "أغلق جميع المراكز",
-            "أظهر لي الأرباح والخسائر"
-        ]
-        
         # اختيار أمر عشوائي للاختبار
-        import random
-        return random.choice(mock_commands)
+        return random.choice(_MOCK_COMMANDS)
     
     def _create_market_summary_text(self, market_data: Dict[str, Any]) -> str:
         """إنشاء نص ملخص السوق"""
-        summary_parts = []
+        return " ".join(self._iter_market_summary_parts(market_data))
+    
+    def _create_daily_plan_text(self, daily_plan: Dict[str, Any]) -> str:
+        """إنشاء نص الخطة اليومية"""
+        return " ".join(self._iter_daily_plan_parts(daily_plan))
+    
+    def _iter_sentences(self, fragments: Iterable[str]) -> Iterator[str]:
+        """تجميع أجزاء النص وإخراجها جملةً جملة فور اكتمال كل جملة"""
+        buffer = ''
         
+        for fragment in fragments:
+            buffer = f"{buffer} {fragment}" if buffer else fragment
+            start = 0
+            
+            for match in _SENTENCE_END.finditer(buffer):
+                sentence = buffer[start:match.end()].strip()
+                
+                # تجاهل النهايات داخل الاختصارات والجمل القصيرة جداً
+                if len(sentence) < _MIN_SENTENCE_LENGTH or sentence.rsplit(None, 1)[-1] in _ABBREVIATIONS:
+                    continue
+                
+                yield sentence
+                start = match.end()
+            
+            buffer = buffer[start:].lstrip()
+        
+        # إخراج ما تبقى عند نهاية النص
+        if buffer.strip():
+            yield buffer.strip()
+    
+    def _iter_market_summary_parts(self, market_data: Dict[str, Any]) -> Iterator[str]:
+        """أجزاء نص ملخص السوق بالترتيب"""
         # مقدمة
-        summary_parts.append("ملخص السوق الحالي.")
+        yield "ملخص السوق الحالي."
         
         # معلومات عامة
         if 'overall_trend' in market_data:
-            summary_parts.append(f"الاتجاه العام للسوق {market_data['overall_trend']}.")
+            yield f"الاتجاه العام للسوق {market_data['overall_trend']}."
         
         if 'volatility' in market_data:
-            volatility_level = "عالية" if market_data['volatility'] > 0.6 else "متوسطة" if market_data['volatility'] > 0.3 else "منخفضة"
-            summary_parts.append(f"مستوى التقلبات {volatility_level}.")
+            volatility_level = _VOLATILITY_LEVELS[bisect_left(_VOLATILITY_BOUNDS, market_data['volatility'])]
+            yield f"مستوى التقلبات {volatility_level}."
         
         # أسعار العملات الرئيسية
         if 'symbols_analysis' in market_data:
-            summary_parts.append("أسعار العملات الرئيسية:")
+            yield "أسعار العملات الرئيسية:"
             
+            format_symbol = _SYMBOL_TEMPLATE.format
             for symbol, data in market_data['symbols_analysis'].items():
-                price = data.get('price', 0)
                 change = data.get('change_24h', 0)
-                change_text = "ارتفع" if change > 0 else "انخفض" if change < 0 else "استقر"
                 
-                summary_parts.append(f"{symbol} يتداول عند {price:.0f} دولار، وقد {change_text} بنسبة {abs(change):.1f} بالمئة خلال آخر 24 ساعة.")
-        
-        return " ".join(summary_parts)
+                yield format_symbol(
+                    symbol=symbol,
+                    price=data.get('price', 0),
+                    change_text=_CHANGE_WORDS[(change > 0) - (change < 0)],
+                    abs_change=abs(change)
+                )
     
-    def _create_daily_plan_text(self, daily_plan: Dict[str, Any]) -> str:
-        """إنشاء نص الخطة اليومية"""
-        plan_parts = []
-        
+    def _iter_daily_plan_parts(self, daily_plan: Dict[str, Any]) -> Iterator[str]:
+        """أجزاء نص الخطة اليومية بالترتيب"""
         # مقدمة
-        plan_parts.append("الخطة اليومية للتداول.")
+        yield "الخطة اليومية للتداول."
         
         # نظرة عامة على السوق
         if 'market_outlook' in daily_plan:
-            plan_parts.append(f"نظرة عامة على السوق: {daily_plan['market_outlook']}.")
+            yield f"نظرة عامة على السوق: {daily_plan['market_outlook']}."
         
         # الفرص المتاحة
         if 'opportunities' in daily_plan and daily_plan['opportunities']:
-            plan_parts.append("الفرص المتاحة اليوم:")
+            yield "الفرص المتاحة اليوم:"
             
+            format_opportunity = _OPPORTUNITY_TEMPLATE.format
             for opportunity in daily_plan['opportunities']:
-                symbol = opportunity.get('symbol', 'غير محدد')
-                description = opportunity.get('description', '')
-                probability = opportunity.get('probability', 0) * 100
-                
-                plan_parts.append(f"{symbol}: {description}. احتمالية النجاح {probability:.0f} بالمئة.")
+                yield format_opportunity(
+                    symbol=opportunity.get('symbol', 'غير محدد'),
+                    description=opportunity.get('description', ''),
+                    probability=opportunity.get('probability', 0) * 100
+                )
         
         # المخاطر
         if 'risks' in daily_plan and daily_plan['risks']:
-            plan_parts.append("المخاطر المحتملة:")
+            yield "المخاطر المحتملة:"
             for risk in daily_plan['risks']:
-                plan_parts.append(f"{risk}.")
+                yield f"{risk}."
         
         # التوصيات
         if 'recommendations' in daily_plan and daily_plan['recommendations']:
-            plan_parts.append("التوصيات العامة:")
+            yield "التوصيات العامة:"
             for recommendation in daily_plan['recommendations']:
-                plan_parts.append(f"{recommendation}.")
-        
-        return " ".join(plan_parts)
+                yield f"{recommendation}."
     
     def _format_alert_message(self, message: str, alert_type: str) -> str:
         """تنسيق رسالة التنبيه"""
@@ -274,107 +524,37 @@ class VoiceAssistant:
     
     def _analyze_voice_command(self, text: str) -> Dict[str, Any]:
         """تحليل الأمر الصوتي"""
-        text_lower = text.lower()
-        
-        # تحليل بسيط للأوامر الشائعة
-        if any(word in text_lower for word in ['سعر', 'كم', 'قيمة']):
-            if 'بتكوين' in text_lower or 'bitcoin' in text_lower:
-                return {
-                    'command': 'get_price',
-                    'parameters': {'symbol': 'BTCUSDT'},
-                    'confidence': 0.9
-                }
-            elif 'إيثريوم' in text_lower or 'ethereum' in text_lower:
-                return {
-                    'command': 'get_price',
-                    'parameters': {'symbol': 'ETHUSDT'},
-                    'confidence': 0.9
-                }
-        
-        elif any(word in text_lower for word in ['خطة', 'تخطيط', 'برنامج']):
-            return {
-                'command': 'show_daily_plan',
-                'parameters': {},
-                'confidence': 0.8
-            }
-        
-        elif any(word in text_lower for word in ['توصية', 'نصيحة', 'اقتراح']):
-            return {
-                'command': 'show_recommendations',
-                'parameters': {},
-                'confidence': 0.8
-            }
-        
-        elif any(word in text_lower for word in ['محفظة', 'أداء', 'ربح', 'خسارة']):
-            return {
-                'command': 'show_portfolio',
-                'parameters': {},
-                'confidence': 0.8
-            }
-        
-        elif any(word in text_lower for word in ['شراء', 'اشتري']):
-            # محاولة استخراج اسم العملة
-            symbol = 'BTCUSDT'  # افتراضي
-            if 'إيثريوم' in text_lower:
-                symbol = 'ETHUSDT'
-            elif 'كاردانو' in text_lower:
-                symbol = 'ADAUSDT'
-            
-            return {
-                'command': 'place_buy_order',
-                'parameters': {'symbol': symbol},
-                'confidence': 0.7
-            }
-        
-        elif any(word in text_lower for word in ['بيع', 'بع']):
-            return {
-                'command': 'place_sell_order',
-                'parameters': {},
-                'confidence': 0.7
-            }
-        
-        elif any(word in text_lower for word in ['إغلاق', 'أغلق']):
-            return {
-                'command': 'close_positions',
-                'parameters': {},
-                'confidence': 0.8
-            }
+        result = _analyze_normalized_command(_normalize_command_text(text))
+        if result is None:
+            return None
         
-        else:
-            return {
-                'command': 'unknown',
-                'parameters': {},
-                'confidence': 0.3
-            }
+        # نسخة مستقلة حتى لا يُعدّل المستدعي النتيجة المخزنة
+        return {**result, 'parameters': dict(result['parameters'])}
     
     def get_supported_voices(self) -> Dict[str, Dict[str, str]]:
         """الحصول على الأصوات المدعومة"""
-        return {
-            'female_voice': {
-                'name': 'صوت أنثوي',
-                'language': 'ar',
-                'description': 'صوت أنثوي عربي طبيعي'
-            },
-            'male_voice': {
-                'name': 'صوت ذكوري',
-                'language': 'ar',
-                'description': 'صوت ذكوري عربي طبيعي'
-            }
-        }
+        return _SUPPORTED_VOICES
     
     def cleanup_temp_files(self, max_age_hours: int = 24):
         """تنظيف الملفات المؤقتة"""
         try:
-            current_time = datetime.now()
+            cutoff = time.time() - max_age_hours * 3600
+            
+            expired = []
+            with self._generated_lock:
+                while self._generated and self._generated[0][0] < cutoff:
+                    created_at, path = self._generated.popleft()
+                    # ملف أعيد توليده بعد هذا المدخل له مدخل أحدث يبقى حتى يحين وقته
+                    if self._generated_at.get(path) == created_at:
+                        del self._generated_at[path]
+                        expired.append(path)
             
-            for filename in os.listdir(self.temp_dir):
-                if filename.startswith('speech_') and filename.endswith('.wav'):
-                    file_path = os.path.join(self.temp_dir, filename)
-                    file_time = datetime.fromtimestamp(os.path.getctime(file_path))
-                    
-                    if (current_time - file_time).total_seconds() > max_age_hours * 3600:
-                        os.remove(file_path)
-                        self.logger.info(f"تم حذف الملف المؤقت: {filename}")
+            for path in expired:
+                try:
+                    os.remove(path)
+                    self.logger.info(f"تم حذف الملف المؤقت: {os.path.basename(path)}")
+                except FileNotFoundError:
+                    pass
                         
         except Exception as e:
             self.logger.error(f"خطأ في تنظيف الملفات المؤقتة: {e}")
@@ -382,12 +562,12 @@ class VoiceAssistant:
     def get_voice_stats(self) -> Dict[str, Any]:
         """إحصائيات المساعد الصوتي"""
         try:
-            temp_files = [f for f in os.listdir(self.temp_dir) 
-                         if f.startswith('speech_') and f.endswith('.wav')]
+            with self._generated_lock:
+                temp_files_count = len(self._generated_at)
             
             return {
-                'temp_files_count': len(temp_files),
-                'supported_voices': len(self.get_supported_voices()),
+                'temp_files_count': temp_files_count,
+                'supported_voices': len(_SUPPORTED_VOICES),
                 'temp_directory': self.temp_dir,
                 'last_cleanup': datetime.now().isoformat()
             }
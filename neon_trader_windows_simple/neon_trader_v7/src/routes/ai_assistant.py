@@ -5,6 +5,8 @@
 from flask import Blueprint, request, jsonify
 from src.models.ai_assistant import AIAssistant, MarketSignal, DailyPlan
 from src.models.auth import require_auth
+from src.models.keyword_matcher import KeywordMatcher
+from src.routes.async_loop import run_async
 import asyncio
 import json
 from datetime import datetime
@@ -12,6 +14,31 @@ from datetime import datetime
 ai_bp = Blueprint('ai', __name__)
 assistant = AIAssistant()
 
+# أقصى انتظار لنتيجة المساعد (ثوانٍ)، بنفس مهلة خطة اليوم الصوتية
+_AI_TIMEOUT = 30
+
+
+def _run(coro):
+    """تشغيل دالة المساعد على الحلقة المشتركة مع مهلة حتى لا يُحجز خيط الطلب"""
+    return run_async(coro, timeout=_AI_TIMEOUT)
+
+
+async def _analyze_symbols(symbols):
+    """تحليل فرص التداول لعدة رموز بالتوازي"""
+    return await asyncio.gather(
+        *[assistant.analyze_trading_opportunity(symbol) for symbol in symbols]
+    )
+
+# الكلمات المفتاحية لرسائل الدردشة مصنفة حسب الموضوع
+_CHAT_KEYWORDS = KeywordMatcher({
+    'سعر': 'price',
+    'بتكوين': 'btc',
+    'توصية': 'recommend', 'نصيحة': 'recommend',
+    'مخاطر': 'risk',
+    'استراتيجية': 'strategy',
+    'مساعدة': 'help', 'help': 'help',
+})
+
 @ai_bp.route('/daily-plan', methods=['GET'])
 @require_auth
 def get_daily_plan():
@@ -22,25 +49,19 @@ def get_daily_plan():
             symbols = ['BTCUSDT', 'ETHUSDT', 'ADAUSDT', 'SOLUSDT']
         
         # تشغيل الدالة غير المتزامنة
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        plan = _run(assistant.generate_daily_plan(symbols))
         
-        try:
-            plan = loop.run_until_complete(assistant.generate_daily_plan(symbols))
-            
-            return jsonify({
-                'success': True,
-                'plan': {
-                    'date': plan.date,
-                    'market_outlook': plan.market_outlook,
-                    'key_levels': plan.key_levels,
-                    'opportunities': plan.opportunities,
-                    'risks': plan.risks,
-                    'recommendations': plan.recommendations
-                }
-            })
-        finally:
-            loop.close()
+        return jsonify({
+            'success': True,
+            'plan': {
+                'date': plan.date,
+                'market_outlook': plan.market_outlook,
+                'key_levels': plan.key_levels,
+                'opportunities': plan.opportunities,
+                'risks': plan.risks,
+                'recommendations': plan.recommendations
+            }
+        })
             
     except Exception as e:
         return jsonify({
@@ -64,29 +85,23 @@ def analyze_opportunity():
             }), 400
         
         # تشغيل الدالة غير المتزامنة
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        signal = _run(
+            assistant.analyze_trading_opportunity(symbol, timeframe)
+        )
         
-        try:
-            signal = loop.run_until_complete(
-                assistant.analyze_trading_opportunity(symbol, timeframe)
-            )
-            
-            return jsonify({
-                'success': True,
-                'signal': {
-                    'symbol': signal.symbol,
-                    'action': signal.action,
-                    'confidence': signal.confidence,
-                    'entry_price': signal.entry_price,
-                    'stop_loss': signal.stop_loss,
-                    'take_profit': signal.take_profit,
-                    'reasoning': signal.reasoning,
-                    'timestamp': signal.timestamp.isoformat()
-                }
-            })
-        finally:
-            loop.close()
+        return jsonify({
+            'success': True,
+            'signal': {
+                'symbol': signal.symbol,
+                'action': signal.action,
+                'confidence': signal.confidence,
+                'entry_price': signal.entry_price,
+                'stop_loss': signal.stop_loss,
+                'take_profit': signal.take_profit,
+                'reasoning': signal.reasoning,
+                'timestamp': signal.timestamp.isoformat()
+            }
+        })
             
     except Exception as e:
         return jsonify({
@@ -104,18 +119,12 @@ def get_market_insights():
             symbols = ['BTCUSDT', 'ETHUSDT', 'ADAUSDT']
         
         # تشغيل الدالة غير المتزامنة
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        insights = _run(assistant.get_market_insights(symbols))
         
-        try:
-            insights = loop.run_until_complete(assistant.get_market_insights(symbols))
-            
-            return jsonify({
-                'success': True,
-                'insights': insights
-            })
-        finally:
-            loop.close()
+        return jsonify({
+            'success': True,
+            'insights': insights
+        })
             
     except Exception as e:
         return jsonify({
@@ -132,20 +141,14 @@ def evaluate_portfolio_risk():
         positions = data.get('positions', [])
         
         # تشغيل الدالة غير المتزامنة
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        risk_analysis = _run(
+            assistant.evaluate_portfolio_risk(positions)
+        )
         
-        try:
-            risk_analysis = loop.run_until_complete(
-                assistant.evaluate_portfolio_risk(positions)
-            )
-            
-            return jsonify({
-                'success': True,
-                'risk_analysis': risk_analysis
-            })
-        finally:
-            loop.close()
+        return jsonify({
+            'success': True,
+            'risk_analysis': risk_analysis
+        })
             
     except Exception as e:
         return jsonify({
@@ -162,32 +165,24 @@ def get_recommendations():
         symbols = ['BTCUSDT', 'ETHUSDT', 'ADAUSDT', 'SOLUSDT']
         recommendations = []
         
-        # تشغيل الدالة غير المتزامنة
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # تحليل جميع الرموز بالتوازي على الحلقة المشتركة
+        results = _run(_analyze_symbols(symbols))
         
-        try:
-            for symbol in symbols:
-                signal = loop.run_until_complete(
-                    assistant.analyze_trading_opportunity(symbol)
-                )
-                
-                if signal.action != 'hold' and signal.confidence > 0.6:
-                    recommendations.append({
-                        'symbol': signal.symbol,
-                        'action': signal.action,
-                        'confidence': signal.confidence,
-                        'entry_price': signal.entry_price,
-                        'reasoning': signal.reasoning,
-                        'timestamp': signal.timestamp.isoformat()
-                    })
-            
-            return jsonify({
-                'success': True,
-                'recommendations': recommendations
-            })
-        finally:
-            loop.close()
+        for signal in results:
+            if signal.action != 'hold' and signal.confidence > 0.6:
+                recommendations.append({
+                    'symbol': signal.symbol,
+                    'action': signal.action,
+                    'confidence': signal.confidence,
+                    'entry_price': signal.entry_price,
+                    'reasoning': signal.reasoning,
+                    'timestamp': signal.timestamp.isoformat()
+                })
+        
+        return jsonify({
+            'success': True,
+            'recommendations': recommendations
+        })
             
     except Exception as e:
         return jsonify({
@@ -237,35 +232,27 @@ def get_strategy_signals():
         
         signals = []
         
-        # تشغيل الدالة غير المتزامنة
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # تحليل جميع الرموز بالتوازي على الحلقة المشتركة
+        results = _run(_analyze_symbols(symbols))
         
-        try:
-            for symbol in symbols:
-                signal = loop.run_until_complete(
-                    assistant.analyze_trading_opportunity(symbol)
-                )
-                
-                signals.append({
-                    'symbol': signal.symbol,
-                    'action': signal.action,
-                    'confidence': signal.confidence,
-                    'entry_price': signal.entry_price,
-                    'stop_loss': signal.stop_loss,
-                    'take_profit': signal.take_profit,
-                    'reasoning': signal.reasoning,
-                    'strategy': strategy,
-                    'timestamp': signal.timestamp.isoformat()
-                })
-            
-            return jsonify({
-                'success': True,
+        for signal in results:
+            signals.append({
+                'symbol': signal.symbol,
+                'action': signal.action,
+                'confidence': signal.confidence,
+                'entry_price': signal.entry_price,
+                'stop_loss': signal.stop_loss,
+                'take_profit': signal.take_profit,
+                'reasoning': signal.reasoning,
                 'strategy': strategy,
-                'signals': signals
+                'timestamp': signal.timestamp.isoformat()
             })
-        finally:
-            loop.close()
+        
+        return jsonify({
+            'success': True,
+            'strategy': strategy,
+            'signals': signals
+        })
             
     except Exception as e:
         return jsonify({
@@ -275,22 +262,22 @@ def get_strategy_signals():
 
 def process_chat_message(message: str) -> str:
     """معالجة رسالة الدردشة"""
-    message_lower = message.lower()
+    hits = _CHAT_KEYWORDS.match(message.lower())
     
     # ردود بسيطة للأسئلة الشائعة
-    if 'سعر' in message_lower and 'بتكوين' in message_lower:
+    if 'price' in hits and 'btc' in hits:
         return "سعر البيتكوين الحالي حوالي $45,000. يمكنك مراقبة الأسعار في الوقت الفعلي من خلال لوحة التحكم."
     
-    elif 'توصية' in message_lower or 'نصيحة' in message_lower:
+    elif 'recommend' in hits:
         return "أنصحك بمراجعة الخطة اليومية والتوصيات الحالية. تذكر دائماً استخدام إدارة المخاطر المناسبة."
     
-    elif 'مخاطر' in message_lower:
+    elif 'risk' in hits:
         return "إدارة المخاطر أهم من الأرباح. استخدم دائماً وقف الخسارة ولا تخاطر بأكثر من 2% من رأس المال في صفقة واحدة."
     
-    elif 'استراتيجية' in message_lower:
+    elif 'strategy' in hits:
         return "نستخدم استراتيجية Donchian Breakout مع تحليل الذكاء الاصطناعي. يمكنك مراجعة الإشارات في قسم المساعد الذكي."
     
-    elif 'مساعدة' in message_lower or 'help' in message_lower:
+    elif 'help' in hits:
         return """يمكنني مساعدتك في:
         
 • تحليل الأسواق والأسعار
@@ -0,0 +1,22 @@
+"""
+حلقة أحداث مشتركة لتشغيل دوال المساعد غير المتزامنة من مسارات Flask المتزامنة
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+
+# حلقة دائمة واحدة في خيط خلفي بدلاً من إنشاء حلقة وإغلاقها مع كل طلب
+_loop = asyncio.new_event_loop()
+threading.Thread(target=_loop.run_forever, name='async-routes-loop', daemon=True).start()
+
+
+def run_async(coro, timeout: float = None):
+    """تشغيل دالة غير متزامنة على الحلقة المشتركة وانتظار نتيجتها"""
+    future = asyncio.run_coroutine_threadsafe(coro, _loop)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        # إلغاء المهمة المتأخرة بدلاً من تركها تعمل على الحلقة
+        future.cancel()
+        raise
@@ -2,99 +2,136 @@
 مسارات API للمصادقة والجلسات
 """
 
-from flask import Blueprint, request, jsonify, current_app
-from src.models.auth import AuthManager, require_auth, User
+from flask import Blueprint, request, jsonify, current_app, g
+from sqlalchemy.orm import load_only
+from src.models.auth import get_auth_manager, require_auth, User
 from src.models.vault import VaultManager
 from src.models.user import db
+from src.routes.request_utils import read_json, RateLimiter, rate_limited
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import os
 
 auth_bp = Blueprint('auth', __name__)
 
+# حد لكل IP قبل التجزئة المكلفة لكلمة المرور: 10 محاولات متتالية ثم محاولة كل 6 ثوانٍ
+_auth_limiter = RateLimiter(capacity=10, per_seconds=60)
+
+
+@auth_bp.record_once
+def _init_rekey_state(state):
+    """
+    تهيئة مجمع خيوط إعادة تشفير الخزائن وحالة آخر مهمة لكل مستخدم
+    """
+    state.app.extensions['rekey_pool'] = ThreadPoolExecutor(max_workers=2, thread_name_prefix='vault-rekey')
+    state.app.extensions['rekey_jobs'] = {}
+
+
+def _rekey_vault(vault_path: str, current_password: str, new_password: str) -> str:
+    """
+    إعادة تشفير الخزنة بكلمة المرور الجديدة (تعمل خارج خيط الطلب)
+    """
+    # بنفس ترتيب كتابات الملف: تنتظر الحفظ المعلق ولا تستبدلها لقطة أقدم
+    return VaultManager(vault_path).rekey(current_password, new_password)
+
+
+def _track_rekey_job(jobs: dict, user_id: int, job):
+    """
+    تسجيل مهمة إعادة التشفير للمستخدم؛ عند انتهائها تُستبدل بنتيجتها النصية فلا يبقى Future محفوظاً
+    """
+    jobs[user_id] = job
+    
+    def _finished(done):
+        status = "failed" if done.exception() is not None else done.result()
+        if jobs.get(user_id) is done:
+            jobs[user_id] = status
+    
+    job.add_done_callback(_finished)
+
+
+@lru_cache(maxsize=1024)
+def _validate_body(user_id: int, username: str) -> str:
+    """
+    جسم رد validate مرمّز مسبقاً لكل مستخدم (يتغير فقط باسم المستخدم ومعرفه)
+    """
+    return current_app.json.dumps({
+        "valid": True,
+        "user": {
+            "id": user_id,
+            "username": username
+        }
+    })
+
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limited(_auth_limiter)
 def register():
     """
     تسجيل مستخدم جديد
     """
-    try:
-        data = request.get_json()
+    data, error = read_json()
+    if error:
+        return error
+    
+    username = data.get('username')
+    master_password = data.get('master_password')
+    enable_2fa = data.get('enable_2fa', False)
+    
+    if not username or not master_password:
+        return jsonify({"error": "اسم المستخدم وكلمة المرور مطلوبان"}), 400
+    
+    if len(master_password) < 8:
+        return jsonify({"error": "كلمة المرور يجب أن تكون 8 أحرف على الأقل"}), 400
+    
+    auth_manager = get_auth_manager()
+    result = auth_manager.register_user(username, master_password, enable_2fa)
+    
+    if result["success"]:
+        # إنشاء خزنة فارغة للمستخدم الجديد
+        vault_path = os.path.join(current_app.config['VAULTS_DIR'], f"vault_{username}.enc")
         
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
-        
-        username = data.get('username')
-        master_password = data.get('master_password')
-        enable_2fa = data.get('enable_2fa', False)
-        
-        if not username or not master_password:
-            return jsonify({"error": "اسم المستخدم وكلمة المرور مطلوبان"}), 400
-        
-        if len(master_password) < 8:
-            return jsonify({"error": "كلمة المرور يجب أن تكون 8 أحرف على الأقل"}), 400
+        vault_manager = VaultManager(vault_path)
+        vault_created = vault_manager.create_vault(master_password)
         
-        auth_manager = AuthManager(current_app.config['SECRET_KEY'])
-        result = auth_manager.register_user(username, master_password, enable_2fa)
+        if not vault_created:
+            return jsonify({"error": "فشل في إنشاء الخزنة"}), 500
         
-        if result["success"]:
-            # إنشاء خزنة فارغة للمستخدم الجديد
-            vault_path = os.path.join(
-                os.path.dirname(current_app.instance_path), 
-                'vaults', 
-                f"vault_{username}.enc"
-            )
-            
-            # إنشاء مجلد الخزائن إذا لم يكن موجوداً
-            os.makedirs(os.path.dirname(vault_path), exist_ok=True)
-            
-            vault_manager = VaultManager(vault_path)
-            vault_created = vault_manager.create_vault(master_password)
-            
-            if not vault_created:
-                return jsonify({"error": "فشل في إنشاء الخزنة"}), 500
-            
-            return jsonify(result), 201
-        else:
-            return jsonify(result), 400
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+        return jsonify(result), 201
+    else:
+        return jsonify(result), 400
 
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limited(_auth_limiter)
 def login():
     """
     تسجيل الدخول
     """
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
-        
-        username = data.get('username')
-        master_password = data.get('master_password')
-        totp_code = data.get('totp_code')
-        
-        if not username or not master_password:
-            return jsonify({"error": "اسم المستخدم وكلمة المرور مطلوبان"}), 400
-        
-        # الحصول على معلومات الطلب
-        ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-        user_agent = request.headers.get('User-Agent')
-        
-        auth_manager = AuthManager(current_app.config['SECRET_KEY'])
-        result = auth_manager.authenticate_user(
-            username, master_password, totp_code, ip_address, user_agent
-        )
-        
-        if result["success"]:
-            return jsonify(result), 200
-        else:
-            status_code = 401 if "requires_2fa" not in result else 200
-            return jsonify(result), status_code
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    data, error = read_json()
+    if error:
+        return error
+    
+    username = data.get('username')
+    master_password = data.get('master_password')
+    totp_code = data.get('totp_code')
+    
+    if not username or not master_password:
+        return jsonify({"error": "اسم المستخدم وكلمة المرور مطلوبان"}), 400
+    
+    # الحصول على معلومات الطلب
+    ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
+    user_agent = request.headers.get('User-Agent')
+    
+    auth_manager = get_auth_manager()
+    result = auth_manager.authenticate_user(
+        username, master_password, totp_code, ip_address, user_agent
+    )
+    
+    if result["success"]:
+        return jsonify(result), 200
+    else:
+        status_code = 401 if "requires_2fa" not in result else 200
+        return jsonify(result), status_code
 
 
 @auth_bp.route('/logout', methods=['POST'])
@@ -103,20 +140,15 @@ def logout():
     """
     تسجيل الخروج
     """
-    try:
-        auth_header = request.headers.get('Authorization')
-        session_token = auth_header.split(' ')[1]
-        
-        auth_manager = AuthManager(current_app.config['SECRET_KEY'])
-        success = auth_manager.logout_session(session_token)
-        
-        if success:
-            return jsonify({"message": "تم تسجيل الخروج بنجاح"}), 200
-        else:
-            return jsonify({"error": "فشل في تسجيل الخروج"}), 400
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    session_token = g.session_token
+    
+    auth_manager = get_auth_manager()
+    success = auth_manager.logout_session(session_token)
+    
+    if success:
+        return jsonify({"message": "تم تسجيل الخروج بنجاح"}), 200
+    else:
+        return jsonify({"error": "فشل في تسجيل الخروج"}), 400
 
 
 @auth_bp.route('/logout-all', methods=['POST'])
@@ -125,19 +157,15 @@ def logout_all():
     """
     تسجيل الخروج من جميع الجلسات
     """
-    try:
-        user_id = request.current_user["user_id"]
-        
-        auth_manager = AuthManager(current_app.config['SECRET_KEY'])
-        success = auth_manager.logout_all_sessions(user_id)
-        
-        if success:
-            return jsonify({"message": "تم تسجيل الخروج من جميع الجلسات"}), 200
-        else:
-            return jsonify({"error": "فشل في تسجيل الخروج"}), 400
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    
+    auth_manager = get_auth_manager()
+    success = auth_manager.logout_all_sessions(user_id)
+    
+    if success:
+        return jsonify({"message": "تم تسجيل الخروج من جميع الجلسات"}), 200
+    else:
+        return jsonify({"error": "فشل في تسجيل الخروج"}), 400
 
 
 @auth_bp.route('/validate', methods=['GET'])
@@ -146,17 +174,8 @@ def validate():
     """
     التحقق من صحة الجلسة
     """
-    try:
-        return jsonify({
-            "valid": True,
-            "user": {
-                "id": request.current_user["user_id"],
-                "username": request.current_user["username"]
-            }
-        }), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    body = _validate_body(request.current_user["user_id"], request.current_user["username"])
+    return current_app.response_class(body, mimetype='application/json'), 200
 
 
 @auth_bp.route('/sessions', methods=['GET'])
@@ -165,16 +184,12 @@ def get_sessions():
     """
     الحصول على الجلسات النشطة
     """
-    try:
-        user_id = request.current_user["user_id"]
-        
-        auth_manager = AuthManager(current_app.config['SECRET_KEY'])
-        sessions = auth_manager.get_active_sessions(user_id)
-        
-        return jsonify({"sessions": sessions}), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    
+    auth_manager = get_auth_manager()
+    sessions = auth_manager.get_active_sessions(user_id)
+    
+    return jsonify({"sessions": sessions}), 200
 
 
 @auth_bp.route('/extend-session', methods=['POST'])
@@ -183,20 +198,15 @@ def extend_session():
     """
     تمديد الجلسة
     """
-    try:
-        auth_header = request.headers.get('Authorization')
-        session_token = auth_header.split(' ')[1]
-        
-        auth_manager = AuthManager(current_app.config['SECRET_KEY'])
-        success = auth_manager.extend_session(session_token)
-        
-        if success:
-            return jsonify({"message": "تم تمديد الجلسة"}), 200
-        else:
-            return jsonify({"error": "فشل في تمديد الجلسة"}), 400
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    session_token = g.session_token
+    
+    auth_manager = get_auth_manager()
+    success = auth_manager.extend_session(session_token)
+    
+    if success:
+        return jsonify({"message": "تم تمديد الجلسة"}), 200
+    else:
+        return jsonify({"error": "فشل في تمديد الجلسة"}), 400
 
 
 @auth_bp.route('/enable-2fa', methods=['POST'])
@@ -205,19 +215,15 @@ def enable_2fa():
     """
     تفعيل المصادقة الثنائية
     """
-    try:
-        user_id = request.current_user["user_id"]
-        
-        auth_manager = AuthManager(current_app.config['SECRET_KEY'])
-        result = auth_manager.enable_2fa(user_id)
-        
-        if result["success"]:
-            return jsonify(result), 200
-        else:
-            return jsonify(result), 400
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    
+    auth_manager = get_auth_manager()
+    result = auth_manager.enable_2fa(user_id)
+    
+    if result["success"]:
+        return jsonify(result), 200
+    else:
+        return jsonify(result), 400
 
 
 @auth_bp.route('/disable-2fa', methods=['POST'])
@@ -226,29 +232,24 @@ def disable_2fa():
     """
     إلغاء تفعيل المصادقة الثنائية
     """
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
-        
-        totp_code = data.get('totp_code')
-        
-        if not totp_code:
-            return jsonify({"error": "رمز المصادقة الثنائية مطلوب"}), 400
-        
-        user_id = request.current_user["user_id"]
-        
-        auth_manager = AuthManager(current_app.config['SECRET_KEY'])
-        result = auth_manager.disable_2fa(user_id, totp_code)
-        
-        if result["success"]:
-            return jsonify(result), 200
-        else:
-            return jsonify(result), 400
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    data, error = read_json()
+    if error:
+        return error
+    
+    totp_code = data.get('totp_code')
+    
+    if not totp_code:
+        return jsonify({"error": "رمز المصادقة الثنائية مطلوب"}), 400
+    
+    user_id = request.current_user["user_id"]
+    
+    auth_manager = get_auth_manager()
+    result = auth_manager.disable_2fa(user_id, totp_code)
+    
+    if result["success"]:
+        return jsonify(result), 200
+    else:
+        return jsonify(result), 400
 
 
 @auth_bp.route('/change-password', methods=['POST'])
@@ -257,53 +258,78 @@ def change_password():
     """
     تغيير كلمة المرور الرئيسية
     """
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
-        
-        current_password = data.get('current_password')
-        new_password = data.get('new_password')
-        
-        if not current_password or not new_password:
-            return jsonify({"error": "كلمة المرور الحالية والجديدة مطلوبتان"}), 400
-        
-        if len(new_password) < 8:
-            return jsonify({"error": "كلمة المرور الجديدة يجب أن تكون 8 أحرف على الأقل"}), 400
-        
-        user_id = request.current_user["user_id"]
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({"error": "المستخدم غير موجود"}), 404
-        
-        # التحقق من كلمة المرور الحالية
-        vault = VaultManager()
-        if not vault.vault.verify_password(current_password, user.master_password_hash):
-            return jsonify({"error": "كلمة المرور الحالية غير صحيحة"}), 400
-        
-        # تحديث كلمة المرور
-        user.master_password_hash = vault.vault.hash_password(new_password)
-        db.session.commit()
-        
-        # إعادة تشفير الخزنة بكلمة المرور الجديدة
-        vault_path = os.path.join(
-            os.path.dirname(current_app.instance_path), 
-            'vaults', 
-            user.vault_file_path
-        )
-        
-        vault_manager = VaultManager(vault_path)
-        if vault_manager.unlock_vault(current_password):
-            vault_manager.save_vault(new_password)
-            vault_manager.lock_vault()
-        
-        return jsonify({"message": "تم تغيير كلمة المرور بنجاح"}), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    data, error = read_json()
+    if error:
+        return error
+    
+    current_password = data.get('current_password')
+    new_password = data.get('new_password')
+    
+    if not current_password or not new_password:
+        return jsonify({"error": "كلمة المرور الحالية والجديدة مطلوبتان"}), 400
+    
+    if len(new_password) < 8:
+        return jsonify({"error": "كلمة المرور الجديدة يجب أن تكون 8 أحرف على الأقل"}), 400
+    
+    user_id = request.current_user["user_id"]
+    # الأعمدة اللازمة لتغيير كلمة المرور وإعادة تشفير الخزنة فقط
+    user = User.query.options(
+        load_only(User.id, User.master_password_hash, User.vault_file_path)
+    ).get(user_id)
+    
+    if not user:
+        return jsonify({"error": "المستخدم غير موجود"}), 404
+    
+    # التحقق من كلمة المرور الحالية
+    vault = get_auth_manager().vault
+    if not vault.verify_password(current_password, user.master_password_hash):
+        return jsonify({"error": "كلمة المرور الحالية غير صحيحة"}), 400
+    
+    # تحديث كلمة المرور
+    user.master_password_hash = vault.hash_password(new_password)
+    db.session.commit()
+    
+    # إعادة التحقق من جلسات المستخدم من قاعدة البيانات بدلاً من الذاكرة المؤقتة
+    get_auth_manager().invalidate_user_cache(user_id)
+    
+    # الخزنة المفتوحة بكلمة المرور القديمة تُقفل: حفظها اللاحق كان سيعيد الملف إليها
+    session_vault = current_app.extensions['unlocked_vaults'].pop(user_id)
+    if session_vault is not None:
+        session_vault.lock_vault()
+    
+    # إعادة تشفير الخزنة بكلمة المرور الجديدة في الخلفية (بعد اكتمال كتابات الجلسة المعلقة)
+    vault_path = os.path.join(current_app.config['VAULTS_DIR'], user.vault_file_path)
+    
+    _track_rekey_job(current_app.extensions['rekey_jobs'], user_id, current_app.extensions['rekey_pool'].submit(
+        _rekey_vault, vault_path, current_password, new_password
+    ))
+    
+    return jsonify({
+        "message": "تم تغيير كلمة المرور بنجاح",
+        "rekey_status": "pending"
+    }), 200
+
+
+@auth_bp.route('/rekey-status', methods=['GET'])
+@require_auth
+def rekey_status():
+    """
+    حالة آخر إعادة تشفير للخزنة بعد تغيير كلمة المرور
+    """
+    jobs = current_app.extensions['rekey_jobs']
+    user_id = request.current_user["user_id"]
+    job = jobs.get(user_id)
+    
+    if job is None:
+        status = "none"
+    elif not isinstance(job, str):
+        status = "pending"
+    else:
+        # النتيجة المنتهية تُبلَّغ مرة واحدة ثم تُحذف
+        status = job
+        jobs.pop(user_id, None)
+    
+    return jsonify({"rekey_status": status}), 200
 
 
 @auth_bp.route('/user-info', methods=['GET'])
@@ -312,21 +338,19 @@ def get_user_info():
     """
     الحصول على معلومات المستخدم
     """
-    try:
-        user_id = request.current_user["user_id"]
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({"error": "المستخدم غير موجود"}), 404
-        
-        return jsonify({
-            "id": user.id,
-            "username": user.username,
-            "is_2fa_enabled": user.is_2fa_enabled,
-            "created_at": user.created_at.isoformat(),
-            "last_login": user.last_login.isoformat() if user.last_login else None
-        }), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
-
+    user_id = request.current_user["user_id"]
+    user = User.query.options(
+        load_only(User.id, User.username, User.is_2fa_enabled,
+                  User.created_at, User.last_login)
+    ).get(user_id)
+    
+    if not user:
+        return jsonify({"error": "المستخدم غير موجود"}), 404
+    
+    return jsonify({
+        "id": user.id,
+        "username": user.username,
+        "is_2fa_enabled": user.is_2fa_enabled,
+        "created_at": user.created_at.isoformat(),
+        "last_login": user.last_login.isoformat() if user.last_login else None
+    }), 200
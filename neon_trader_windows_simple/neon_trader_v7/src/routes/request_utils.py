@@ -0,0 +1,84 @@
+"""
+أدوات مشتركة لقراءة بيانات الطلبات في مسارات API
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, jsonify
+
+# الحد الأقصى لحجم جسم طلب JSON (بايت)
+MAX_JSON_BYTES = 64 * 1024
+
+
+def read_json(max_bytes: int = MAX_JSON_BYTES, required: bool = True):
+    """
+    قراءة جسم الطلب كـ JSON مع رفض الأجسام الكبيرة قبل تحليلها
+    يعيد (data, None) أو (None, (response, status))
+    """
+    if request.content_length is not None and request.content_length > max_bytes:
+        return None, (jsonify({"error": "حجم البيانات كبير جداً"}), 413)
+
+    # silent: JSON غير صالح يعامل كغياب البيانات بدلاً من رفع استثناء
+    data = request.get_json(silent=True, cache=True)
+
+    if not data:
+        if required:
+            return None, (jsonify({"error": "البيانات مطلوبة"}), 400)
+        return {}, None
+
+    return data, None
+
+
+class RateLimiter:
+    """
+    دلو رموز (token bucket) في الذاكرة لكل عنوان IP
+    """
+
+    def __init__(self, capacity: int, per_seconds: float, max_keys: int = 10000):
+        self.capacity = capacity
+        self.refill_rate = capacity / per_seconds
+        self.max_keys = max_keys
+        # key -> (tokens, last_refill)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """استهلاك رمز؛ يعيد 0 عند السماح أو عدد الثواني حتى توفر رمز"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.refill_rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.refill_rate
+
+            # الأحدث استخداماً في النهاية، والأقدم يُحذف عند امتلاء الجدول
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+
+def rate_limited(limiter: RateLimiter):
+    """
+    رفض الطلب بـ 429 قبل تنفيذ المسار إذا استنفد عنوان العميل رموزه
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # عنوان الاتصال نفسه: X-Forwarded-For يحدده العميل فيفتح دلواً جديداً لكل قيمة
+            wait = limiter.acquire(request.remote_addr or 'unknown')
+            if wait:
+                response = jsonify({"error": "محاولات كثيرة، حاول لاحقاً"})
+                response.headers['Retry-After'] = str(int(wait) + 1)
+                return response, 429
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
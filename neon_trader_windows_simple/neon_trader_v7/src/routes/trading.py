@@ -4,42 +4,82 @@
 
 from flask import Blueprint, request, jsonify, current_app
 from src.models.auth import require_auth
+from src.routes.request_utils import read_json
 from src.models.trading_engine import (
     PaperTradingEngine, OrderType, OrderSide, OrderStatus,
     DonchianBreakoutStrategy
 )
 from datetime import datetime
 import json
+import threading
 
 trading_bp = Blueprint('trading', __name__)
 
+# جداول تحويل الأسماء النصية في الطلبات إلى قيم التعدادات
+_ORDER_SIDES = {e.label: e for e in OrderSide}
+_ORDER_TYPES = {e.label: e for e in OrderType}
+_ORDER_STATUSES = {e.label: e for e in OrderStatus}
 
-def get_trading_engine(user_id: int) -> PaperTradingEngine:
+
+def _parse_enum(table: dict, value):
+    """تحويل قيمة نصية (بأي حالة أحرف) إلى عضو التعداد، أو None إن لم تكن صالحة"""
+    return table.get(value.lower()) if isinstance(value, str) else None
+
+
+@trading_bp.record_once
+def _init_trading_state(state):
     """
-    الحصول على محرك التداول للمستخدم
+    تهيئة سجلات المحركات والاستراتيجيات لكل مستخدم عند تسجيل المخطط
+    """
+    state.app.extensions['trading_engines'] = {}
+    state.app.extensions['trading_strategies'] = {}
+    state.app.extensions['trading_lock'] = threading.Lock()
+
+
+def _new_engine() -> PaperTradingEngine:
+    """
+    إنشاء محرك تداول جديد
+    """
+    engine = PaperTradingEngine(initial_balance=10000.0)
+    engine.start()
+    return engine
+
+
+def _new_strategy() -> DonchianBreakoutStrategy:
+    """
+    إنشاء استراتيجية تداول جديدة
     """
-    engine_key = f'TRADING_ENGINE_{user_id}'
+    return DonchianBreakoutStrategy(period=20, risk_reward_ratio=2.0)
+
+
+def _get_or_create(registry_name: str, user_id: int, factory):
+    """
+    قراءة بدون قفل، والقفل فقط عند الإنشاء لأول مرة (مع إعادة التحقق)
+    """
+    registry = current_app.extensions[registry_name]
     
-    if engine_key not in current_app.config:
-        # إنشاء محرك تداول جديد
-        engine = PaperTradingEngine(initial_balance=10000.0)
-        engine.start()
-        current_app.config[engine_key] = engine
+    item = registry.get(user_id)
+    if item is None:
+        with current_app.extensions['trading_lock']:
+            item = registry.get(user_id)
+            if item is None:
+                item = registry[user_id] = factory()
     
-    return current_app.config[engine_key]
+    return item
+
+
+def get_trading_engine(user_id: int) -> PaperTradingEngine:
+    """
+    الحصول على محرك التداول للمستخدم
+    """
+    return _get_or_create('trading_engines', user_id, _new_engine)
 
 
 def get_strategy(user_id: int) -> DonchianBreakoutStrategy:
     """
     الحصول على استراتيجية التداول للمستخدم
     """
-    strategy_key = f'STRATEGY_{user_id}'
-    
-    if strategy_key not in current_app.config:
-        strategy = DonchianBreakoutStrategy(period=20, risk_reward_ratio=2.0)
-        current_app.config[strategy_key] = strategy
-    
-    return current_app.config[strategy_key]
+    return _get_or_create('trading_strategies', user_id, _new_strategy)
 
 
 @trading_bp.route('/account', methods=['GET'])
@@ -48,16 +88,12 @@ def get_account():
     """
     الحصول على ملخص الحساب
     """
-    try:
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        
-        account_summary = engine.get_account_summary()
-        
-        return jsonify(account_summary), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    
+    account_summary = engine.get_account_summary()
+    
+    return jsonify(account_summary), 200
 
 
 @trading_bp.route('/positions', methods=['GET'])
@@ -66,16 +102,12 @@ def get_positions():
     """
     الحصول على المراكز المفتوحة
     """
-    try:
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        
-        positions = engine.get_positions()
-        
-        return jsonify({"positions": positions}), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    
+    positions = engine.get_positions()
+    
+    return jsonify({"positions": positions}), 200
 
 
 @trading_bp.route('/orders', methods=['GET'])
@@ -84,25 +116,20 @@ def get_orders():
     """
     الحصول على الأوامر
     """
-    try:
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        
-        status_param = request.args.get('status')
-        status = None
-        
-        if status_param:
-            try:
-                status = OrderStatus(status_param)
-            except ValueError:
-                return jsonify({"error": "حالة الأمر غير صالحة"}), 400
-        
-        orders = engine.get_orders(status)
-        
-        return jsonify({"orders": orders}), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    
+    status_param = request.args.get('status')
+    status = None
+    
+    if status_param:
+        status = _parse_enum(_ORDER_STATUSES, status_param)
+        if status is None:
+            return jsonify({"error": "حالة الأمر غير صالحة"}), 400
+    
+    orders = engine.get_orders(status)
+    
+    return jsonify({"orders": orders}), 200
 
 
 @trading_bp.route('/trades', methods=['GET'])
@@ -111,19 +138,15 @@ def get_trades():
     """
     الحصول على الصفقات
     """
-    try:
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        
-        symbol = request.args.get('symbol')
-        limit = int(request.args.get('limit', 100))
-        
-        trades = engine.get_trades(symbol, limit)
-        
-        return jsonify({"trades": trades}), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    
+    symbol = request.args.get('symbol')
+    limit = int(request.args.get('limit', 100))
+    
+    trades = engine.get_trades(symbol, limit)
+    
+    return jsonify({"trades": trades}), 200
 
 
 @trading_bp.route('/place-order', methods=['POST'])
@@ -132,48 +155,46 @@ def place_order():
     """
     وضع أمر جديد
     """
+    data, error = read_json()
+    if error:
+        return error
+    
+    symbol = data.get('symbol')
+    side = data.get('side')
+    order_type = data.get('type')
+    quantity = data.get('quantity')
+    price = data.get('price')
+    stop_price = data.get('stop_price')
+    
+    if not all([symbol, side, order_type, quantity]):
+        return jsonify({"error": "الحقول المطلوبة: symbol, side, type, quantity"}), 400
+    
+    side_enum = _parse_enum(_ORDER_SIDES, side)
+    type_enum = _parse_enum(_ORDER_TYPES, order_type)
+    if side_enum is None or type_enum is None:
+        return jsonify({"error": "قيم الحقول غير صالحة"}), 400
+    
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
-        
-        symbol = data.get('symbol')
-        side = data.get('side')
-        order_type = data.get('type')
-        quantity = data.get('quantity')
-        price = data.get('price')
-        stop_price = data.get('stop_price')
-        
-        if not all([symbol, side, order_type, quantity]):
-            return jsonify({"error": "الحقول المطلوبة: symbol, side, type, quantity"}), 400
-        
-        try:
-            side_enum = OrderSide(side)
-            type_enum = OrderType(order_type)
-            quantity = float(quantity)
-            price = float(price) if price else None
-            stop_price = float(stop_price) if stop_price else None
-        except (ValueError, TypeError):
-            return jsonify({"error": "قيم الحقول غير صالحة"}), 400
-        
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        
-        success, message, order_id = engine.place_order(
-            symbol, side_enum, type_enum, quantity, price, stop_price
-        )
-        
-        if success:
-            return jsonify({
-                "message": message,
-                "order_id": order_id
-            }), 201
-        else:
-            return jsonify({"error": message}), 400
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+        quantity = float(quantity)
+        price = float(price) if price else None
+        stop_price = float(stop_price) if stop_price else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "قيم الحقول غير صالحة"}), 400
+    
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    
+    success, message, order_id = engine.place_order(
+        symbol, side_enum, type_enum, quantity, price, stop_price
+    )
+    
+    if success:
+        return jsonify({
+            "message": message,
+            "order_id": order_id
+        }), 201
+    else:
+        return jsonify({"error": message}), 400
 
 
 @trading_bp.route('/cancel-order/<order_id>', methods=['POST'])
@@ -182,19 +203,15 @@ def cancel_order(order_id):
     """
     إلغاء أمر
     """
-    try:
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        
-        success, message = engine.cancel_order(order_id)
-        
-        if success:
-            return jsonify({"message": message}), 200
-        else:
-            return jsonify({"error": message}), 400
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    
+    success, message = engine.cancel_order(order_id)
+    
+    if success:
+        return jsonify({"message": message}), 200
+    else:
+        return jsonify({"error": message}), 400
 
 
 @trading_bp.route('/close-position/<position_id>', methods=['POST'])
@@ -203,28 +220,26 @@ def close_position(position_id):
     """
     إغلاق مركز
     """
-    try:
-        data = request.get_json() or {}
-        quantity = data.get('quantity')
-        
-        if quantity:
-            try:
-                quantity = float(quantity)
-            except (ValueError, TypeError):
-                return jsonify({"error": "كمية الإغلاق غير صالحة"}), 400
-        
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        
-        success, message = engine.close_position(position_id, quantity)
-        
-        if success:
-            return jsonify({"message": message}), 200
-        else:
-            return jsonify({"error": message}), 400
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    data, error = read_json(required=False)
+    if error:
+        return error
+    quantity = data.get('quantity')
+    
+    if quantity:
+        try:
+            quantity = float(quantity)
+        except (ValueError, TypeError):
+            return jsonify({"error": "كمية الإغلاق غير صالحة"}), 400
+    
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    
+    success, message = engine.close_position(position_id, quantity)
+    
+    if success:
+        return jsonify({"message": message}), 200
+    else:
+        return jsonify({"error": message}), 400
 
 
 @trading_bp.route('/update-price', methods=['POST'])
@@ -233,37 +248,32 @@ def update_market_price():
     """
     تحديث سعر السوق (للاختبار)
     """
+    data, error = read_json()
+    if error:
+        return error
+    
+    symbol = data.get('symbol')
+    price = data.get('price')
+    
+    if not symbol or not price:
+        return jsonify({"error": "الرمز والسعر مطلوبان"}), 400
+    
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
-        
-        symbol = data.get('symbol')
-        price = data.get('price')
-        
-        if not symbol or not price:
-            return jsonify({"error": "الرمز والسعر مطلوبان"}), 400
-        
-        try:
-            price = float(price)
-        except (ValueError, TypeError):
-            return jsonify({"error": "السعر غير صالح"}), 400
-        
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        strategy = get_strategy(user_id)
-        
-        # تحديث السعر في المحرك
-        engine.update_market_price(symbol, price)
-        
-        # تحديث السعر في الاستراتيجية
-        strategy.update_price(symbol, price)
-        
-        return jsonify({"message": "تم تحديث السعر"}), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+        price = float(price)
+    except (ValueError, TypeError):
+        return jsonify({"error": "السعر غير صالح"}), 400
+    
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    strategy = get_strategy(user_id)
+    
+    # تحديث السعر في المحرك
+    engine.update_market_price(symbol, price)
+    
+    # تحديث السعر في الاستراتيجية
+    strategy.update_price(symbol, price)
+    
+    return jsonify({"message": "تم تحديث السعر"}), 200
 
 
 @trading_bp.route('/strategy/signal/<symbol>', methods=['GET'])
@@ -272,27 +282,23 @@ def get_strategy_signal(symbol):
     """
     الحصول على إشارة الاستراتيجية
     """
-    try:
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        strategy = get_strategy(user_id)
-        
-        # الحصول على السعر الحالي
-        if symbol not in engine.market_data:
-            return jsonify({"error": "لا توجد بيانات سوق لهذا الرمز"}), 404
-        
-        current_price = engine.market_data[symbol]['price']
-        
-        # الحصول على الإشارة
-        signal = strategy.get_signal(symbol, current_price)
-        
-        if signal:
-            return jsonify({"signal": signal}), 200
-        else:
-            return jsonify({"signal": None, "message": "لا توجد إشارة حالياً"}), 200
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    strategy = get_strategy(user_id)
+    
+    # الحصول على السعر الحالي
+    if symbol not in engine.market_data:
+        return jsonify({"error": "لا توجد بيانات سوق لهذا الرمز"}), 404
+    
+    current_price = engine.market_data[symbol]['price']
+    
+    # الحصول على الإشارة
+    signal = strategy.get_signal(symbol, current_price)
+    
+    if signal:
+        return jsonify({"signal": signal}), 200
+    else:
+        return jsonify({"signal": None, "message": "لا توجد إشارة حالياً"}), 200
 
 
 @trading_bp.route('/strategy/execute-signal', methods=['POST'])
@@ -301,78 +307,66 @@ def execute_strategy_signal():
     """
     تنفيذ إشارة الاستراتيجية
     """
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
-        
-        symbol = data.get('symbol')
-        
-        if not symbol:
-            return jsonify({"error": "الرمز مطلوب"}), 400
-        
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        strategy = get_strategy(user_id)
-        
-        # الحصول على السعر الحالي
-        if symbol not in engine.market_data:
-            return jsonify({"error": "لا توجد بيانات سوق لهذا الرمز"}), 404
-        
-        current_price = engine.market_data[symbol]['price']
-        
-        # الحصول على الإشارة
-        signal = strategy.get_signal(symbol, current_price)
-        
-        if not signal:
-            return jsonify({"error": "لا توجد إشارة للتنفيذ"}), 400
-        
-        # حساب حجم المركز
-        account_summary = engine.get_account_summary()
-        position_size = engine.risk_manager.calculate_position_size(
-            account_summary["current_balance"],
-            signal["entry_price"],
-            signal["stop_loss"]
-        )
-        
-        if position_size <= 0:
-            return jsonify({"error": "لا يمكن حساب حجم مركز صالح"}), 400
-        
-        # تنفيذ الأمر
-        side = OrderSide.BUY if signal["action"] == "buy" else OrderSide.SELL
-        
-        success, message, order_id = engine.place_order(
-            symbol, side, OrderType.MARKET, position_size
-        )
-        
-        if success:
-            # وضع أوامر إيقاف الخسارة وجني الأرباح
-            stop_side = OrderSide.SELL if side == OrderSide.BUY else OrderSide.BUY
-            
-            # أمر إيقاف الخسارة
-            engine.place_order(
-                symbol, stop_side, OrderType.STOP, position_size, 
-                stop_price=signal["stop_loss"]
-            )
-            
-            # أمر جني الأرباح
-            engine.place_order(
-                symbol, stop_side, OrderType.LIMIT, position_size,
-                price=signal["take_profit"]
-            )
-            
-            return jsonify({
-                "message": "تم تنفيذ الإشارة بنجاح",
-                "order_id": order_id,
-                "signal": signal,
-                "position_size": position_size
-            }), 201
-        else:
-            return jsonify({"error": message}), 400
-            
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    data, error = read_json()
+    if error:
+        return error
+    
+    symbol = data.get('symbol')
+    
+    if not symbol:
+        return jsonify({"error": "الرمز مطلوب"}), 400
+    
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    strategy = get_strategy(user_id)
+    
+    # الحصول على السعر الحالي
+    if symbol not in engine.market_data:
+        return jsonify({"error": "لا توجد بيانات سوق لهذا الرمز"}), 404
+    
+    current_price = engine.market_data[symbol]['price']
+    
+    # الحصول على الإشارة
+    signal = strategy.get_signal(symbol, current_price)
+    
+    if not signal:
+        return jsonify({"error": "لا توجد إشارة للتنفيذ"}), 400
+    
+    # حساب حجم المركز
+    account_summary = engine.get_account_summary()
+    position_size = engine.risk_manager.calculate_position_size(
+        account_summary["current_balance"],
+        signal["entry_price"],
+        signal["stop_loss"]
+    )
+    
+    if position_size <= 0:
+        return jsonify({"error": "لا يمكن حساب حجم مركز صالح"}), 400
+    
+    # تنفيذ الأمر
+    side = OrderSide.BUY if signal["action"] == "buy" else OrderSide.SELL
+    stop_side = OrderSide.SELL if side == OrderSide.BUY else OrderSide.BUY
+    
+    # أمر الدخول مع أوامر إيقاف الخسارة وجني الأرباح في دفعة واحدة
+    results = engine.place_orders_batch([
+        {'symbol': symbol, 'side': side, 'type': OrderType.MARKET,
+         'quantity': position_size},
+        {'symbol': symbol, 'side': stop_side, 'type': OrderType.STOP,
+         'quantity': position_size, 'stop_price': signal["stop_loss"]},
+        {'symbol': symbol, 'side': stop_side, 'type': OrderType.LIMIT,
+         'quantity': position_size, 'price': signal["take_profit"]}
+    ])
+    success, message, order_id = results[0]
+    
+    if success:
+        return jsonify({
+            "message": "تم تنفيذ الإشارة بنجاح",
+            "order_id": order_id,
+            "signal": signal,
+            "position_size": position_size
+        }), 201
+    else:
+        return jsonify({"error": message}), 400
 
 
 @trading_bp.route('/reset-account', methods=['POST'])
@@ -381,25 +375,13 @@ def reset_account():
     """
     إعادة تعيين الحساب (للاختبار)
     """
-    try:
-        user_id = request.current_user["user_id"]
-        
-        # إنشاء محرك تداول جديد
-        engine = PaperTradingEngine(initial_balance=10000.0)
-        engine.start()
-        
-        engine_key = f'TRADING_ENGINE_{user_id}'
-        current_app.config[engine_key] = engine
-        
-        # إعادة تعيين الاستراتيجية
-        strategy = DonchianBreakoutStrategy(period=20, risk_reward_ratio=2.0)
-        strategy_key = f'STRATEGY_{user_id}'
-        current_app.config[strategy_key] = strategy
-        
-        return jsonify({"message": "تم إعادة تعيين الحساب"}), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    
+    # إعادة تعيين المحرك والاستراتيجية في مكانهما بدلاً من إنشاء نسخ جديدة
+    get_trading_engine(user_id).reset()
+    get_strategy(user_id).reset()
+    
+    return jsonify({"message": "تم إعادة تعيين الحساب"}), 200
 
 
 @trading_bp.route('/market-data/<symbol>', methods=['GET'])
@@ -408,23 +390,19 @@ def get_market_data(symbol):
     """
     الحصول على بيانات السوق
     """
-    try:
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        
-        if symbol not in engine.market_data:
-            return jsonify({"error": "لا توجد بيانات لهذا الرمز"}), 404
-        
-        market_data = engine.market_data[symbol]
-        
-        return jsonify({
-            "symbol": symbol,
-            "price": market_data["price"],
-            "timestamp": market_data["timestamp"].isoformat()
-        }), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    
+    if symbol not in engine.market_data:
+        return jsonify({"error": "لا توجد بيانات لهذا الرمز"}), 404
+    
+    market_data = engine.market_data[symbol]
+    
+    return jsonify({
+        "symbol": symbol,
+        "price": market_data["price"],
+        "timestamp": market_data["timestamp"].isoformat()
+    }), 200
 
 
 @trading_bp.route('/performance', methods=['GET'])
@@ -433,34 +411,9 @@ def get_performance():
     """
     الحصول على إحصائيات الأداء
     """
-    try:
-        user_id = request.current_user["user_id"]
-        engine = get_trading_engine(user_id)
-        
-        account_summary = engine.get_account_summary()
-        trades = engine.get_trades(limit=1000)
-        
-        # حساب إحصائيات الأداء
-        total_trades = len(trades)
-        winning_trades = len([t for t in trades if float(t['price']) > 0])  # تبسيط
-        win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
-        
-        total_return = ((account_summary["total_equity"] - account_summary["initial_balance"]) / 
-                       account_summary["initial_balance"] * 100)
-        
-        performance = {
-            "total_trades": total_trades,
-            "winning_trades": winning_trades,
-            "losing_trades": total_trades - winning_trades,
-            "win_rate": round(win_rate, 2),
-            "total_return": round(total_return, 2),
-            "current_equity": account_summary["total_equity"],
-            "max_drawdown": 0.0,  # يحتاج حساب أكثر تعقيداً
-            "sharpe_ratio": 0.0   # يحتاج بيانات تاريخية
-        }
-        
-        return jsonify({"performance": performance}), 200
-        
-    except Exception as e:
-        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
-
+    user_id = request.current_user["user_id"]
+    engine = get_trading_engine(user_id)
+    
+    performance = engine.get_performance_snapshot()
+    
+    return jsonify({"performance": performance}), 200
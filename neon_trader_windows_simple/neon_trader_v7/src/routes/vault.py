@@ -4,11 +4,38 @@
 
 from flask import Blueprint, request, jsonify, current_app
 from src.models.auth import require_auth, User
-from src.models.vault import VaultManager
+from src.models.vault import VaultManager, VaultSessionCache
+from src.routes.request_utils import read_json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import os
 
 vault_bp = Blueprint('vault', __name__)
 
+# الحد الأقصى لحجم طلب استيراد الخزنة (بايت)
+VAULT_IMPORT_MAX_BYTES = 1024 * 1024
+
+
+@vault_bp.record_once
+def _init_vault_state(state):
+    """
+    سجل الخزائن المفتوحة في الذاكرة لكل مستخدم (بمعرف المستخدم مباشرة)
+    """
+    state.app.extensions['unlocked_vaults'] = VaultSessionCache()
+    # كتابة ملفات الخزائن على القرص خارج خيط الطلب
+    state.app.extensions['vault_save_pool'] = ThreadPoolExecutor(max_workers=2, thread_name_prefix='vault-save')
+
+
+@lru_cache(maxsize=256)
+def _status_body(is_unlocked: bool, api_keys_count: int) -> str:
+    """
+    جسم رد حالة الخزنة مرمّزاً مسبقاً (قيمتان فقط تتغيران وأغلبها الخزنة المقفلة)
+    """
+    return current_app.json.dumps({
+        "is_unlocked": is_unlocked,
+        "api_keys_count": api_keys_count
+    })
+
 
 @vault_bp.route('/unlock', methods=['POST'])
 @require_auth
@@ -17,10 +44,9 @@ def unlock_vault():
     فتح الخزنة
     """
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
+        data, error = read_json()
+        if error:
+            return error
         
         master_password = data.get('master_password')
         
@@ -33,24 +59,20 @@ def unlock_vault():
         if not user:
             return jsonify({"error": "المستخدم غير موجود"}), 404
         
+        # مدير واحد مرتبط بملف الخزنة للتحقق من كلمة المرور ثم الفتح
+        vault_path = os.path.join(current_app.config['VAULTS_DIR'], user.vault_file_path)
+        vault_manager = VaultManager(vault_path)
+        
         # التحقق من كلمة المرور
-        vault_manager = VaultManager()
         if not vault_manager.vault.verify_password(master_password, user.master_password_hash):
             return jsonify({"error": "كلمة المرور غير صحيحة"}), 401
         
         # فتح الخزنة
-        vault_path = os.path.join(
-            os.path.dirname(current_app.instance_path), 
-            'vaults', 
-            user.vault_file_path
-        )
-        
-        vault_manager = VaultManager(vault_path)
         success = vault_manager.unlock_vault(master_password)
         
         if success:
             # حفظ الخزنة في الجلسة (في الذاكرة فقط)
-            current_app.config[f'VAULT_{user_id}'] = vault_manager
+            current_app.extensions['unlocked_vaults'].set(user_id, vault_manager)
             
             return jsonify({
                 "message": "تم فتح الخزنة بنجاح",
@@ -73,11 +95,9 @@ def lock_vault():
         user_id = request.current_user["user_id"]
         
         # إزالة الخزنة من الذاكرة
-        vault_key = f'VAULT_{user_id}'
-        if vault_key in current_app.config:
-            vault_manager = current_app.config[vault_key]
+        vault_manager = current_app.extensions['unlocked_vaults'].pop(user_id)
+        if vault_manager is not None:
             vault_manager.lock_vault()
-            del current_app.config[vault_key]
         
         return jsonify({"message": "تم قفل الخزنة"}), 200
         
@@ -93,18 +113,37 @@ def vault_status():
     """
     try:
         user_id = request.current_user["user_id"]
-        vault_key = f'VAULT_{user_id}'
+        vault_manager = current_app.extensions['unlocked_vaults'].get(user_id)
         
-        is_unlocked = vault_key in current_app.config
-        api_keys_count = 0
+        if vault_manager is None:
+            body = _status_body(False, 0)
+        else:
+            body = _status_body(True, vault_manager.api_keys_count)
+        return current_app.response_class(body, mimetype='application/json'), 200
         
-        if is_unlocked:
-            vault_manager = current_app.config[vault_key]
-            api_keys_count = len(vault_manager.list_api_keys())
+    except Exception as e:
+        return jsonify({"error": f"خطأ في الخادم: {str(e)}"}), 500
+
+
+@vault_bp.route('/save-status/<int:save_seq>', methods=['GET'])
+@require_auth
+def save_status(save_seq):
+    """
+    حالة كتابة حفظ سابق على القرص (saved / pending / failed / unknown)
+    """
+    try:
+        user_id = request.current_user["user_id"]
+        user = User.query.get(user_id)
+        
+        if not user:
+            return jsonify({"error": "المستخدم غير موجود"}), 404
+        
+        # حالة الكتابة مرتبطة بملف الخزنة لا بالجلسة، فتبقى متاحة بعد قفل الخزنة
+        vault_path = os.path.join(current_app.config['VAULTS_DIR'], user.vault_file_path)
         
         return jsonify({
-            "is_unlocked": is_unlocked,
-            "api_keys_count": api_keys_count
+            "save_seq": save_seq,
+            "save_status": VaultManager(vault_path).save_status(save_seq)
         }), 200
         
     except Exception as e:
@@ -119,12 +158,11 @@ def list_api_keys():
     """
     try:
         user_id = request.current_user["user_id"]
-        vault_key = f'VAULT_{user_id}'
+        vault_manager = current_app.extensions['unlocked_vaults'].get(user_id)
         
-        if vault_key not in current_app.config:
+        if vault_manager is None:
             return jsonify({"error": "الخزنة مقفلة"}), 401
         
-        vault_manager = current_app.config[vault_key]
         api_keys = vault_manager.list_api_keys()
         
         return jsonify({"api_keys": api_keys}), 200
@@ -140,10 +178,9 @@ def add_api_key():
     إضافة مفتاح API جديد
     """
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
+        data, error = read_json()
+        if error:
+            return error
         
         exchange_name = data.get('exchange_name')
         api_key = data.get('api_key')
@@ -156,25 +193,26 @@ def add_api_key():
             return jsonify({"error": "جميع الحقول مطلوبة"}), 400
         
         user_id = request.current_user["user_id"]
-        vault_key = f'VAULT_{user_id}'
+        vault_manager = current_app.extensions['unlocked_vaults'].get(user_id)
         
-        if vault_key not in current_app.config:
+        if vault_manager is None:
             return jsonify({"error": "الخزنة مقفلة"}), 401
         
-        vault_manager = current_app.config[vault_key]
-        
         # إضافة مفتاح API
         key_id = vault_manager.add_api_key(
             exchange_name, api_key, api_secret, api_passphrase, testnet
         )
         
-        # حفظ الخزنة
-        success = vault_manager.save_vault(master_password)
+        # حفظ الخزنة: التشفير الآن والكتابة على القرص في الخلفية
+        save_seq = vault_manager.save_vault_async(master_password, current_app.extensions['vault_save_pool'])
         
-        if success:
+        if save_seq is not None:
+            # الكتابة لم تكتمل بعد: التأكيد عبر /save-status/<save_seq>
             return jsonify({
                 "message": "تم إضافة مفتاح API بنجاح",
-                "key_id": key_id
+                "key_id": key_id,
+                "save_seq": save_seq,
+                "save_status": "pending"
             }), 201
         else:
             return jsonify({"error": "فشل في حفظ الخزنة"}), 500
@@ -191,12 +229,11 @@ def get_api_key(key_id):
     """
     try:
         user_id = request.current_user["user_id"]
-        vault_key = f'VAULT_{user_id}'
+        vault_manager = current_app.extensions['unlocked_vaults'].get(user_id)
         
-        if vault_key not in current_app.config:
+        if vault_manager is None:
             return jsonify({"error": "الخزنة مقفلة"}), 401
         
-        vault_manager = current_app.config[vault_key]
         api_key_data = vault_manager.get_api_key(key_id)
         
         if not api_key_data:
@@ -224,10 +261,9 @@ def remove_api_key(key_id):
     حذف مفتاح API
     """
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
+        data, error = read_json()
+        if error:
+            return error
         
         master_password = data.get('master_password')
         
@@ -235,24 +271,26 @@ def remove_api_key(key_id):
             return jsonify({"error": "كلمة المرور الرئيسية مطلوبة"}), 400
         
         user_id = request.current_user["user_id"]
-        vault_key = f'VAULT_{user_id}'
+        vault_manager = current_app.extensions['unlocked_vaults'].get(user_id)
         
-        if vault_key not in current_app.config:
+        if vault_manager is None:
             return jsonify({"error": "الخزنة مقفلة"}), 401
         
-        vault_manager = current_app.config[vault_key]
-        
         # حذف مفتاح API
         success = vault_manager.remove_api_key(key_id)
         
         if not success:
             return jsonify({"error": "مفتاح API غير موجود"}), 404
         
-        # حفظ الخزنة
-        save_success = vault_manager.save_vault(master_password)
+        # حفظ الخزنة: التشفير الآن والكتابة على القرص في الخلفية
+        save_seq = vault_manager.save_vault_async(master_password, current_app.extensions['vault_save_pool'])
         
-        if save_success:
-            return jsonify({"message": "تم حذف مفتاح API بنجاح"}), 200
+        if save_seq is not None:
+            return jsonify({
+                "message": "تم حذف مفتاح API بنجاح",
+                "save_seq": save_seq,
+                "save_status": "pending"
+            }), 200
         else:
             return jsonify({"error": "فشل في حفظ الخزنة"}), 500
             
@@ -267,10 +305,9 @@ def export_vault():
     تصدير الخزنة
     """
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
+        data, error = read_json()
+        if error:
+            return error
         
         export_password = data.get('export_password')
         
@@ -278,12 +315,11 @@ def export_vault():
             return jsonify({"error": "كلمة مرور التصدير مطلوبة"}), 400
         
         user_id = request.current_user["user_id"]
-        vault_key = f'VAULT_{user_id}'
+        vault_manager = current_app.extensions['unlocked_vaults'].get(user_id)
         
-        if vault_key not in current_app.config:
+        if vault_manager is None:
             return jsonify({"error": "الخزنة مقفلة"}), 401
         
-        vault_manager = current_app.config[vault_key]
         exported_data = vault_manager.export_vault(export_password)
         
         return jsonify({
@@ -302,10 +338,10 @@ def import_vault():
     استيراد الخزنة
     """
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "البيانات مطلوبة"}), 400
+        # بيانات الخزنة المصدَّرة قد تتجاوز الحد الافتراضي لحجم الطلب
+        data, error = read_json(max_bytes=VAULT_IMPORT_MAX_BYTES)
+        if error:
+            return error
         
         encrypted_data = data.get('encrypted_data')
         import_password = data.get('import_password')
@@ -321,11 +357,7 @@ def import_vault():
             return jsonify({"error": "المستخدم غير موجود"}), 404
         
         # إنشاء مدير خزنة جديد
-        vault_path = os.path.join(
-            os.path.dirname(current_app.instance_path), 
-            'vaults', 
-            user.vault_file_path
-        )
+        vault_path = os.path.join(current_app.config['VAULTS_DIR'], user.vault_file_path)
         
         vault_manager = VaultManager(vault_path)
         
@@ -335,17 +367,18 @@ def import_vault():
         if not success:
             return jsonify({"error": "فشل في استيراد الخزنة"}), 400
         
-        # حفظ الخزنة بكلمة المرور الرئيسية
-        save_success = vault_manager.save_vault(master_password)
+        # حفظ الخزنة بكلمة المرور الرئيسية (الكتابة على القرص في الخلفية)
+        save_seq = vault_manager.save_vault_async(master_password, current_app.extensions['vault_save_pool'])
         
-        if save_success:
+        if save_seq is not None:
             # تحديث الخزنة في الذاكرة
-            vault_key = f'VAULT_{user_id}'
-            current_app.config[vault_key] = vault_manager
+            current_app.extensions['unlocked_vaults'].set(user_id, vault_manager)
             
             return jsonify({
                 "message": "تم استيراد الخزنة بنجاح",
-                "api_keys_count": len(vault_manager.list_api_keys())
+                "api_keys_count": len(vault_manager.list_api_keys()),
+                "save_seq": save_seq,
+                "save_status": "pending"
             }), 200
         else:
             return jsonify({"error": "فشل في حفظ الخزنة المستوردة"}), 500
@@ -362,12 +395,11 @@ def test_api_connection(key_id):
     """
     try:
         user_id = request.current_user["user_id"]
-        vault_key = f'VAULT_{user_id}'
+        vault_manager = current_app.extensions['unlocked_vaults'].get(user_id)
         
-        if vault_key not in current_app.config:
+        if vault_manager is None:
             return jsonify({"error": "الخزنة مقفلة"}), 401
         
-        vault_manager = current_app.config[vault_key]
         api_key_data = vault_manager.get_api_key(key_id)
         
         if not api_key_data:
@@ -2,15 +2,21 @@
 مسارات API للمساعد الصوتي
 """
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from src.models.voice_assistant import VoiceAssistant
+from src.models.voice_assistant import VoiceAssistant, WAV_STREAM_HEADER
 from src.models.auth import require_auth
 from src.models.ai_assistant import AIAssistant
+from src.routes.async_loop import run_async
+from src.routes.request_utils import read_json
 import os
+import hmac
+import hashlib
 import tempfile
 from datetime import datetime
 import logging
+from functools import lru_cache
 
 voice_bp = Blueprint('voice', __name__)
 voice_assistant = VoiceAssistant()
@@ -18,19 +24,34 @@ ai_assistant = AIAssistant()
 
 # إعداد مجلد الرفع
 UPLOAD_FOLDER = tempfile.gettempdir()
-ALLOWED_EXTENSIONS = {'wav', 'mp3', 'ogg', 'm4a', 'flac'}
+ALLOWED_EXTENSIONS = frozenset(('wav', 'mp3', 'ogg', 'm4a', 'flac'))
+
+# أسماء ملفات الصوت المطلوبة تتكرر غالباً، فتُحفظ نتيجة تنظيفها
+_secure_filename = lru_cache(maxsize=2048)(secure_filename)
+
+def _audio_signature(filename: str) -> str:
+    """توقيع HMAC قصير لاسم ملف الصوت المولد بمفتاح التطبيق"""
+    key = current_app.config['SECRET_KEY'].encode()
+    return hmac.new(key, f"audio:{filename}".encode(), hashlib.sha256).hexdigest()[:16]
+
+def _audio_url(audio_path: str) -> str:
+    """رابط ملف الصوت المولد مع توقيعه"""
+    filename = os.path.basename(audio_path)
+    return f'/api/voice/audio/{filename}?s={_audio_signature(filename)}'
 
 def allowed_file(filename):
     """التحقق من امتداد الملف المسموح"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    dot = filename.rfind('.')
+    return dot != -1 and filename[dot + 1:].lower() in ALLOWED_EXTENSIONS
 
 @voice_bp.route('/text-to-speech', methods=['POST'])
 @require_auth
 def text_to_speech():
     """تحويل النص إلى كلام"""
     try:
-        data = request.get_json()
+        data, error = read_json(required=False)
+        if error:
+            return error
         text = data.get('text', '')
         voice_type = data.get('voice_type', 'female_voice')
         language = data.get('language', 'ar')
@@ -58,7 +79,7 @@ def text_to_speech():
         
         return jsonify({
             'success': True,
-            'audio_url': f'/api/voice/audio/{os.path.basename(audio_path)}',
+            'audio_url': _audio_url(audio_path),
             'duration_estimate': len(text) * 0.1,
             'voice_type': voice_type
         })
@@ -70,6 +91,42 @@ def text_to_speech():
             'error': f'خطأ في الخادم: {str(e)}'
         }), 500
 
+@voice_bp.route('/text-to-speech/stream', methods=['POST'])
+@require_auth
+def text_to_speech_stream():
+    """تحويل النص إلى كلام مع بث الصوت أثناء التوليد"""
+    try:
+        data, error = read_json(required=False)
+        if error:
+            return error
+        text = data.get('text', '')
+        voice_type = data.get('voice_type', 'female_voice')
+        
+        if not text:
+            return jsonify({
+                'success': False,
+                'error': 'النص مطلوب'
+            }), 400
+        
+        if len(text) > 5000:
+            return jsonify({
+                'success': False,
+                'error': 'النص طويل جداً (الحد الأقصى 5000 حرف)'
+            }), 400
+        
+        def generate():
+            yield WAV_STREAM_HEADER
+            yield from voice_assistant.synthesize_stream(text, voice_type)
+        
+        return Response(stream_with_context(generate()), mimetype='audio/wav')
+        
+    except Exception as e:
+        logging.error(f"خطأ في بث تحويل النص إلى كلام: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'خطأ في الخادم: {str(e)}'
+        }), 500
+
 @voice_bp.route('/speech-to-text', methods=['POST'])
 @require_auth
 def speech_to_text():
@@ -96,36 +153,25 @@ def speech_to_text():
                 'error': f'نوع الملف غير مدعوم. الأنواع المدعومة: {", ".join(ALLOWED_EXTENSIONS)}'
             }), 400
         
-        # حفظ الملف مؤقتاً
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        temp_filename = f"upload_{timestamp}_{filename}"
-        temp_path = os.path.join(UPLOAD_FOLDER, temp_filename)
-        
-        file.save(temp_path)
-        
-        try:
-            # تحويل الكلام إلى نص
-            transcribed_text = voice_assistant.speech_to_text(temp_path, language)
-            
-            if not transcribed_text:
-                return jsonify({
-                    'success': False,
-                    'error': 'فشل في تحويل الكلام إلى نص'
-                }), 500
-            
+        # تحويل الكلام إلى نص مباشرة من تدفق الملف المرفوع دون حفظه على القرص
+        transcribed_text = voice_assistant.speech_to_text(file.stream, language)
+        
+        if not transcribed_text:
             return jsonify({
-                'success': True,
-                'text': transcribed_text,
-                'language': language,
-                'confidence': 0.85  # قيمة افتراضية
-            })
-            
-        finally:
-            # حذف الملف المؤقت
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+                'success': False,
+                'error': 'فشل في تحويل الكلام إلى نص'
+            }), 500
+        
+        return jsonify({
+            'success': True,
+            'text': transcribed_text,
+            'language': language,
+            'confidence': 0.85  # قيمة افتراضية
+        })
         
+    except RequestEntityTooLarge:
+        # ملف أكبر من MAX_CONTENT_LENGTH: يُعاد 413 بدلاً من خطأ خادم
+        raise
     except Exception as e:
         logging.error(f"خطأ في تحويل الكلام إلى نص: {e}")
         return jsonify({
@@ -152,25 +198,14 @@ def process_voice_command():
                 'error': 'نوع الملف غير مدعوم'
             }), 400
         
-        # حفظ الملف مؤقتاً
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        temp_filename = f"command_{timestamp}_{filename}"
-        temp_path = os.path.join(UPLOAD_FOLDER, temp_filename)
-        
-        file.save(temp_path)
-        
-        try:
-            # معالجة الأمر الصوتي
-            result = voice_assistant.process_voice_command(temp_path)
-            
-            return jsonify(result)
-            
-        finally:
-            # حذف الملف المؤقت
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        # معالجة الأمر الصوتي من تدفق الملف المرفوع مباشرة
+        result = voice_assistant.process_voice_command(file.stream)
+        
+        return jsonify(result)
         
+    except RequestEntityTooLarge:
+        # ملف أكبر من MAX_CONTENT_LENGTH: يُعاد 413 بدلاً من خطأ خادم
+        raise
     except Exception as e:
         logging.error(f"خطأ في معالجة الأمر الصوتي: {e}")
         return jsonify({
@@ -214,7 +249,7 @@ def generate_market_summary_audio():
         
         return jsonify({
             'success': True,
-            'audio_url': f'/api/voice/audio/{os.path.basename(audio_path)}',
+            'audio_url': _audio_url(audio_path),
             'summary_type': 'market',
             'voice_type': voice_type
         })
@@ -233,39 +268,31 @@ def generate_daily_plan_audio():
     try:
         voice_type = request.args.get('voice_type', 'female_voice')
         
-        # الحصول على الخطة اليومية
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            daily_plan = loop.run_until_complete(ai_assistant.generate_daily_plan())
-            
-            plan_data = {
-                'market_outlook': daily_plan.market_outlook,
-                'opportunities': daily_plan.opportunities,
-                'risks': daily_plan.risks,
-                'recommendations': daily_plan.recommendations
-            }
-            
-            # توليد الصوت
-            audio_path = voice_assistant.generate_daily_plan_audio(plan_data, voice_type)
-            
-            if not audio_path:
-                return jsonify({
-                    'success': False,
-                    'error': 'فشل في توليد صوت الخطة'
-                }), 500
-            
+        # الحصول على الخطة اليومية عبر حلقة الأحداث المشتركة
+        daily_plan = run_async(ai_assistant.generate_daily_plan(), timeout=30)
+        
+        plan_data = {
+            'market_outlook': daily_plan.market_outlook,
+            'opportunities': daily_plan.opportunities,
+            'risks': daily_plan.risks,
+            'recommendations': daily_plan.recommendations
+        }
+        
+        # توليد الصوت
+        audio_path = voice_assistant.generate_daily_plan_audio(plan_data, voice_type)
+        
+        if not audio_path:
             return jsonify({
-                'success': True,
-                'audio_url': f'/api/voice/audio/{os.path.basename(audio_path)}',
-                'plan_date': daily_plan.date,
-                'voice_type': voice_type
-            })
-            
-        finally:
-            loop.close()
+                'success': False,
+                'error': 'فشل في توليد صوت الخطة'
+            }), 500
+        
+        return jsonify({
+            'success': True,
+            'audio_url': _audio_url(audio_path),
+            'plan_date': daily_plan.date,
+            'voice_type': voice_type
+        })
         
     except Exception as e:
         logging.error(f"خطأ في توليد صوت الخطة اليومية: {e}")
@@ -279,7 +306,9 @@ def generate_daily_plan_audio():
 def generate_alert_audio():
     """توليد تنبيه صوتي"""
     try:
-        data = request.get_json()
+        data, error = read_json(required=False)
+        if error:
+            return error
         message = data.get('message', '')
         alert_type = data.get('alert_type', 'info')
         voice_type = data.get('voice_type', 'female_voice')
@@ -301,7 +330,7 @@ def generate_alert_audio():
         
         return jsonify({
             'success': True,
-            'audio_url': f'/api/voice/audio/{os.path.basename(audio_path)}',
+            'audio_url': _audio_url(audio_path),
             'alert_type': alert_type,
             'voice_type': voice_type
         })
@@ -318,7 +347,15 @@ def serve_audio(filename):
     """تقديم ملفات الصوت"""
     try:
         # التحقق من الأمان
-        filename = secure_filename(filename)
+        filename = _secure_filename(filename)
+        
+        # الملفات المولدة فقط: الرابط يحمل توقيعاً صادراً عند التوليد
+        if not hmac.compare_digest(request.args.get('s', ''), _audio_signature(filename)):
+            return jsonify({
+                'success': False,
+                'error': 'غير مسموح بالوصول لهذا الملف'
+            }), 403
+        
         file_path = os.path.join(UPLOAD_FOLDER, filename)
         
         if not os.path.exists(file_path):
@@ -327,14 +364,10 @@ def serve_audio(filename):
                 'error': 'الملف غير موجود'
             }), 404
         
-        # التحقق من أن الملف من الملفات المولدة
-        if not filename.startswith('speech_'):
-            return jsonify({
-                'success': False,
-                'error': 'غير مسموح بالوصول لهذا الملف'
-            }), 403
-        
-        return send_file(file_path, as_attachment=True)
+        # ETag وطلبات شرطية: الطلبات المكررة لنفس الملف تحصل على 304 بدون محتوى.
+        # بدون as_attachment يشغّل المتصفح الملف مباشرة مع دعم طلبات Range، ويمرر
+        # Werkzeug الملف المفتوح إلى wsgi.file_wrapper (sendfile) عند توفره في الخادم
+        return send_file(file_path, conditional=True, etag=True, max_age=3600)
         
     except Exception as e:
         logging.error(f"خطأ في تقديم ملف الصوت: {e}")
@@ -402,13 +435,15 @@ def cleanup_temp_files():
             'error': f'خطأ في الخادم: {str(e)}'
         }), 500
 
-@voice_bp.route('/health', methods=['GET'])
-def health_check():
-    """فحص صحة المساعد الصوتي"""
-    return jsonify({
+_TIMESTAMP_PLACEHOLDER = '\x00timestamp\x00'
+
+@lru_cache(maxsize=1)
+def _health_template():
+    """رد فحص الصحة مرمّزاً مرة واحدة ومقسوماً حول قيمة الوقت (الجزء الوحيد المتغير)"""
+    body = current_app.json.dumps({
         'success': True,
         'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': _TIMESTAMP_PLACEHOLDER,
         'features': [
             'text_to_speech',
             'speech_to_text',
@@ -417,6 +452,16 @@ def health_check():
             'daily_plan_audio',
             'alerts'
         ],
-        'supported_formats': list(ALLOWED_EXTENSIONS)
+        'supported_formats': sorted(ALLOWED_EXTENSIONS)
     })
+    prefix, _, suffix = body.partition(current_app.json.dumps(_TIMESTAMP_PLACEHOLDER)[1:-1])
+    return prefix, suffix
+
+@voice_bp.route('/health', methods=['GET'])
+def health_check():
+    """فحص صحة المساعد الصوتي"""
+    prefix, suffix = _health_template()
+    return current_app.response_class(
+        f'{prefix}{datetime.now().isoformat()}{suffix}', mimetype='application/json'
+    )
 
@@ -0,0 +1,83 @@
+"""
+اختبارات محرك التداول الورقي
+
+التشغيل من مجلد neon_trader_v7:
+    python -m unittest discover -s tests
+"""
+
+import unittest
+
+from src.models.trading_engine import PaperTradingEngine, OrderSide, OrderType
+
+
+class PerformanceSnapshotTest(unittest.TestCase):
+    """إحصائيات الأداء تُحسب من صفقات الإغلاق وربحها المحقق"""
+
+    def setUp(self):
+        self.engine = PaperTradingEngine(10000)
+        self.engine.start()
+
+    def _market(self, side, quantity, price):
+        self.engine.update_market_price('BTCUSDT', price)
+        success, message, _ = self.engine.place_order('BTCUSDT', side, OrderType.MARKET, quantity)
+        self.assertTrue(success, message)
+
+    def test_opening_fill_is_not_counted(self):
+        self._market(OrderSide.BUY, 1, 100)
+
+        snapshot = self.engine.get_performance_snapshot()
+        self.assertEqual(snapshot['total_trades'], 0)
+        self.assertEqual(snapshot['winning_trades'], 0)
+        self.assertEqual(snapshot['losing_trades'], 0)
+        self.assertEqual(snapshot['win_rate'], 0)
+
+    def test_losing_round_trip(self):
+        self._market(OrderSide.BUY, 1, 100)
+        self._market(OrderSide.SELL, 1, 90)
+
+        snapshot = self.engine.get_performance_snapshot()
+        self.assertEqual(snapshot['total_trades'], 1)
+        self.assertEqual(snapshot['winning_trades'], 0)
+        self.assertEqual(snapshot['losing_trades'], 1)
+        self.assertEqual(snapshot['win_rate'], 0)
+
+    def test_winning_and_losing_round_trips(self):
+        self._market(OrderSide.BUY, 1, 100)
+        self._market(OrderSide.SELL, 1, 110)
+        self._market(OrderSide.SELL, 1, 110)
+        self._market(OrderSide.BUY, 1, 120)
+
+        snapshot = self.engine.get_performance_snapshot()
+        self.assertEqual(snapshot['total_trades'], 2)
+        self.assertEqual(snapshot['winning_trades'], 1)
+        self.assertEqual(snapshot['losing_trades'], 1)
+        self.assertEqual(snapshot['win_rate'], 50.0)
+
+
+
+class PendingOrdersTest(unittest.TestCase):
+    """الأوامر المعلقة التي تتحقق في التحديث نفسه تُنفَّذ بترتيب وضعها"""
+
+    def setUp(self):
+        self.engine = PaperTradingEngine(10000)
+        self.engine.start()
+        self.engine.update_market_price('BTCUSDT', 100)
+
+    def test_same_tick_triggers_fill_in_placement_order(self):
+        # وقف شراء أولاً ثم حد بيع بمستوى أقرب: ترتيب المستويات كان سينفذ البيع أولاً
+        success, message, _ = self.engine.place_order(
+            'BTCUSDT', OrderSide.BUY, OrderType.STOP, 1, stop_price=104)
+        self.assertTrue(success, message)
+        success, message, _ = self.engine.place_order(
+            'BTCUSDT', OrderSide.SELL, OrderType.LIMIT, 2, price=103)
+        self.assertTrue(success, message)
+
+        self.engine.update_market_price('BTCUSDT', 106)
+
+        self.assertEqual(len(self.engine.get_trades(limit=10)), 2)
+        # الشراء يفتح مركزاً طويلاً والبيع يغلقه بالكامل؛ بالترتيب المعاكس يبقى مركز قصير بكمية 1
+        self.assertEqual(self.engine.get_positions(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,9 +3,21 @@
 import os
 import webbrowser
 import http.server
-import socketserver
+import shutil
 from pathlib import Path
 
+
+class StaticHandler(http.server.SimpleHTTPRequestHandler):
+    """معالج الملفات الثابتة: إرسال الملف عبر sendfile من النواة مباشرة إن أمكن"""
+
+    def copyfile(self, source, outfile):
+        try:
+            # socket.sendfile يستخدم os.sendfile حيث يتوفر، ويعود لحلقة إرسال على Windows
+            self.connection.sendfile(source)
+        except (AttributeError, OSError, ValueError):
+            shutil.copyfileobj(source, outfile, 1 << 20)
+
+
 print("🪟 Neon Trader V7 - Windows Server")
 print("=" * 40)
 
@@ -48,8 +60,8 @@ PORT = 8080
 print(f"🚀 بدء تشغيل الخادم على المنفذ {PORT}...")
 
 try:
-    Handler = http.server.SimpleHTTPRequestHandler
-    with socketserver.TCPServer(("", PORT), Handler) as httpd:
+    # خادم متعدد الخيوط: كل اتصال في خيط مستقل فلا يحجب ملف كبير بقية الطلبات
+    with http.server.ThreadingHTTPServer(("", PORT), StaticHandler) as httpd:
         url = f"http://localhost:{PORT}"
         print(f"✅ الخادم يعمل على: {url}")
         print("🌐 سيتم فتح المتصفح تلقائياً...")